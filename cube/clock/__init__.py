@@ -0,0 +1,11 @@
+from .clock import BaseClock, Clock
+from .scheduler import DeadlineScheduler
+from .virtual_clock import VirtualClock, VirtualScheduler
+
+__all__ = [
+    "BaseClock",
+    "Clock",
+    "DeadlineScheduler",
+    "VirtualClock",
+    "VirtualScheduler",
+]
@@ -1,7 +1,65 @@
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
 from datetime import datetime
+from typing import Any, Callable, Iterator
+
+from cube.clock.scheduler import DeadlineScheduler
+
+
+class BaseClock(ABC):
+    r"""Interface shared by the sandbox clocks. The platform, the agent
+    environments and the trace recorder only read the sandbox time through
+    :meth:`now` and only wait for it through the scheduler returned by
+    :meth:`create_scheduler`, so any clock can be plugged in. The one
+    exception is movement in real time: a clock that jumps over idle time,
+    such as :obj:`VirtualClock`, cannot be combined with Unity.
+    """
+
+    @abstractmethod
+    def time_transfer(self, now_time: datetime,
+                      start_time: datetime) -> datetime:
+        raise NotImplementedError
+
+    @abstractmethod
+    def create_scheduler(self, start_time: datetime) -> Any:
+        r"""Return an object whose :obj:`sleep_until(sandbox_time)`
+        coroutine suspends the caller until the sandbox time is reached.
+        """
+        raise NotImplementedError
 
+    def now(self, start_time: datetime) -> datetime:
+        r"""Return the current sandbox time."""
+        return self.time_transfer(datetime.now(), start_time)
 
-class Clock:
+    @contextmanager
+    def hold(self) -> Iterator[None]:
+        r"""Mark the current task as busy so that the sandbox time does not
+        move on without it. Only meaningful for discrete-event clocks.
+        """
+        yield
+
+    @contextmanager
+    def release(self) -> Iterator[None]:
+        r"""Temporarily give up the holds of the current task, e.g. while
+        waiting for another task to answer.
+        """
+        yield
+
+    def hold_pending(self) -> Callable[[], None]:
+        r"""Hold the clock on behalf of work that no task runs yet, e.g. a
+        request waiting in a queue, until the returned function is called.
+        Calling it more than once has no effect.
+        """
+        return _no_op
+
+
+def _no_op():
+    pass
+
+
+class Clock(BaseClock):
 
     def __init__(self, k: int):
         self.real_start_time = datetime.now()
@@ -13,3 +71,14 @@ class Clock:
         adjusted_diff = self.k * time_diff
         adjusted_time = start_time + adjusted_diff
         return adjusted_time
+
+    def real_time_transfer(self, sandbox_time: datetime,
+                           start_time: datetime) -> datetime:
+        r"""Inverse of :meth:`time_transfer`: map a sandbox time back to
+        the real time at which the sandbox clock reaches it.
+        """
+        sandbox_diff = sandbox_time - start_time
+        return self.real_start_time + sandbox_diff / self.k
+
+    def create_scheduler(self, start_time: datetime) -> DeadlineScheduler:
+        return DeadlineScheduler(self, start_time)
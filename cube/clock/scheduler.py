@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+from datetime import datetime
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from cube.clock.clock import Clock
+
+
+class DeadlineScheduler:
+    r"""Park coroutines until the sandbox clock reaches a given time.
+
+    Every sleeper is converted to a deadline on the event loop's clock using
+    :obj:`Clock.k` and pushed onto a heap. Only one timer is armed on the
+    event loop at any time, for the earliest deadline, so thousands of
+    sleeping agents cost one heap entry each and no periodic wake-ups.
+
+    Args:
+        clock (Clock): The sandbox clock.
+        start_time (datetime): The sandbox time at which the simulation
+            started.
+    """
+
+    def __init__(self, clock: Clock, start_time: datetime):
+        self.clock = clock
+        self.start_time = start_time
+        self._heap: list[tuple[float, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._timer: asyncio.TimerHandle | None = None
+        self._timer_when: float | None = None
+
+    def __len__(self) -> int:
+        return sum(1 for _, _, fut in self._heap if not fut.done())
+
+    def loop_deadline(self, sandbox_time: datetime) -> float:
+        r"""Convert a sandbox time to a deadline on the loop's clock."""
+        loop = asyncio.get_running_loop()
+        real_time = self.clock.real_time_transfer(sandbox_time,
+                                                  self.start_time)
+        return loop.time() + (real_time - datetime.now()).total_seconds()
+
+    async def sleep_until(self, sandbox_time: datetime) -> None:
+        r"""Suspend the caller until the sandbox clock reaches
+        :obj:`sandbox_time`. Returns immediately if it already has.
+        """
+        loop = asyncio.get_running_loop()
+        self._loop = loop
+        deadline = self.loop_deadline(sandbox_time)
+        if deadline <= loop.time():
+            return
+        fut = loop.create_future()
+        heapq.heappush(self._heap, (deadline, next(self._counter), fut))
+        self._arm()
+        try:
+            await fut
+        finally:
+            # 被取消的sleeper留在堆里，到期时再惰性删除
+            if not fut.done():
+                fut.cancel()
+
+    def _arm(self) -> None:
+        if not self._heap:
+            return
+        when = self._heap[0][0]
+        if self._timer is not None and self._timer_when <= when:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = self._loop.call_at(when, self._fire)
+        self._timer_when = when
+
+    def _fire(self) -> None:
+        self._timer = None
+        self._timer_when = None
+        now = self._loop.time()
+        while self._heap and self._heap[0][0] <= now:
+            _, _, fut = heapq.heappop(self._heap)
+            if not fut.done():
+                fut.set_result(None)
+        self._arm()
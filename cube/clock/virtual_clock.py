@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Callable, Iterator
+
+from cube.clock.clock import BaseClock
+
+
+class VirtualClock(BaseClock):
+    r"""Discrete-event sandbox clock.
+
+    The sandbox time does not follow the wall clock. It stands still while
+    any task holds the clock (e.g. an agent waiting for its LLM response or
+    the platform handling a request) and jumps straight to the earliest
+    pending wake-up, such as the end of an activity or an arrival, once
+    every task is idle. Idle periods therefore cost no real time at all.
+    Work that no task runs yet, such as a request still waiting in the
+    channel, holds the clock through :meth:`hold_pending`.
+
+    Only the logical movement mode works with this clock. Unity moves the
+    agents in real time while a ``go_to`` handler holds the clock, so the
+    sandbox time would stand still during every walk. :obj:`Platform`
+    rejects the combination.
+
+    Args:
+        settle_time (float): Real seconds the clock has to stay idle before
+            it jumps, which lets callbacks that are already scheduled on the
+            event loop register their own wake-ups first.
+            (default: :obj:`0.005`)
+    """
+
+    def __init__(self, settle_time: float = 0.005):
+        self.elapsed = timedelta(0)
+        self.settle_time = settle_time
+        self._heap: list[tuple[timedelta, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+        self._holds: dict[asyncio.Task, int] = {}
+        self._busy = 0
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._advance_handle: asyncio.TimerHandle | None = None
+
+    def time_transfer(self, now_time: datetime,
+                      start_time: datetime) -> datetime:
+        # 虚拟时钟不依赖真实时间，now_time只为兼容Clock的接口
+        return start_time + self.elapsed
+
+    def create_scheduler(self, start_time: datetime) -> VirtualScheduler:
+        return VirtualScheduler(self, start_time)
+
+    @property
+    def pending(self) -> int:
+        return sum(1 for _, _, fut in self._heap if not fut.done())
+
+    @contextmanager
+    def hold(self) -> Iterator[None]:
+        task = asyncio.current_task()
+        self._holds[task] = self._holds.get(task, 0) + 1
+        self._busy += 1
+        try:
+            yield
+        finally:
+            self._busy -= 1
+            depth = self._holds[task] - 1
+            if depth:
+                self._holds[task] = depth
+            else:
+                del self._holds[task]
+            self._schedule_advance()
+
+    @contextmanager
+    def release(self) -> Iterator[None]:
+        task = asyncio.current_task()
+        depth = self._holds.pop(task, 0)
+        self._busy -= depth
+        self._schedule_advance()
+        try:
+            yield
+        finally:
+            self._busy += depth
+            if depth:
+                self._holds[task] = depth
+
+    def hold_pending(self) -> Callable[[], None]:
+        self._busy += 1
+        released = False
+
+        def release_pending():
+            nonlocal released
+            if released:
+                return
+            released = True
+            self._busy -= 1
+            self._schedule_advance()
+
+        return release_pending
+
+    async def sleep_for(self, elapsed: timedelta) -> None:
+        r"""Suspend the caller until :obj:`elapsed` sandbox time has passed
+        since the start of the simulation. The caller's holds are released
+        while it sleeps.
+        """
+        if elapsed <= self.elapsed:
+            return
+        loop = asyncio.get_running_loop()
+        self._loop = loop
+        fut = loop.create_future()
+        heapq.heappush(self._heap, (elapsed, next(self._counter), fut))
+        with self.release():
+            try:
+                await fut
+            finally:
+                if not fut.done():
+                    fut.cancel()
+
+    def _schedule_advance(self) -> None:
+        if (self._busy > 0 or not self._heap or self._loop is None
+                or self._advance_handle is not None):
+            return
+        self._advance_handle = self._loop.call_later(self.settle_time,
+                                                     self._advance)
+
+    def _advance(self) -> None:
+        self._advance_handle = None
+        if self._busy > 0:
+            return
+        while self._heap and self._heap[0][2].done():
+            heapq.heappop(self._heap)
+        if not self._heap:
+            return
+        self.elapsed = max(self.elapsed, self._heap[0][0])
+        while self._heap and self._heap[0][0] <= self.elapsed:
+            _, _, fut = heapq.heappop(self._heap)
+            if not fut.done():
+                fut.set_result(None)
+        self._schedule_advance()
+
+
+class VirtualScheduler:
+    r"""Scheduler of a :obj:`VirtualClock` bound to the sandbox start time,
+    with the same interface as :obj:`DeadlineScheduler`.
+    """
+
+    def __init__(self, clock: VirtualClock, start_time: datetime):
+        self.clock = clock
+        self.start_time = start_time
+
+    def __len__(self) -> int:
+        return self.clock.pending
+
+    async def sleep_until(self, sandbox_time: datetime) -> None:
+        await self.clock.sleep_for(sandbox_time - self.start_time)
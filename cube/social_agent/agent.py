@@ -19,7 +19,8 @@ from cube.social_agent.community_agent_action import CommunityAction
 from cube.social_agent.agent_environment import CommunityEnvironment
 from cube.social_platform import Channel
 from cube.social_platform.config import UserInfo
-from cube.clock.clock import Clock
+from cube.social_platform.lane_queue import INTERACTIVE
+from cube.clock.clock import BaseClock
 
 if TYPE_CHECKING:
     from cube.social_agent import AgentGraph
@@ -40,7 +41,7 @@ class SocialAgent:
         agent_id: int,
         user_info: UserInfo,
         channel: Channel,
-        clock: Clock,
+        clock: BaseClock,
         start_time: datetime,
         model_path:
         str = "/mnt/hwfile/trustai/models/Meta-Llama-3-8B-Instruct",  # noqa
@@ -53,8 +54,11 @@ class SocialAgent:
         self.agent_id = agent_id
         self.user_info = user_info
         self.channel = channel
+        # 人工操作的agent走interactive通道，不被批量请求阻塞
+        lane = INTERACTIVE if user_info.is_controllable else None
         self.env = CommunityEnvironment(
-            clock, start_time, None, CommunityAction(agent_id, channel))
+            clock, start_time, None,
+            CommunityAction(agent_id, channel, lane))
         # print(self.user_info.to_community_system_message())
         self.system_message = BaseMessage.make_assistant_message(
             role_name="User",
@@ -134,7 +138,9 @@ class SocialAgent:
         # agent_log.info(f"Agent {self.agent_id} is running with prompt: {openai_messages}")
 
         if self.has_function_call:
-            response = await self.model_backend.arun(openai_messages)
+            # 等待LLM响应期间虚拟时钟不能前进
+            with self.env.clock.hold():
+                response = await self.model_backend.arun(openai_messages)
             # agent_log.info(f"Agent {self.agent_id} response: {response}")
             if response.choices[0].message.tool_calls:
                 for tool_call in response.choices[0].message.tool_calls:
@@ -142,7 +148,10 @@ class SocialAgent:
                     args = json.loads(tool_call.function.arguments)
                     print(f"Agent {self.agent_id} is performing "
                           f"action: {action_name} with args: {args}")
-                    excu_result = await getattr(self.env.action, action_name)(**args)
+                    # 等待platform执行动作时让出虚拟时钟
+                    with self.env.clock.release():
+                        excu_result = await getattr(
+                            self.env.action, action_name)(**args)
                     # 更新agent所在的房间
                     if action_name == "go_to" and excu_result.get('success'):
                         self.env.room = excu_result.get('arrived')
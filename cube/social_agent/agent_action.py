@@ -8,9 +8,12 @@ from cube.social_platform.typing import ActionType
 
 class SocialAction:
 
-    def __init__(self, agent_id: int, channel: Channel):
+    def __init__(self, agent_id: int, channel: Channel,
+                 lane: str | None = None):
         self.agent_id = agent_id
         self.channel = channel
+        # Channel的优先级通道，None时由Channel按动作类型决定
+        self.lane = lane
 
     def get_openai_function_list(self) -> list[OpenAIFunction]:
         return [
@@ -24,10 +27,19 @@ class SocialAction:
 
     async def perform_action(self, message: Any, type: str):
         message_id = await self.channel.write_to_receive_queue(
-            (self.agent_id, message, type))
+            (self.agent_id, message, type), self.lane)
         response = await self.channel.read_from_send_queue(message_id)
         return response[2]
 
+    async def perform_batch(self, actions: list[tuple[Any, str]]):
+        r"""Perform many ``(message, action_type)`` pairs in one request
+        and return the list of their results, in order.
+        """
+        message_id = await self.channel.write_batch_to_receive_queue(
+            self.agent_id, actions, self.lane)
+        response = await self.channel.read_from_send_queue(message_id)
+        return response[2]["results"]
+
     async def sign_up(self, user_name: str, name: str, bio: str):
         r"""Signs up a new user with the provided username, name, and bio.
 
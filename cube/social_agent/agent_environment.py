@@ -5,7 +5,7 @@ from abc import ABC, abstractmethod
 from string import Template
 
 from cube.social_agent.community_agent_action import CommunityAction
-from cube.clock.clock import Clock
+from cube.clock.clock import BaseClock
 from datetime import datetime
 
 
@@ -81,7 +81,7 @@ class CommunityEnvironment(Environment):
         "your profile, your current location, time, and daily schedule.")
 
     def __init__(
-            self, clock: Clock, start_time: datetime,
+            self, clock: BaseClock, start_time: datetime,
             plan: str, action: CommunityAction):
         self.action = action
         self.room = None
@@ -98,8 +98,7 @@ class CommunityEnvironment(Environment):
         return room_env
 
     async def get_time_env(self) -> str:
-        current_time = self.clock.time_transfer(
-            datetime.now(), self.start_time)
+        current_time = self.clock.now(self.start_time)
         return self.current_time_template.substitute(
             current_time=current_time)
 
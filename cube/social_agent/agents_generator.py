@@ -14,7 +14,8 @@ from camel.types.enums import ModelType
 from cube.social_agent import AgentGraph, SocialAgent
 from cube.social_platform import Channel
 from cube.social_platform.config import UserInfo
-from cube.clock.clock import Clock
+from cube.social_platform.typing import ActionType
+from cube.clock.clock import BaseClock
 
 
 async def generate_agents(
@@ -115,11 +116,11 @@ async def generate_agents(
         if agent_info["following_agentid_list"][agent_id] != "0":
             following_id_list = ast.literal_eval(
                 agent_info["following_agentid_list"][agent_id])
-            follow_tasks = [
-                agent.env.action.follow(following_id + 1)
+            # 所有关注关系在一个批量请求中发送
+            await agent.env.action.perform_batch([
+                (following_id + 1, ActionType.FOLLOW.value)
                 for following_id in following_id_list
-            ]
-            await asyncio.gather(*follow_tasks)
+            ])
             for following_id in following_id_list:
                 agent_graph.add_edge(agent_id, following_id)
 
@@ -127,10 +128,9 @@ async def generate_agents(
             previous_posts = ast.literal_eval(
                 agent_info['previous_tweets'][agent_id])
 
-            post_tasks = [
-                agent.env.action.create_post(post) for post in previous_posts
-            ]
-            await asyncio.gather(*post_tasks)
+            await agent.env.action.perform_batch([
+                (post, ActionType.CREATE_POST.value) for post in previous_posts
+            ])
 
     tasks = [setup_agent(i) for i in range(len(agent_info))]
     await asyncio.gather(*tasks)
@@ -258,7 +258,7 @@ async def generate_reddit_agents(
 async def generate_community_agents(
     agent_info_path: str,
     channel: Channel,
-    clock: Clock,
+    clock: BaseClock,
     start_time: datetime
 ) -> AgentGraph:
     agent_graph = AgentGraph()
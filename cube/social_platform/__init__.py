@@ -1,7 +1,13 @@
 from .channel import Channel
+from .location import LocationQuery, Stay
 from .platform import Platform
+from .remote_channel import ChannelServer, RemoteChannel
 
 __all__ = [
     "Channel",
+    "ChannelServer",
+    "LocationQuery",
     "Platform",
+    "RemoteChannel",
+    "Stay",
 ]
@@ -1,56 +1,376 @@
+from __future__ import annotations
+
 import asyncio
+import json
+import time
 import uuid
+from typing import Any, Callable
+
+from cube.clock.clock import BaseClock
+from cube.social_platform.lane_queue import BULK, CONTROL, LaneQueue
+from cube.social_platform.metrics import LatencyStats
+from cube.social_platform.typing import CommunityActionType
 
+# 未被读取的响应和已取消的请求默认保留的秒数
+DEFAULT_ORPHAN_TTL = 300.0
 
-class AsyncSafeDict:
 
-    def __init__(self):
-        self.dict = {}
-        self.lock = asyncio.Lock()
+def _action_name(action_info: Any) -> str:
+    try:
+        action = action_info[2]
+    except (TypeError, IndexError):
+        return "unknown"
+    return str(getattr(action, "value", action))
 
-    async def put(self, key, value):
-        async with self.lock:
-            self.dict[key] = value
 
-    async def get(self, key, default=None):
-        async with self.lock:
-            return self.dict.get(key, default)
+class Channel:
+    r"""Request/response channel between the agents and the platform.
 
-    async def pop(self, key, default=None):
-        async with self.lock:
-            return self.dict.pop(key, default)
+    Besides moving messages it keeps runtime metrics: the depth of
+    :attr:`receive_queue`, the number of requests waiting for a response,
+    and per action type the latency from enqueue to dequeue by the
+    platform (``"dequeue"``) and from enqueue to response
+    (``"round_trip"``). :meth:`metrics` returns a snapshot and
+    :meth:`dump_metrics` writes it as JSON.
 
-    async def keys(self):
-        async with self.lock:
-            return list(self.dict.keys())
+    Requests wait in a :obj:`LaneQueue`, so that EXIT (``"control"``) and
+    interactive requests overtake queued bulk traffic. Without an explicit
+    lane, EXIT goes to ``"control"``, batches to ``"bulk"`` and the rest to
+    the default lane.
 
+    A request may carry a deadline. When its reader times out or is
+    cancelled, the request is cancelled: it is skipped if still queued,
+    the listeners added with :meth:`add_cancel_listener` (the platform) are
+    told to stop its handler, and a late response is dropped. Responses
+    that nobody reads are evicted after :obj:`orphan_ttl` seconds.
 
-class Channel:
+    With a clock attached through :meth:`attach_clock`, every request holds
+    it from the moment it is written until :meth:`mark_started` (the
+    platform's handler task runs) or until it is answered or cancelled, so
+    a discrete-event clock cannot jump past requests still waiting in the
+    queue.
+
+    Args:
+        metrics_path (str, optional): File written by :meth:`dump_metrics`
+            when it is called without a path. (default: :obj:`None`)
+        lanes (dict[str, int | None], optional): Lane weights of the
+            receive queue, see :obj:`LaneQueue`. (default: :obj:`None`)
+        request_timeout (float, optional): Default deadline of a request in
+            seconds, :obj:`None` to wait forever. (default: :obj:`None`)
+        orphan_ttl (float): Seconds an unread response or a cancelled
+            request is remembered. (default: :obj:`300.0`)
+    """
+
+    def __init__(self, metrics_path: str | None = None,
+                 lanes: dict[str, int | None] | None = None,
+                 request_timeout: float | None = None,
+                 orphan_ttl: float = DEFAULT_ORPHAN_TTL):
+        self.receive_queue = LaneQueue(lanes)  # 用于存储接收的消息
+        # 每个message_id对应一个future，send_to直接唤醒等待响应的一方
+        self.pending: dict[str, asyncio.Future] = {}
+        self.request_timeout = request_timeout
+        self.orphan_ttl = orphan_ttl
+        # future的创建时间、请求的截止时间和已取消的请求，单位为loop.time()
+        self._created_at: dict[Any, float] = {}
+        self._deadlines: dict[Any, float] = {}
+        self._cancelled: dict[Any, float] = {}
+        self._cancel_listeners: list[Callable[[Any], None]] = []
+        # 尚未开始处理的请求对沙盒时钟的占用
+        self.clock: BaseClock | None = None
+        self._clock_holds: dict[Any, Callable[[], None]] = {}
+        self._last_sweep = 0.0
+        self.metrics_path = metrics_path
+        self.latency_stats = LatencyStats()
+        # 尚未响应的请求的入队时间和动作类型
+        self._enqueued: dict[Any, tuple[float, str]] = {}
+        self.max_queue_depth = 0
+        self.num_requests = 0
+        self.num_responses = 0
+        self.num_cancelled = 0
+        self.num_evicted = 0
+
+    def _get_future(self, message_id) -> asyncio.Future:
+        future = self.pending.get(message_id)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self.pending[message_id] = future
+            self._created_at[message_id] = loop.time()
+        return future
+
+    def _forget(self, message_id):
+        self.pending.pop(message_id, None)
+        self._created_at.pop(message_id, None)
+        self._deadlines.pop(message_id, None)
+
+    def _track_request(self, message_id, action_info,
+                       timeout: float | None = None):
+        self.num_requests += 1
+        self._enqueued[message_id] = (time.perf_counter(),
+                                      _action_name(action_info))
+        timeout = self.request_timeout if timeout is None else timeout
+        if timeout is not None:
+            self._deadlines[message_id] = (asyncio.get_running_loop().time() +
+                                           timeout)
+        self._maybe_evict_orphans()
+
+    def register_request(self, message_id, action_info,
+                         timeout: float | None = None):
+        r"""Start tracking a request written elsewhere, e.g. sent over a
+        :obj:`RemoteChannel`, so that its response can be read with
+        :meth:`read_from_send_queue`.
+        """
+        # 先登记future，避免响应在读取之前到达时丢失
+        self._get_future(message_id)
+        self._track_request(message_id, action_info, timeout)
+
+    def lane_for(self, action_info: Any) -> str:
+        r"""Return the lane of a request sent without an explicit one."""
+        action_name = _action_name(action_info)
+        if action_name == CommunityActionType.EXIT.value:
+            lane = CONTROL
+        elif action_name == CommunityActionType.BATCH.value:
+            lane = BULK
+        else:
+            return self.receive_queue.default_lane
+        if lane not in self.receive_queue.lanes:
+            return self.receive_queue.default_lane
+        return lane
+
+    def attach_clock(self, clock: BaseClock):
+        r"""Let every request hold :obj:`clock` until it starts."""
+        self.clock = clock
+
+    def mark_started(self, message_id):
+        r"""Give back the clock hold of a request whose handler runs now."""
+        self._release_clock_hold(message_id)
+
+    def _release_clock_hold(self, message_id):
+        release = self._clock_holds.pop(message_id, None)
+        if release is not None:
+            release()
+
+    def add_cancel_listener(self, listener: Callable[[Any], None]):
+        r"""Call :obj:`listener` with the message id of every cancelled
+        request.
+        """
+        self._cancel_listeners.append(listener)
 
-    def __init__(self):
-        self.receive_queue = asyncio.Queue()  # 用于存储接收的消息
-        self.send_dict = AsyncSafeDict()  # 使用异步安全字典存储要发送的消息
+    def is_cancelled(self, message_id) -> bool:
+        return message_id in self._cancelled
+
+    def cancel(self, message_id) -> bool:
+        r"""Cancel a request that has not been answered yet.
+
+        Returns:
+            bool: :obj:`False` if the request was already answered.
+        """
+        future = self.pending.get(message_id)
+        # wait_for超时时已经取消了future，这里只排除已有响应的请求
+        if (future is not None and future.done()
+                and not future.cancelled()):
+            return False
+        self._forget(message_id)
+        self._release_clock_hold(message_id)
+        if future is not None:
+            future.cancel()
+        if self._enqueued.pop(message_id, None) is None:
+            return False
+        self.num_cancelled += 1
+        self._cancelled[message_id] = asyncio.get_running_loop().time()
+        for listener in self._cancel_listeners:
+            listener(message_id)
+        return True
 
     async def receive_from(self):
-        message = await self.receive_queue.get()
+        while True:
+            message = await self.receive_queue.get()
+            message_id, action_info = message
+            # 排队期间已被取消的请求直接丢弃
+            if self._cancelled.pop(message_id, None) is None:
+                break
+        self._accept(message_id, action_info)
         return message
 
+    def receive_queued(self) -> list[tuple[Any, Any]]:
+        r"""Take every request still waiting in the receive queue, in the
+        order :meth:`receive_from` would return them. EXIT overtakes queued
+        requests in its control lane, so the platform serves these before
+        it shuts down. Queued EXIT requests are acknowledged and left out.
+        """
+        messages = []
+        while not self.receive_queue.empty():
+            message_id, action_info = self.receive_queue.get_nowait()
+            if self._cancelled.pop(message_id, None) is not None:
+                continue
+            self._accept(message_id, action_info)
+            if _action_name(action_info) != CommunityActionType.EXIT.value:
+                messages.append((message_id, action_info))
+        return messages
+
+    def _accept(self, message_id, action_info):
+        tracked = self._enqueued.get(message_id)
+        if tracked is not None:
+            enqueued_at, action_name = tracked
+            self.latency_stats.observe(action_name, "dequeue",
+                                       time.perf_counter() - enqueued_at)
+            # EXIT不会有响应，直接确认
+            if action_name == CommunityActionType.EXIT.value:
+                del self._enqueued[message_id]
+                self._release_clock_hold(message_id)
+                future = self.pending.get(message_id)
+                if future is not None and not future.done():
+                    future.set_result(
+                        (message_id, action_info[0], {"success": True}))
+
+    async def reject_queued_requests(self, error: str) -> int:
+        r"""Answer every request still waiting in the receive queue with
+        ``{"success": False, "error": error}``, e.g. when the platform
+        cannot serve them anymore.
+
+        Returns:
+            int: The number of rejected requests.
+        """
+        rejected = 0
+        while not self.receive_queue.empty():
+            message_id, action_info = self.receive_queue.get_nowait()
+            if self._cancelled.pop(message_id, None) is not None:
+                continue
+            if _action_name(action_info) == CommunityActionType.EXIT.value:
+                self._enqueued.pop(message_id, None)
+                self._release_clock_hold(message_id)
+                continue
+            await self.send_to((message_id, action_info[0], {
+                "success": False,
+                "error": error
+            }))
+            rejected += 1
+        return rejected
+
     async def send_to(self, message):
         # message_id 是消息的第一个元素
         message_id = message[0]
-        await self.send_dict.put(message_id, message)
+        self._release_clock_hold(message_id)
+        # 调用方已经放弃的请求，响应直接丢弃
+        if self._cancelled.pop(message_id, None) is not None:
+            return
+        tracked = self._enqueued.pop(message_id, None)
+        if tracked is not None:
+            enqueued_at, action_name = tracked
+            self.num_responses += 1
+            self.latency_stats.observe(action_name, "round_trip",
+                                       time.perf_counter() - enqueued_at)
+        future = self._get_future(message_id)
+        if not future.done():
+            future.set_result(message)
 
-    async def write_to_receive_queue(self, action_info):
+    async def write_to_receive_queue(self, action_info,
+                                     lane: str | None = None,
+                                     timeout: float | None = None):
         message_id = str(uuid.uuid4())
-        await self.receive_queue.put((message_id, action_info))
+        self.register_request(message_id, action_info, timeout)
+        if self.clock is not None:
+            self._clock_holds[message_id] = self.clock.hold_pending()
+        if lane is None:
+            lane = self.lane_for(action_info)
+        await self.receive_queue.put((message_id, action_info), lane)
+        self.max_queue_depth = max(self.max_queue_depth,
+                                   self.receive_queue.qsize())
         return message_id
 
-    async def read_from_send_queue(self, message_id):
-        while True:
-            if message_id in await self.send_dict.keys():
-                # 尝试获取消息
-                message = await self.send_dict.pop(message_id, None)
-                if message:
-                    return message  # 返回找到的消息
+    async def write_batch_to_receive_queue(
+            self, agent_id: Any, actions: list[tuple[Any, str]],
+            lane: str | None = None, timeout: float | None = None) -> str:
+        r"""Send many ``(message, action_type)`` pairs of one agent as a
+        single request. The response carries all their results together
+        under ``"results"``.
+        """
+        return await self.write_to_receive_queue(
+            (agent_id, list(actions), CommunityActionType.BATCH.value), lane,
+            timeout)
+
+    async def read_from_send_queue(self, message_id,
+                                   timeout: float | None = None):
+        r"""Wait for the response of :obj:`message_id`.
+
+        Args:
+            message_id: Id returned by :meth:`write_to_receive_queue`.
+            timeout (float, optional): Seconds to wait. Defaults to the time
+                left until the deadline of the request, if it has one.
+                (default: :obj:`None`)
+
+        Raises:
+            asyncio.TimeoutError: If no response arrived in time. The
+                request is cancelled.
+        """
+        future = self._get_future(message_id)
+        if timeout is None and message_id in self._deadlines:
+            timeout = max(
+                self._deadlines[message_id] -
+                asyncio.get_running_loop().time(), 0)
+        try:
+            if timeout is None:
+                return await future
+            return await asyncio.wait_for(future, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            self.cancel(message_id)
+            raise
+        finally:
+            if self.pending.get(message_id) is future:
+                self._forget(message_id)
+
+    def _maybe_evict_orphans(self):
+        now = asyncio.get_running_loop().time()
+        if now - self._last_sweep >= self.orphan_ttl / 2:
+            self._last_sweep = now
+            self.evict_orphans()
+
+    def evict_orphans(self) -> int:
+        r"""Drop responses nobody read and cancelled requests older than
+        :obj:`orphan_ttl`.
+
+        Returns:
+            int: The number of evicted entries.
+        """
+        expire_before = asyncio.get_running_loop().time() - self.orphan_ttl
+        evicted = [
+            message_id for message_id, future in self.pending.items()
+            if future.done()
+            and self._created_at.get(message_id, 0.0) < expire_before
+        ]
+        for message_id in evicted:
+            self._forget(message_id)
+        cancelled = [
+            message_id
+            for message_id, cancelled_at in self._cancelled.items()
+            if cancelled_at < expire_before
+        ]
+        for message_id in cancelled:
+            del self._cancelled[message_id]
+        self.num_evicted += len(evicted) + len(cancelled)
+        return len(evicted) + len(cancelled)
+
+    def metrics(self) -> dict[str, Any]:
+        r"""Return a snapshot of the channel metrics."""
+        return {
+            "queue_depth": self.receive_queue.qsize(),
+            "lane_depths": self.receive_queue.lane_sizes(),
+            "max_queue_depth": self.max_queue_depth,
+            "pending_responses": len(self.pending),
+            "in_flight": len(self._enqueued),
+            "requests": self.num_requests,
+            "responses": self.num_responses,
+            "cancelled": self.num_cancelled,
+            "evicted": self.num_evicted,
+            "latency": self.latency_stats.summary(),
+        }
 
-            await asyncio.sleep(0.1)  # 暂时挂起，避免紧密循环
+    def dump_metrics(self, path: str | None = None):
+        r"""Write :meth:`metrics` as JSON to :obj:`path`, or to
+        :attr:`metrics_path` if not given. Does nothing without a path.
+        """
+        path = path or self.metrics_path
+        if path is None:
+            return
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.metrics(), f, indent=2)
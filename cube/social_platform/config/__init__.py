@@ -1,5 +1,7 @@
+from .room import RoomGraph
 from .user import UserInfo
 
 __all__ = [
+    "RoomGraph",
     "UserInfo",
 ]
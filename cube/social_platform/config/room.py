@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import json
+import math
+import os.path as osp
+from datetime import timedelta
+from typing import Any, Sequence
+
+ENVIRONMENT_DIR = osp.join(osp.dirname(osp.abspath(__file__)),
+                           "environments")
+DEFAULT_ENVIRONMENT = "community"
+# 成年人的平均步行速度，单位为世界坐标每沙盒秒
+DEFAULT_WALKING_SPEED = 1.4
+
+
+class RoomGraph:
+    r"""Rooms of an environment with their world coordinates and the
+    all-pairs walking distances and travel times between them, computed
+    once so that lookups during the simulation are O(1).
+
+    Without :obj:`edges` every pair of rooms is connected by a straight
+    line. With :obj:`edges` the distances are shortest paths over the
+    corridors they describe (Floyd–Warshall), and rooms that are not
+    connected are unreachable.
+
+    Args:
+        rooms (dict[str, Sequence[float]]): Room name to ``(x, y, z)``
+            coordinate in the Unity scene.
+        edges (list[Sequence], optional): Pairs ``[room_a, room_b]`` or
+            ``[room_a, room_b, distance]`` of directly connected rooms. The
+            distance defaults to the straight line. (default: :obj:`None`)
+        walking_speed (float): World units walked per sandbox second.
+            (default: :obj:`1.4`)
+        name (str, optional): Name of the environment.
+            (default: :obj:`None`)
+    """
+
+    def __init__(self, rooms: dict[str, Sequence[float]],
+                 edges: list[Sequence[Any]] | None = None,
+                 walking_speed: float = DEFAULT_WALKING_SPEED,
+                 name: str | None = None):
+        if walking_speed <= 0:
+            raise ValueError("walking_speed must be positive.")
+        self.name = name
+        self.walking_speed = walking_speed
+        self.coordinates: dict[str, tuple[float, float, float]] = {
+            room: tuple(float(c) for c in coordinate)
+            for room, coordinate in rooms.items()
+        }
+        self.names = list(self.coordinates)
+        self.index = {room: i for i, room in enumerate(self.names)}
+        self.distances = self._compute_distances(edges)
+        self.travel_times = [[distance / walking_speed for distance in row]
+                             for row in self.distances]
+
+    @classmethod
+    def from_file(cls, path: str) -> RoomGraph:
+        r"""Load a graph from a JSON file with the keys ``rooms`` and,
+        optionally, ``edges``, ``walking_speed`` and ``name``.
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+        return cls(config["rooms"],
+                   edges=config.get("edges"),
+                   walking_speed=config.get("walking_speed",
+                                            DEFAULT_WALKING_SPEED),
+                   name=config.get("name"))
+
+    @classmethod
+    def load(cls, environment: str = DEFAULT_ENVIRONMENT) -> RoomGraph:
+        r"""Load a bundled environment by name, e.g. :obj:`"community"`, or
+        a JSON file by path.
+        """
+        if environment.endswith(".json"):
+            return cls.from_file(environment)
+        return cls.from_file(osp.join(ENVIRONMENT_DIR, f"{environment}.json"))
+
+    def _euclidean(self, room_a: str, room_b: str) -> float:
+        return math.dist(self.coordinates[room_a], self.coordinates[room_b])
+
+    def _compute_distances(
+            self, edges: list[Sequence[Any]] | None) -> list[list[float]]:
+        if edges is None:
+            return [[self._euclidean(a, b) for b in self.names]
+                    for a in self.names]
+
+        n = len(self.names)
+        dist = [[0.0 if i == j else math.inf for j in range(n)]
+                for i in range(n)]
+        for edge in edges:
+            room_a, room_b = edge[0], edge[1]
+            self.validate(room_a)
+            self.validate(room_b)
+            length = (float(edge[2]) if len(edge) > 2 else self._euclidean(
+                room_a, room_b))
+            i, j = self.index[room_a], self.index[room_b]
+            dist[i][j] = dist[j][i] = min(dist[i][j], length)
+        for k in range(n):
+            dist_k = dist[k]
+            for i in range(n):
+                dist_ik = dist[i][k]
+                if dist_ik == math.inf:
+                    continue
+                dist_i = dist[i]
+                for j in range(n):
+                    through_k = dist_ik + dist_k[j]
+                    if through_k < dist_i[j]:
+                        dist_i[j] = through_k
+        return dist
+
+    def __contains__(self, room: str) -> bool:
+        return room in self.index
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def validate(self, room: str):
+        r"""Raise :obj:`ValueError` if :obj:`room` is not in the graph."""
+        if room not in self.index:
+            raise ValueError(f"Unknown room: {room!r}")
+
+    def coordinate(self, room: str) -> tuple[float, float, float]:
+        self.validate(room)
+        return self.coordinates[room]
+
+    def distance(self, room_a: str, room_b: str) -> float:
+        r"""Walking distance between two rooms, :obj:`math.inf` if they are
+        not connected.
+        """
+        self.validate(room_a)
+        self.validate(room_b)
+        return self.distances[self.index[room_a]][self.index[room_b]]
+
+    def travel_time(self, room_a: str, room_b: str) -> timedelta:
+        r"""Estimated sandbox time to walk from :obj:`room_a` to
+        :obj:`room_b`.
+        """
+        self.validate(room_a)
+        self.validate(room_b)
+        seconds = self.travel_times[self.index[room_a]][self.index[room_b]]
+        if seconds == math.inf:
+            raise ValueError(f"Room {room_b!r} is not reachable from "
+                             f"{room_a!r}")
+        return timedelta(seconds=seconds)
@@ -7,14 +7,34 @@ import aiosqlite
 import aiofiles
 from typing import Any, Dict, List
 
+import numpy as np
+
+from cube.social_platform.rec_matrix import RecMatrix
+
 SCHEMA_DIR = "social_platform/schema"
 DB_DIR = "db"
 DB_NAME = "social_media.db"
 
 TRACE_SCHEMA_SQL = "trace.sql"
+STAY_SCHEMA_SQL = "stay.sql"
+ENCOUNTER_SCHEMA_SQL = "encounter.sql"
+# 从info中取出的类型化列及其类型和对应的info键，duration在info中没有
+TYPED_TRACE_COLUMNS = {
+    "room": ("TEXT", "room"),
+    "activity": ("TEXT", "activity"),
+    "other_agent_id": ("INTEGER", "new_agent"),
+    "duration": ("INTEGER", None),
+}
+# trace表中由写入方填写的列，trace_id由数据库分配
+TRACE_COLUMNS = ("seq", "user_id", "created_at", "action", "info",
+                 *TYPED_TRACE_COLUMNS)
+STAY_COLUMNS = ("user_id", "room", "activity", "enter_time", "exit_time")
+ENCOUNTER_COLUMNS = ("agent_a", "agent_b", "count", "first_time",
+                     "last_time", "room")
 
 TABLE_NAMES = {
-    "user", "post", "follow", "mute", "like", "dislike", "trace", "rec",
+    "user", "post", "follow", "mute", "like", "dislike", "trace", "stay",
+    "encounter", "rec",
     "comment.sql", "comment_like.sql", "comment_dislike.sql"
 }
 
@@ -35,9 +55,47 @@ def get_schema_dir_path() -> str:
     return schema_dir
 
 
+async def _upgrade_trace_table(conn: aiosqlite.Connection) -> bool:
+    r"""Prepare an existing trace table for the current schema.
+
+    Returns:
+        bool: :obj:`True` if the table predates :obj:`trace_id` and was
+            renamed to ``trace_legacy``, for its rows to be copied.
+    """
+    async with conn.execute("PRAGMA table_info(trace)") as cursor:
+        columns = [row[1] for row in await cursor.fetchall()]
+    if not columns:
+        return False
+    if "trace_id" not in columns:
+        await conn.execute("ALTER TABLE trace RENAME TO trace_legacy")
+        return True
+    missing = [name for name in TYPED_TRACE_COLUMNS if name not in columns]
+    for name in missing:
+        column_type, _ = TYPED_TRACE_COLUMNS[name]
+        await conn.execute(
+            f"ALTER TABLE trace ADD COLUMN {name} {column_type}")
+    if missing:
+        await _backfill_typed_trace_columns(conn)
+    return False
+
+
+async def _backfill_typed_trace_columns(conn: aiosqlite.Connection):
+    assignments = ", ".join(
+        f"{name} = json_extract(info, '$.{key}')"
+        for name, (_, key) in TYPED_TRACE_COLUMNS.items() if key is not None)
+    await conn.execute(f"UPDATE trace SET {assignments} "
+                       f"WHERE json_valid(info) "
+                       f"AND json_type(info) = 'object'")
+
+
 async def create_db_async(db_path: str | None = None):
     r"""Create the database if it does not exist. A :obj:`twitter.db`
     file will be automatically created in the :obj:`data` directory.
+
+    A trace table created before :obj:`trace_id` and :obj:`seq` existed is
+    migrated: its rows are copied into the new table in their original
+    order, with the old rowid as :obj:`seq`. The typed columns such as
+    :obj:`room` are added when missing and filled from :obj:`info`.
     """
     schema_dir = get_schema_dir_path()
     if db_path is None:
@@ -51,7 +109,21 @@ async def create_db_async(db_path: str | None = None):
                 trace_sql_path = osp.join(schema_dir, TRACE_SCHEMA_SQL)
                 async with aiofiles.open(trace_sql_path, 'r') as sql_file:  # 使用 aiofiles 读取文件
                     trace_sql_script = await sql_file.read()
+                migrate = await _upgrade_trace_table(conn)
                 await cursor.executescript(trace_sql_script)
+                if migrate:
+                    await cursor.execute(
+                        "INSERT INTO trace (seq, user_id, created_at, "
+                        "action, info) SELECT rowid, user_id, created_at, "
+                        "action, info FROM trace_legacy ORDER BY rowid")
+                    await cursor.execute("DROP TABLE trace_legacy")
+                    await _backfill_typed_trace_columns(conn)
+                # 停留区间表和相遇表
+                for schema_sql in (STAY_SCHEMA_SQL, ENCOUNTER_SCHEMA_SQL):
+                    sql_path = osp.join(schema_dir, schema_sql)
+                    async with aiofiles.open(sql_path, 'r') as sql_file:
+                        sql_script = await sql_file.read()
+                    await cursor.executescript(sql_script)
                 # 提交更改:
                 await conn.commit()
 
@@ -113,35 +185,38 @@ def fetch_table_from_db(cursor: sqlite3.Cursor,
     return data_dicts
 
 
-def fetch_rec_table_as_matrix(cursor: sqlite3.Cursor) -> List[List[int]]:
-
-    # 首先，查询user表中的所有user_id, 假设从1开始，连续
+def fetch_rec_table_as_matrix(cursor: sqlite3.Cursor) -> RecMatrix:
+    r"""Load the ``rec`` table as a :obj:`RecMatrix` with one row per user
+    of the ``user`` table, in a single query streamed into NumPy arrays.
+    """
+    # user_id假设从1开始，连续；第i个用户对应矩阵的第i行
     cursor.execute("SELECT user_id FROM user ORDER BY user_id")
-    user_ids = [row[0] for row in cursor.fetchall()]
+    user_ids = np.fromiter((row[0] for row in cursor), dtype=np.int64)
 
-    # 接着，查询rec表中的所有记录
     cursor.execute(
         "SELECT user_id, post_id FROM rec ORDER BY user_id, post_id")
-    rec_rows = cursor.fetchall()
-    # 初始化一个字典，为每个user_id分配一个空列表
-    user_posts = {user_id: [] for user_id in user_ids}
-    # 使用查询到的rec表记录填充字典
-    for user_id, post_id in rec_rows:
-        if user_id in user_posts:
-            user_posts[user_id].append(post_id)
-    # 将字典转换为矩阵形式
-    matrix = [None] + [user_posts[user_id] for user_id in user_ids]
-    return matrix
-
-
-def insert_matrix_into_rec_table(cursor: sqlite3.Cursor,
-                                 matrix: List[List[int]]) -> None:
-    # 遍历matrix，跳过索引0的占位符
-    for user_id, post_ids in enumerate(matrix[1:], start=1):
-        for post_id in post_ids:
-            # 对每个user_id和post_id的组合，插入到rec表中
-            cursor.execute("INSERT INTO rec (user_id, post_id) VALUES (?, ?)",
-                           (user_id, post_id))
+    # 不经过fetchall，逐行读入一维数组，偶数位为user_id，奇数位为post_id
+    values = np.fromiter((value for row in cursor for value in row),
+                         dtype=np.int64)
+    rec_users, rec_posts = values[0::2], values[1::2]
+    # 丢弃不在user表中的用户的推荐
+    rows = np.searchsorted(user_ids, rec_users)
+    known = rows < len(user_ids)
+    known[known] = user_ids[rows[known]] == rec_users[known]
+    return RecMatrix.from_pairs(len(user_ids), rows[known] + 1,
+                                rec_posts[known])
+
+
+def insert_matrix_into_rec_table(
+        cursor: sqlite3.Cursor, matrix: RecMatrix | List[List[int]]) -> None:
+    r"""Insert every ``(user_id, post_id)`` pair of :obj:`matrix` with one
+    :meth:`executemany`. The user id of a row is its index in the matrix.
+    The inserts run in the open transaction of the connection, to be
+    committed by the caller.
+    """
+    user_ids, post_ids = RecMatrix.from_lists(matrix).pairs()
+    cursor.executemany("INSERT INTO rec (user_id, post_id) VALUES (?, ?)",
+                       zip(user_ids.tolist(), post_ids.tolist()))
 
 
 if __name__ == "__main__":
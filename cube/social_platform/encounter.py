@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any
+
+# 同一对agent在这段沙盒时间内的相遇报告视为同一次相遇
+DEFAULT_ENCOUNTER_WINDOW = timedelta(minutes=5)
+
+
+def _agent_key(agent_id: Any) -> tuple:
+    try:
+        return (0, int(agent_id), "")
+    except (TypeError, ValueError):
+        return (1, 0, str(agent_id))
+
+
+def encounter_pair(agent_id: Any, other_agent_id: Any) -> tuple[Any, Any]:
+    r"""Return the two agents of an encounter in a fixed order, so that
+    both sides of a meeting map to the same pair.
+    """
+    return tuple(sorted((agent_id, other_agent_id), key=_agent_key))
+
+
+@dataclass
+class Encounter:
+    agent_a: Any
+    agent_b: Any
+    count: int
+    first_time: datetime
+    last_time: datetime
+    room: str | None
+
+    def as_row(self) -> tuple:
+        return (self.agent_a, self.agent_b, self.count, self.first_time,
+                self.last_time, self.room)
+
+
+class EncounterTracker:
+    r"""Aggregate MEET reports into one :obj:`Encounter` per unordered pair
+    of agents.
+
+    Both agents usually report the same meeting, and Unity may report a
+    pair again while they stay close. A report less than :obj:`window`
+    after the last one of the same pair only extends :obj:`last_time`, any
+    later report counts as a new meeting.
+
+    Args:
+        window (timedelta): Sandbox time within which reports of a pair are
+            merged. (default: :obj:`timedelta(minutes=5)`)
+    """
+
+    def __init__(self, window: timedelta = DEFAULT_ENCOUNTER_WINDOW):
+        self.window = window
+        self.encounters: dict[tuple[Any, Any], Encounter] = {}
+
+    def __len__(self) -> int:
+        return len(self.encounters)
+
+    def observe(self, agent_id: Any, other_agent_id: Any, time: datetime,
+                room: str | None = None) -> Encounter:
+        r"""Add a MEET report and return the updated encounter of the
+        pair.
+        """
+        pair = encounter_pair(agent_id, other_agent_id)
+        encounter = self.encounters.get(pair)
+        if encounter is None:
+            encounter = Encounter(*pair, 1, time, time, room)
+            self.encounters[pair] = encounter
+            return encounter
+        if time - encounter.last_time >= self.window:
+            encounter.count += 1
+        encounter.last_time = max(encounter.last_time, time)
+        if room is not None:
+            encounter.room = room
+        return encounter
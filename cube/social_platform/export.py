@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import json
+import os
+import os.path as osp
+import sqlite3
+from typing import Any
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+DEFAULT_EXPORT_TABLES = ("trace", "user", "post", "stay", "encounter")
+# 每次从SQLite取出并写成一个row group的行数
+DEFAULT_CHUNK_SIZE = 100_000
+# Parquet文件元数据中的键
+RUN_CONFIG_KEY = b"cube.run_config"
+SOURCE_TABLE_KEY = b"cube.table"
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("Exporting the database needs pyarrow, install it "
+                          "with `pip install pyarrow`.")
+
+
+def _arrow_type(declared_type: str):
+    # 按SQLite的类型亲和性规则映射声明的类型
+    declared_type = declared_type.upper()
+    if "INT" in declared_type:
+        return pa.int64()
+    if any(name in declared_type for name in ("REAL", "FLOA", "DOUB")):
+        return pa.float64()
+    if "DATE" in declared_type or "TIME" in declared_type:
+        return pa.timestamp("us")
+    if "BOOL" in declared_type:
+        return pa.bool_()
+    return pa.string()
+
+
+def _column_type(conn: sqlite3.Connection, table_name: str, name: str,
+                 declared_type: str):
+    arrow_type = _arrow_type(declared_type)
+    if pa.types.is_string(arrow_type):
+        return arrow_type
+    if pa.types.is_floating(arrow_type):
+        storage_classes = "'integer', 'real'"
+    elif pa.types.is_timestamp(arrow_type):
+        storage_classes = "'text'"
+    else:
+        storage_classes = "'integer'"
+    # SQLite的列可以混存不同类型的值，例如INTEGER列中的文本agent id，
+    # 这样的列整列导出为字符串
+    mixed = conn.execute(
+        f'SELECT 1 FROM "{table_name}" WHERE typeof("{name}") '
+        f"NOT IN ('null', {storage_classes}) LIMIT 1").fetchone()
+    return pa.string() if mixed else arrow_type
+
+
+def _to_array(values: list, arrow_type):
+    # 时间以str(datetime)的形式存储，先读成字符串再解析
+    value_type = (pa.string()
+                  if pa.types.is_timestamp(arrow_type) else arrow_type)
+    try:
+        array = pa.array(values, type=value_type)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        if not pa.types.is_string(value_type):
+            raise
+        # SQLite的列可以混存不同类型的值，文本列统一转成字符串
+        array = pa.array(
+            [None if value is None else str(value) for value in values],
+            type=value_type)
+    if value_type != arrow_type:
+        array = array.cast(arrow_type)
+    return array
+
+
+def export_table(conn: sqlite3.Connection, table_name: str, path: str,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 run_config: dict[str, Any] | None = None) -> int:
+    r"""Stream one table into a Parquet file, :obj:`chunk_size` rows at a
+    time. Every chunk becomes one row group, so memory use does not grow
+    with the table. A numeric or time column holding values of another
+    type is exported as strings. If the export fails, the file is removed.
+
+    Returns:
+        int: The number of exported rows.
+    """
+    _require_pyarrow()
+    columns = conn.execute(f"PRAGMA table_info({table_name})").fetchall()
+    names = [column[1] for column in columns]
+    types = [
+        _column_type(conn, table_name, column[1], column[2])
+        for column in columns
+    ]
+    metadata = {SOURCE_TABLE_KEY: table_name.encode("utf-8")}
+    if run_config is not None:
+        metadata[RUN_CONFIG_KEY] = json.dumps(run_config,
+                                              default=str).encode("utf-8")
+    schema = pa.schema(list(zip(names, types)), metadata=metadata)
+
+    quoted = ", ".join(f'"{name}"' for name in names)
+    cursor = conn.execute(
+        f'SELECT {quoted} FROM "{table_name}" ORDER BY rowid')
+    exported = 0
+    try:
+        with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                arrays = [
+                    _to_array(list(values), arrow_type)
+                    for values, arrow_type in zip(zip(*rows), types)
+                ]
+                writer.write_table(
+                    pa.Table.from_arrays(arrays, schema=schema),
+                    row_group_size=len(rows))
+                exported += len(rows)
+    except BaseException:
+        # 不留下只写了一部分的文件
+        if osp.exists(path):
+            os.remove(path)
+        raise
+    return exported
+
+
+def export_db(db_path: str, output_dir: str,
+              tables: tuple[str, ...] = DEFAULT_EXPORT_TABLES,
+              chunk_size: int = DEFAULT_CHUNK_SIZE,
+              run_config: dict[str, Any] | None = None) -> dict[str, str]:
+    r"""Export the tables of a simulation database to Parquet files named
+    ``<table>.parquet`` in :obj:`output_dir`. Tables missing from the
+    database are skipped.
+
+    Args:
+        db_path (str): Path of the database.
+        output_dir (str): Directory of the Parquet files, created if needed.
+        tables (tuple[str, ...]): Tables to export.
+            (default: :obj:`("trace", "user", "post", "stay",
+            "encounter")`)
+        chunk_size (int): Rows per chunk and row group.
+            (default: :obj:`100000`)
+        run_config (dict, optional): Configuration of the run, stored as
+            JSON in the metadata of every file. (default: :obj:`None`)
+
+    Returns:
+        dict[str, str]: The path of the file of each exported table.
+    """
+    _require_pyarrow()
+    os.makedirs(output_dir, exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    try:
+        existing = {
+            row[0]
+            for row in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table'")
+        }
+        paths = {}
+        for table_name in tables:
+            if table_name not in existing:
+                continue
+            path = osp.join(output_dir, f"{table_name}.parquet")
+            export_table(conn, table_name, path, chunk_size, run_config)
+            paths[table_name] = path
+        return paths
+    finally:
+        conn.close()
+
+
+def read_run_config(path: str) -> dict[str, Any] | None:
+    r"""Return the run configuration stored by :func:`export_db` in a
+    Parquet file, or :obj:`None` if there is none.
+    """
+    _require_pyarrow()
+    metadata = pq.read_schema(path).metadata or {}
+    run_config = metadata.get(RUN_CONFIG_KEY)
+    return None if run_config is None else json.loads(run_config)
@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+from typing import Any
+
+CONTROL = "control"
+INTERACTIVE = "interactive"
+DEFAULT = "default"
+BULK = "bulk"
+
+# 权重为None的通道严格优先，其余通道按权重平滑轮询
+DEFAULT_LANES: dict[str, int | None] = {
+    CONTROL: None,
+    INTERACTIVE: 8,
+    DEFAULT: 4,
+    BULK: 1,
+}
+
+
+class LaneQueue:
+    r"""Unbounded queue with named priority lanes, used in place of an
+    :obj:`asyncio.Queue`.
+
+    Lanes with weight :obj:`None` are strict: they are always served
+    first, in declaration order. The other lanes share the rest by smooth
+    weighted round-robin. For example, with weights 8, 4 and 1, a backlog
+    in every lane is served 8:4:1. An empty lane never delays the others.
+
+    Args:
+        lanes (dict[str, int | None], optional): Lane name to weight.
+            (default: :obj:`DEFAULT_LANES`)
+        default_lane (str): Lane of :meth:`put` calls without one.
+            (default: :obj:`"default"`)
+    """
+
+    def __init__(self, lanes: dict[str, int | None] | None = None,
+                 default_lane: str = DEFAULT):
+        lanes = DEFAULT_LANES if lanes is None else lanes
+        if default_lane not in lanes:
+            raise ValueError(f"Unknown default lane: {default_lane!r}")
+        for name, weight in lanes.items():
+            if weight is not None and weight <= 0:
+                raise ValueError(f"Weight of lane {name!r} must be positive.")
+        self.lanes = dict(lanes)
+        self.default_lane = default_lane
+        self._queues: dict[str, deque] = {name: deque() for name in lanes}
+        self._strict = [name for name, w in lanes.items() if w is None]
+        self._weighted = [name for name, w in lanes.items() if w is not None]
+        self._current = {name: 0 for name in self._weighted}
+        self._getters: deque[asyncio.Future] = deque()
+
+    def qsize(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def empty(self) -> bool:
+        return self.qsize() == 0
+
+    def lane_sizes(self) -> dict[str, int]:
+        return {name: len(queue) for name, queue in self._queues.items()}
+
+    def put_nowait(self, item: Any, lane: str | None = None):
+        lane = self.default_lane if lane is None else lane
+        if lane not in self._queues:
+            raise ValueError(f"Unknown lane: {lane!r}")
+        self._queues[lane].append(item)
+        self._wakeup_next()
+
+    async def put(self, item: Any, lane: str | None = None):
+        self.put_nowait(item, lane)
+
+    def _next_lane(self) -> str:
+        for name in self._strict:
+            if self._queues[name]:
+                return name
+        # 平滑加权轮询，只在非空的通道之间分配
+        total = 0
+        best = None
+        for name in self._weighted:
+            if not self._queues[name]:
+                continue
+            weight = self.lanes[name]
+            self._current[name] += weight
+            total += weight
+            if best is None or self._current[name] > self._current[best]:
+                best = name
+        self._current[best] -= total
+        return best
+
+    def _wakeup_next(self):
+        while self._getters:
+            getter = self._getters.popleft()
+            if not getter.done():
+                getter.set_result(None)
+                break
+
+    def get_nowait(self) -> Any:
+        if self.empty():
+            raise asyncio.QueueEmpty
+        return self._queues[self._next_lane()].popleft()
+
+    async def get(self) -> Any:
+        while self.empty():
+            getter = asyncio.get_running_loop().create_future()
+            self._getters.append(getter)
+            try:
+                await getter
+            except BaseException:
+                getter.cancel()
+                # 被唤醒后又被取消时，把唤醒交给下一个等待者
+                if not self.empty() and not getter.cancelled():
+                    self._wakeup_next()
+                raise
+        return self.get_nowait()
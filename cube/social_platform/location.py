@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import sqlite3
+from dataclasses import dataclass
+from datetime import datetime
+
+from cube.social_platform.database import STAY_COLUMNS
+
+_SELECT_STAY = f"SELECT {', '.join(STAY_COLUMNS)} FROM stay"
+# 区间[enter_time, exit_time)包含某一时刻，exit_time为NULL表示仍在停留
+_AT = "enter_time <= :time AND (exit_time IS NULL OR exit_time > :time)"
+# 区间与[start, end)有重叠
+_OVERLAPS = ("enter_time < :end AND "
+             "(exit_time IS NULL OR exit_time > :start)")
+
+
+@dataclass
+class Stay:
+    user_id: int
+    room: str | None
+    activity: str | None
+    enter_time: datetime
+    exit_time: datetime | None
+
+    @classmethod
+    def from_row(cls, row: tuple) -> Stay:
+        user_id, room, activity, enter_time, exit_time = row
+        return cls(user_id, room, activity, _parse_time(enter_time),
+                   _parse_time(exit_time))
+
+
+def _parse_time(value: str | None) -> datetime | None:
+    return None if value is None else datetime.fromisoformat(value)
+
+
+def _format_time(value: datetime | str) -> str:
+    # 与sqlite3写入datetime时的格式一致，才能按字符串比较
+    return str(value)
+
+
+class LocationQuery:
+    r"""Point-in-time and range queries on the ``stay`` table, which the
+    :obj:`Platform` fills while agents move and act: one row per stretch
+    of time an agent spends in one room with one activity.
+
+    Stays recorded by a running platform become visible once committed,
+    i.e. after its next trace flush or :meth:`Platform.flush_traces`.
+
+    Args:
+        db_path (str): Path of the simulation database.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self) -> LocationQuery:
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _stays(self, where: str, params: dict) -> list[Stay]:
+        rows = self.conn.execute(f"{_SELECT_STAY} WHERE {where}", params)
+        return [Stay.from_row(row) for row in rows]
+
+    def where_was(self, user_id: int | str,
+                  time: datetime | str) -> Stay | None:
+        r"""Return the stay of :obj:`user_id` at :obj:`time`, or
+        :obj:`None` if it was walking or not placed yet.
+        """
+        stays = self._stays(
+            f"user_id = :user_id AND {_AT} "
+            f"ORDER BY enter_time DESC LIMIT 1", {
+                "user_id": user_id,
+                "time": _format_time(time)
+            })
+        return stays[0] if stays else None
+
+    def who_was_in(self, room: str, time: datetime | str) -> list[Stay]:
+        r"""Return the stays in :obj:`room` at :obj:`time`, one per agent
+        present.
+        """
+        return self._stays(f"room = :room AND {_AT} ORDER BY user_id", {
+            "room": room,
+            "time": _format_time(time)
+        })
+
+    def occupancy(self, room: str, start: datetime | str,
+                  end: datetime | str) -> list[Stay]:
+        r"""Return the stays in :obj:`room` that overlap the interval
+        ``[start, end)``, ordered by enter time.
+        """
+        return self._stays(
+            f"room = :room AND {_OVERLAPS} ORDER BY enter_time, user_id", {
+                "room": room,
+                "start": _format_time(start),
+                "end": _format_time(end)
+            })
+
+    def history(self, user_id: int | str,
+                start: datetime | str | None = None,
+                end: datetime | str | None = None) -> list[Stay]:
+        r"""Return the stays of :obj:`user_id`, optionally only those that
+        overlap ``[start, end)``, ordered by enter time.
+        """
+        where = "user_id = :user_id"
+        params = {"user_id": user_id}
+        if start is not None:
+            where += " AND (exit_time IS NULL OR exit_time > :start)"
+            params["start"] = _format_time(start)
+        if end is not None:
+            where += " AND enter_time < :end"
+            params["end"] = _format_time(end)
+        return self._stays(f"{where} ORDER BY enter_time", params)
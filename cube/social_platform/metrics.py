@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import bisect
+import math
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+# 延迟直方图的桶上界，单位为秒
+LATENCY_BUCKETS = (
+    0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0,
+    30.0, 60.0, 300.0, 1800.0, 3600.0, math.inf
+)
+
+
+class LatencyHistogram:
+    r"""Fixed-bucket histogram of latencies in seconds."""
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def quantile(self, q: float) -> float:
+        r"""Upper bound of the bucket holding the :obj:`q` quantile."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.mean,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+            "buckets": {
+                str(bound): count
+                for bound, count in zip(self.buckets, self.counts) if count
+            },
+        }
+
+
+class LatencyStats:
+    r"""Latency histograms keyed by action type and phase, e.g.
+    :obj:`("go_to", "handler")`.
+    """
+
+    def __init__(self):
+        self.histograms: dict[tuple[str, str],
+                              LatencyHistogram] = defaultdict(
+                                  LatencyHistogram)
+        self.errors: dict[str, int] = defaultdict(int)
+
+    def observe(self, action: str, phase: str, seconds: float):
+        self.histograms[(action, phase)].observe(seconds)
+
+    def record_error(self, action: str):
+        self.errors[action] += 1
+
+    @contextmanager
+    def measure(self, action: str, phase: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(action, phase, time.perf_counter() - start)
+
+    def summary(self) -> dict[str, dict[str, dict[str, Any]]]:
+        result: dict[str, dict[str, dict[str, Any]]] = defaultdict(dict)
+        for (action, phase), histogram in self.histograms.items():
+            result[action][phase] = histogram.to_dict()
+        for action, errors in self.errors.items():
+            result[action]["errors"] = {"count": errors}
+        return dict(result)
+
+    def report(self) -> str:
+        r"""Render the histograms as a table sorted by total time."""
+        lines = [
+            f"{'action':<16}{'phase':<14}{'count':>8}{'total(s)':>12}"
+            f"{'mean(s)':>10}{'p99(s)':>10}{'max(s)':>10}"
+        ]
+        items = sorted(self.histograms.items(),
+                       key=lambda item: item[1].total,
+                       reverse=True)
+        for (action, phase), h in items:
+            lines.append(f"{action:<16}{phase:<14}{h.count:>8}"
+                         f"{h.total:>12.3f}{h.mean:>10.4f}"
+                         f"{h.quantile(0.99):>10.4f}{h.max:>10.4f}")
+        for action, errors in self.errors.items():
+            lines.append(f"{action:<16}{'errors':<14}{errors:>8}")
+        return "\n".join(lines)
@@ -3,18 +3,31 @@ from __future__ import annotations
 import random
 import sqlite3
 import asyncio
+import time
+from collections import defaultdict
+from functools import partial
 from datetime import datetime, timedelta
-from typing import Any
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterable
 
 
-from cube.clock.clock import Clock
+from cube.clock.clock import BaseClock
+from cube.clock.virtual_clock import VirtualClock
+from cube.social_platform.config import RoomGraph
 from cube.social_platform.database import create_db_async
+from cube.social_platform.encounter import (DEFAULT_ENCOUNTER_WINDOW,
+                                            EncounterTracker)
+from cube.social_platform.metrics import LatencyStats
 from cube.social_platform.platform_utils import AsyncPlatformUtils
-from cube.social_platform.typing import CommunityActionType
+from cube.social_platform.task_registry import TaskRegistry
+from cube.social_platform.trace_feed import TraceEvent
+from cube.social_platform.trace_writer import DEFAULT_FLUSH_INTERVAL
+from cube.social_platform.typing import CommunityActionType, MovementMode
 from cube.social_platform.unity_api.unity_server import (
     send_position_to_unity, send_stop_to_unity
 )
-from cube.social_platform.unity_api.unity_queue_manager import UnityQueueManager
+from cube.social_platform.unity_api.unity_queue_manager import (
+    UnityEvent, UnityEventType, UnityQueueManager
+)
 
 import logging
 
@@ -25,65 +38,6 @@ file_handler.setLevel('DEBUG')
 file_handler.setFormatter(logging.Formatter('%(levelname)s - %(asctime)s - %(name)s - %(message)s'))
 twitter_log.addHandler(file_handler)
 
-room_coordinate: dict = {
-    "entrance(Building B)": (14, 0, 17),
-    "kitchen(Building B)": (25, 0, 13),
-    "dining room(Building B)": (0, 0, 14),
-
-    "Bob's private toilet(Building B)": (0, 0, 20),
-    "Bob's private living room(Building B)": (-1, 0, 23),
-    "Bob's private bedroom(Building B)": (-1, 0, 26),
-    "Bob's private balcony(Building B)": (-2, 0, 26),
-
-    "entrance(Building A)": (-35, 0, 17),
-    "kitchen(Building A)": (-46, 0, 13.3),
-    "dining room(Building A)": (-22, 0, 14),
-
-    "Alice's private toilet(Building A)": (-21, 0, 20),
-    "Alice's private living room(Building A)": (-20, 0, 23),
-    "Alice's private bedroom(Building A)": (-20, 0, 26),
-    "Alice's private balcony(Building A)": (-18, 0, 26),
-
-    "Daisy's private toilet(Building A)": (-27, 0, 20),
-    "Daisy's private living room(Building A)": (-26, 0, 23),
-    "Daisy's private bedroom(Building A)": (-26, 0, 26),
-    "Daisy's private balcony(Building A)": (-24, 0, 26),
-
-    "Lisa's private toilet(Building A)": (-33, 0, 20),
-    "Lisa's private living room(Building A)": (-32, 0, 23),
-    "Lisa's private bedroom(Building A)": (-32, 0, 26),
-    "Lisa's private balcony(Building A)": (-30, 0, 26),
-
-    "Tom's private toilet(Building A)": (-35, 0, 20),
-    "Tom's private living room(Building A)": (-37, 0, 23),
-    "Tom's private bedroom(Building A)": (-35, 0, 26),
-    "Tom's private balcony(Building A)": (-38, 0, 26),
-
-    "Andrew's private toilet(Building A)": (-40, 0, 20),
-    "Andrew's private living room(Building A)": (-42, 0, 23),
-    "Andrew's private bedroom(Building A)": (-40, 0, 26),
-    "Andrew's private balcony(Building A)": (-43, 0, 26),
-
-    "Amy's private toilet(Building A)": (-46, 0, 20),
-    "Amy's private living room(Building A)": (-48, 0, 23),
-    "Amy's private bedroom(Building A)": (-46, 0, 26),
-    "Amy's private balcony(Building A)": (-49, 0, 26),
-
-    "west garden": (12, 0, -5),
-    "east garden": (-34, 0, -5),
-    "square": (11, 0, -20),
-    "basketball court": (-35, 0, -22),
-    "card room": (-20, 0, -46),
-    "north room in library": (-39, 0, -47),
-    "south room in library": (-39, 0, -42),
-    "activity room": (-48, 0, -46),
-
-    "church": (13, 0, -34),
-
-    "office": (-123, 0, -100),
-    "school": (73, 0, -100)
-}
-
 
 # agent_action: 输入（room/do_something和持续时间），返回结束标志
 # platform:输入agent_id, action_type, unity情况，返回到达/指定do_something时间结束
@@ -92,98 +46,315 @@ class Platform:
     def __init__(
             self, db_path: str, channel: Any,
             unity_queue_manager: UnityQueueManager,
-            sandbox_clock: Clock, start_time: datetime):
+            sandbox_clock: BaseClock, start_time: datetime,
+            max_concurrent_handlers: int = 1024,
+            room_graph: RoomGraph | None = None,
+            movement_mode: MovementMode | str = MovementMode.UNITY,
+            trace_flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+            encounter_window: timedelta = DEFAULT_ENCOUNTER_WINDOW):
         self.db_path = db_path
         self.channel = channel
         self.unity_queue_mgr = unity_queue_manager
         self.start_time = start_time
         self.sandbox_clock = sandbox_clock
-
+        self.scheduler = self.sandbox_clock.create_scheduler(self.start_time)
+        # 房间坐标和房间之间的步行时间，启动时一次性算好
+        self.room_graph = room_graph or RoomGraph.load()
+        # 每个agent最后到达的房间，以及每个房间里的agent
+        self.agent_rooms: dict[str, str] = {}
+        self.room_occupants: dict[str, set[str]] = defaultdict(set)
+        # stay表中还没有exit_time的agent
+        self._open_stays: set[str] = set()
+        # 每对agent的相遇次数，双方的meet记录合并为一次
+        self.encounters = EncounterTracker(encounter_window)
+        self.movement_mode = MovementMode(movement_mode)
+        # Unity按真实时间移动agent，虚拟时钟在等待Unity期间无法前进
+        if (self.movement_mode == MovementMode.UNITY
+                and isinstance(sandbox_clock, VirtualClock)):
+            raise ValueError("VirtualClock only works with the logical "
+                             "movement mode, pass movement_mode='logical'.")
+        # 跟踪正在处理的请求，限制同时运行的处理代码（睡眠和排队的任务不计），
+        # 并保证同一agent的请求按顺序执行
+        self.task_registry = TaskRegistry(max_concurrent_handlers)
+        # 按动作类型统计排队、处理和等待Unity的延迟
+        self.latency_stats = LatencyStats()
+
+        self.handlers: dict[CommunityActionType, Callable[
+            [str, Any], Awaitable[dict[str, Any]]]] = {}
+        self.register_handler(CommunityActionType.GO_TO, self.go_to)
+        self.register_handler(CommunityActionType.DO_SOMETHING,
+                              self.do_something)
+        self.register_handler(CommunityActionType.BATCH, self.batch)
+
+        # trace行在内存中最多停留的秒数，0表示每行单独提交
+        self.trace_flush_interval = trace_flush_interval
         self.pl_utils = AsyncPlatformUtils(
-            db_path, self.start_time, self.sandbox_clock)
+            db_path, self.start_time, self.sandbox_clock,
+            trace_flush_interval)
+
+        # 调用方超时或取消请求时，取消对应的处理任务
+        self._message_tasks: dict[Any, asyncio.Task] = {}
+        add_cancel_listener = getattr(self.channel, "add_cancel_listener",
+                                      None)
+        if add_cancel_listener is not None:
+            add_cancel_listener(self._cancel_message)
+        # 请求从写入Channel到处理任务开始运行之间也占住沙盒时钟
+        attach_clock = getattr(self.channel, "attach_clock", None)
+        if attach_clock is not None:
+            attach_clock(self.sandbox_clock)
 
     async def create_async_db(self):
         await create_db_async(self.db_path)
         # 其他可能的异步初始化代码
+        await self.pl_utils.close()
         self.pl_utils = AsyncPlatformUtils(
-            self.db_path, self.start_time, self.sandbox_clock)
+            self.db_path, self.start_time, self.sandbox_clock,
+            self.trace_flush_interval)
         return self
 
+    def subscribe_traces(self,
+                         after_seq: int = 0,
+                         user_ids: Iterable[Any] | None = None,
+                         actions: Iterable[str] | None = None
+                         ) -> AsyncIterator[TraceEvent]:
+        r"""Iterate over the trace events after :obj:`after_seq`: the rows
+        already in the database first, then each new event as it is
+        recorded, until the platform exits. Keep the :obj:`seq` of the last
+        event to resume from there. Subscribe after
+        :meth:`create_async_db`.
+
+        Args:
+            after_seq (int): Checkpoint to resume from. (default: :obj:`0`)
+            user_ids (Iterable, optional): Only events of these agents.
+                (default: :obj:`None`)
+            actions (Iterable[str], optional): Only these actions.
+                (default: :obj:`None`)
+        """
+        return self.pl_utils.trace_feed.subscribe(after_seq, user_ids,
+                                                  actions)
+
+    async def flush_traces(self):
+        r"""Wait until every trace recorded so far is in the database, e.g.
+        before reading the trace table while the simulation runs.
+        """
+        await self.pl_utils.flush_traces()
+
+    @property
+    def backlog(self) -> int:
+        r"""Number of requests received but not finished yet."""
+        return self.task_registry.backlog
+
     async def running(self):
-        tasks = []  # 用于跟踪所有创建的任务
         while True:
             message_id, data = await self.channel.receive_from()
             # print('platform receive:', message_id, data)
             if data[2] == CommunityActionType.EXIT:
+                # EXIT走优先通道，可能越过仍在排队的请求，先处理完它们
+                receive_queued = getattr(self.channel, "receive_queued", None)
+                if receive_queued is not None:
+                    for queued_id, queued_data in receive_queued():
+                        await self._dispatch(queued_id, queued_data)
                 # 等待所有先前的任务完成
-                if tasks:
-                    await asyncio.gather(*tasks)
+                await self.task_registry.drain()
+                # 所有处理都已完成，写入剩余的trace，等实时订阅读完后
+                # 关闭数据库长连接
+                await self.pl_utils.close()
+                twitter_log.info(
+                    f"Platform latency:\n{self.latency_stats.report()}")
+                # 仿真结束时导出Channel的队列和延迟统计
+                dump_metrics = getattr(self.channel, "dump_metrics", None)
+                if dump_metrics is not None:
+                    dump_metrics()
                 break
             else:
-                # 为每个消息创建一个新的任务，并跟踪它
-                task = asyncio.create_task(self.handle_message(message_id, data))
-                tasks.append(task)
-                # 可选：清理已完成的任务，避免列表无限增长
-                tasks = [t for t in tasks if not t.done()]
-
-    async def handle_message(self, message_id, data):
+                await self._dispatch(message_id, data)
+
+    async def _dispatch(self, message_id, data):
+        # 为每个消息创建一个新的任务，运行中的处理达到上限时在这里等待
+        received_at = time.perf_counter()
+        mark_started = getattr(self.channel, "mark_started", None)
+        task = await self.task_registry.submit(
+            data[0], self.handle_message(message_id, data, received_at),
+            None if mark_started is None else partial(mark_started,
+                                                      message_id))
+        self._message_tasks[message_id] = task
+        task.add_done_callback(
+            lambda _, message_id=message_id: self._message_tasks.pop(
+                message_id, None))
+
+    def estimate_travel_time(self, agent_id: str,
+                             room_name: str) -> timedelta | None:
+        r"""Estimated sandbox time for :obj:`agent_id` to walk to
+        :obj:`room_name`, or :obj:`None` while its position is unknown.
+        """
+        current_room = self.agent_rooms.get(agent_id)
+        if current_room is None:
+            return None
+        return self.room_graph.travel_time(current_room, room_name)
+
+    def register_handler(
+            self, action_type: CommunityActionType,
+            handler: Callable[[str, Any], Awaitable[dict[str, Any]]]):
+        r"""Register the coroutine function that handles an action type.
+
+        Args:
+            action_type (CommunityActionType): The action to handle.
+            handler (Callable[[str, Any], Awaitable[dict]]): Called with the
+                agent id and the message of the request, returns the result
+                sent back to the agent.
+        """
+        self.handlers[action_type] = handler
+
+    def _cancel_message(self, message_id):
+        task = self._message_tasks.get(message_id)
+        if task is not None:
+            task.cancel()
+
+    async def handle_message(self, message_id, data, received_at=None):
         agent_id, message, action = data
-        action = CommunityActionType(action)
+        # 等待并发名额期间已被调用方取消
+        is_cancelled = getattr(self.channel, "is_cancelled", None)
+        if is_cancelled is not None and is_cancelled(message_id):
+            return
+        action_name = getattr(action, "value", action)
+        if received_at is not None:
+            self.latency_stats.observe(action_name, "queue_wait",
+                                       time.perf_counter() - received_at)
+        # 处理请求期间占住虚拟时钟，等待沙盒时间时由scheduler释放
+        with self.sandbox_clock.hold():
+            result = await self._perform(agent_id, message, action)
+            await self.channel.send_to((message_id, agent_id, result))
+
+    async def _perform(self, agent_id: str, message: Any,
+                       action: Any) -> dict[str, Any]:
+        action_name = getattr(action, "value", action)
         try:
-            if action == CommunityActionType.EXIT:
-                self.db_cursor.close()
-                self.db.close()
-                # 由于这里是退出操作，可能需要特殊处理以避免后续任务执行
-            elif action == CommunityActionType.GO_TO:
-                result = await self.go_to(agent_id=agent_id, room_name=message)
-                print('goto_result:', result)
-                await self.channel.send_to((message_id, agent_id, result))
-            elif action == CommunityActionType.DO_SOMETHING:
-                result = await self.do_something(
-                    agent_id=agent_id, activity_message=message)
-                print('do_something_result:', result)
-                await self.channel.send_to((message_id, agent_id, result))
-            else:
+            handler = self.handlers.get(CommunityActionType(action))
+            if handler is None:
                 raise ValueError(f"Action {action} is not supported")
+            with self.latency_stats.measure(action_name, "handler"):
+                result = await handler(agent_id, message)
+            twitter_log.debug("%s_result: %s", action_name, result)
         except Exception as e:
-            # 处理或记录异常
-            print(f"Error handling message {message_id}: {e}")
+            # 记录异常并把错误返回给agent，避免agent一直等待
+            self.latency_stats.record_error(action_name)
+            twitter_log.exception(
+                f"Error handling {action_name} of agent {agent_id}: {e}")
+            result = {"success": False, "error": str(e)}
+        return result
+
+    async def batch(self, agent_id: str, actions: list[tuple[Any, Any]]):
+        r"""Perform the ``(message, action_type)`` pairs of a batch in order
+        and return all their results together. The trace rows of the whole
+        batch are written in a single transaction once it is done.
+        """
+        results = []
+        async with self.pl_utils.batch_traces():
+            for message, action in actions:
+                if getattr(action, "value",
+                           action) == CommunityActionType.BATCH.value:
+                    results.append({
+                        "success": False,
+                        "error": "Nested batches are not supported"
+                    })
+                    continue
+                results.append(await self._perform(agent_id, message, action))
+        return {"success": True, "results": results}
+
+    async def _sleep_until(self, sandbox_time: datetime):
+        r"""Wait for :obj:`sandbox_time` without taking a handler slot, so
+        that sleeping handlers never keep new requests from starting.
+        """
+        async with self.task_registry.yield_slot():
+            await self.scheduler.sleep_until(sandbox_time)
+
+    def _leave_room(self, agent_id: str):
+        current_room = self.agent_rooms.pop(agent_id, None)
+        if current_room is not None:
+            self.room_occupants[current_room].discard(agent_id)
+
+    def _enter_room(self, agent_id: str, room_name: str):
+        self.agent_rooms[agent_id] = room_name
+        self.room_occupants[room_name].add(agent_id)
+
+    async def _update_stay(self, agent_id: str, room_name: str | None,
+                           activity: str | None, current_time: datetime):
+        r"""End the current stay of :obj:`agent_id` at
+        :obj:`current_time` and start the next one, unless the agent is now
+        walking (no room and no activity).
+        """
+        if agent_id in self._open_stays:
+            self._open_stays.discard(agent_id)
+            await self.pl_utils._close_stay(agent_id, current_time)
+        if room_name is None and activity is None:
+            return
+        await self.pl_utils._open_stay(agent_id, room_name, activity,
+                                       current_time)
+        self._open_stays.add(agent_id)
+
+    async def _record_meet(self, agent_id: str, other_agent_id: str,
+                           meet_time: datetime | None = None,
+                           room_name: str | None = None):
+        r"""Record a MEET trace row of :obj:`agent_id` and update the
+        encounter of the pair.
+        """
+        if meet_time is None:
+            meet_time = self.sandbox_clock.now(self.start_time)
+        action_info = {"new_agent": other_agent_id}
+        await self.pl_utils._record_trace(agent_id,
+                                          CommunityActionType.MEET.value,
+                                          action_info, meet_time,
+                                          room=room_name)
+        encounter = self.encounters.observe(agent_id, other_agent_id,
+                                            meet_time, room_name)
+        await self.pl_utils._save_encounter(encounter)
 
     async def go_to(self, agent_id: str, room_name: str):
+        if self.movement_mode == MovementMode.LOGICAL:
+            return await self.go_to_logical(agent_id, room_name)
         try:
+            # 先校验房间名，未知的房间不会发给Unity
+            x, y, z = self.room_graph.coordinate(room_name)
+            plan_time = self.sandbox_clock.now(self.start_time)
             action_info = {"room": room_name}
-            await self.pl_utils._record_trace(agent_id, "plan_to", action_info)
-            x, y, z = room_coordinate.get(room_name)
+            await self.pl_utils._record_trace(agent_id, "plan_to", action_info,
+                                              plan_time)
+            self._leave_room(agent_id)
+            await self._update_stay(agent_id, None, None, plan_time)
+            # 上一次移动迟到的ARRIVED不能当作这一次的到达
+            self.unity_queue_mgr.discard(agent_id, {UnityEventType.ARRIVED})
             await send_position_to_unity(agent_id, x, y, z)
 
-            listen_flag = True
-            received_message = await self.unity_queue_mgr.get_message(agent_id)
-            if received_message and received_message['message'].startswith("ARRIVED"):
-                listen_flag = False
-
-            # print('platform receive message:', received_message)
-            while listen_flag:
-                if received_message and received_message['message'].startswith("ARRIVED"):
+            # 只在Unity发来ARRIVED或NEW_AGENT时被唤醒，不再轮询队列
+            unity_wait = 0.0
+            while True:
+                wait_start = time.perf_counter()
+                event = await self.unity_queue_mgr.wait_for_event(agent_id)
+                unity_wait += time.perf_counter() - wait_start
+                if event.event_type == UnityEventType.ARRIVED:
                     await send_stop_to_unity(agent_id)
-                    listen_flag = False
-                if received_message and received_message['message'].startswith("NEW_AGENT:"):
-                    new_agent = received_message['message'].split(":")[1]
+                    break
+                if event.event_type == UnityEventType.NEW_AGENT:
                     # 记录相遇操作到trace表
-                    action_info = {"new_agent": new_agent}
-                    await self.pl_utils._record_trace(
-                        agent_id, CommunityActionType.MEET.value, action_info)
+                    await self._record_meet(agent_id, event.payload)
                     await send_stop_to_unity(agent_id)
                     await asyncio.sleep(2)
                     await send_position_to_unity(agent_id, x, y, z)
 
-                received_message = await self.unity_queue_mgr.get_message(
-                    agent_id)
-
+            self.latency_stats.observe(CommunityActionType.GO_TO.value,
+                                       "unity_wait", unity_wait)
+            arrival_time = self.sandbox_clock.now(self.start_time)
+            self._enter_room(agent_id, room_name)
+            await self._update_stay(agent_id, room_name, None, arrival_time)
             # 记录go_to操作到trace表
             action_info = {"room": room_name}
             await self.pl_utils._record_trace(
-                agent_id, "arrived", action_info)
+                agent_id, "arrived", action_info, arrival_time)
             return {"success": True, "arrived": room_name}
+        except asyncio.CancelledError:
+            # 请求被取消时让Unity里的agent停下
+            await send_stop_to_unity(agent_id)
+            raise
         except Exception as e:
             print(f"Error type: {type(e)}")
             print(f"Error args: {e.args}")
@@ -192,41 +363,87 @@ class Platform:
             print(f"Traceback: {traceback.format_exc()}")
             return {"success": False, "error": str(e)}
 
+    async def go_to_logical(self, agent_id: str, room_name: str):
+        r"""Move :obj:`agent_id` without Unity: it arrives after the
+        precomputed travel time on the sandbox clock and meets everyone
+        already in :obj:`room_name`. Writes the same ``plan_to``, ``meet``
+        and ``arrived`` trace rows as the Unity mode. The first move of an
+        agent, whose position is still unknown, takes no time.
+        """
+        try:
+            self.room_graph.validate(room_name)
+            travel_time = (self.estimate_travel_time(agent_id, room_name)
+                           or timedelta(0))
+            plan_time = self.sandbox_clock.now(self.start_time)
+            action_info = {"room": room_name}
+            await self.pl_utils._record_trace(agent_id, "plan_to", action_info,
+                                              plan_time)
+            self._leave_room(agent_id)
+            await self._update_stay(agent_id, None, None, plan_time)
+
+            arrival_time = plan_time + travel_time
+            await self._sleep_until(arrival_time)
+
+            # 到达时与房间里已有的agent相遇，双方各记录一条meet
+            for other in sorted(self.room_occupants[room_name]):
+                await self._record_meet(agent_id, other, arrival_time,
+                                        room_name)
+                await self._record_meet(other, agent_id, arrival_time,
+                                        room_name)
+            self._enter_room(agent_id, room_name)
+            await self._update_stay(agent_id, room_name, None, arrival_time)
+
+            action_info = {"room": room_name}
+            await self.pl_utils._record_trace(
+                agent_id, "arrived", action_info, arrival_time)
+            return {"success": True, "arrived": room_name}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
     async def do_something(
             self, agent_id: str, activity_message: tuple[str, int]):
         # duration单位是分钟
         try:
-            start_time = self.sandbox_clock.time_transfer(
-                datetime.now(), self.start_time)
+            start_time = self.sandbox_clock.now(self.start_time)
             activity, duration = activity_message
             duration_delta: datetime = timedelta(minutes=duration)
 
+            # 活动所在的房间和时长单独成列，便于按房间查询
+            room_name = self.agent_rooms.get(agent_id)
             action_info = {"activity": activity}
             await self.pl_utils._record_trace(
-                agent_id, "start_activity", action_info, start_time)
-
-            while True:
-                now_time = self.sandbox_clock.time_transfer(
-                    datetime.now(), self.start_time)
-                elapsed_time = now_time - start_time  # 计算已过去的时间
-                # print('elapsed_time:', elapsed_time)
-                if elapsed_time > duration_delta:
-                    # print("Finished running for specified duration")
-                    break
-
-                received_message = await self.unity_queue_mgr.get_message(
-                    agent_id)
-                if received_message and received_message['message'].startswith("NEW_AGENT:"):
-                    new_agent = received_message['message'].split(":")[1]
-                    # 记录相遇操作到trace表
-                    action_info = {"new_agent": new_agent}
-                    await self.pl_utils._record_trace(
-                        agent_id, CommunityActionType.MEET.value, action_info)
+                agent_id, "start_activity", action_info, start_time,
+                room=room_name, duration=duration)
+            await self._update_stay(agent_id, room_name, activity, start_time)
+
+            # 挂在定时器堆上直到沙盒结束时间，期间的相遇通过回调记录
+            end_time = start_time + duration_delta
+
+            async def record_meet(event: UnityEvent):
+                # 活动期间的其他事件（如迟到的ARRIVED）直接丢弃，
+                # 以免下一次go_to把它当作自己的到达
+                if event.event_type == UnityEventType.NEW_AGENT:
+                    await self._record_meet(agent_id, event.payload,
+                                            room_name=room_name)
+
+            self.unity_queue_mgr.add_listener(agent_id, record_meet)
+            try:
+                await self._sleep_until(end_time)
+            except asyncio.CancelledError:
+                # 活动被取消时在当前时刻结束它
+                await self._update_stay(
+                    agent_id, room_name, None,
+                    self.sandbox_clock.now(self.start_time))
+                raise
+            finally:
+                self.unity_queue_mgr.remove_listener(agent_id)
 
             # 记录go_to操作到trace表
             action_info = {"activity": activity}
             await self.pl_utils._record_trace(
-                agent_id, "end_activity", action_info, now_time)
+                agent_id, "end_activity", action_info, end_time,
+                room=room_name, duration=duration)
+            await self._update_stay(agent_id, room_name, None, end_time)
             return {"success": True, "activity": activity}
         except Exception as e:
             return {"success": False, "error": str(e)}
@@ -1,7 +1,94 @@
+from __future__ import annotations
+
+import asyncio
 import json
-from datetime import datetime
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+
 import aiosqlite
 
+from cube.social_platform.database import (ENCOUNTER_COLUMNS, TRACE_COLUMNS,
+                                           TYPED_TRACE_COLUMNS)
+from cube.social_platform.encounter import Encounter
+from cube.social_platform.trace_feed import TraceEvent, TraceFeed
+from cube.social_platform.trace_writer import (DEFAULT_FLUSH_INTERVAL,
+                                               DEFAULT_MAX_ROWS, TraceWriter)
+
+# 批量请求期间缓存trace记录，批量结束后在同一个事务中写入
+_trace_buffer: ContextVar[list | None] = ContextVar("trace_buffer",
+                                                     default=None)
+
+# trace行的INSERT语句，seq由next_trace_seq生成
+TRACE_INSERT_QUERY = (f"INSERT INTO trace ({', '.join(TRACE_COLUMNS)}) "
+                      f"VALUES ({', '.join('?' * len(TRACE_COLUMNS))})")
+_last_trace_seq = 0
+
+
+def next_trace_seq() -> int:
+    r"""Return the sequence number of a new trace row.
+
+    Numbers strictly increase within a process and follow
+    :func:`time.monotonic_ns`, so the rows of shard processes on the same
+    host keep the order in which they were recorded.
+    """
+    global _last_trace_seq
+    _last_trace_seq = max(time.monotonic_ns(), _last_trace_seq + 1)
+    return _last_trace_seq
+
+
+def last_trace_seq() -> int:
+    r"""Return the last sequence number handed out in this process."""
+    return _last_trace_seq
+
+
+def trace_row(user_id, created_at, action_type, action_info, room=None,
+              duration=None) -> tuple:
+    r"""Build the values of a trace row in :obj:`TRACE_COLUMNS` order.
+
+    The typed columns are taken from :obj:`action_info` (``"room"``,
+    ``"activity"`` and ``"new_agent"``) unless given explicitly, so that
+    analysis queries can filter on them without parsing :obj:`info`.
+    """
+    typed = {name: None for name in TYPED_TRACE_COLUMNS}
+    if isinstance(action_info, dict):
+        for name, (_, key) in TYPED_TRACE_COLUMNS.items():
+            if key is not None:
+                typed[name] = action_info.get(key)
+    if room is not None:
+        typed["room"] = room
+    typed["duration"] = duration
+    return (next_trace_seq(), user_id, created_at, action_type,
+            json.dumps(action_info), *typed.values())
+
+
+STAY_OPEN_QUERY = ("INSERT INTO stay (user_id, room, activity, enter_time) "
+                   "VALUES (?, ?, ?, ?)")
+STAY_CLOSE_QUERY = ("UPDATE stay SET exit_time = ? "
+                    "WHERE user_id = ? AND exit_time IS NULL")
+# 结束于开始时刻的停留没有长度，直接删除
+STAY_DISCARD_QUERY = ("DELETE FROM stay WHERE user_id = ? "
+                      "AND exit_time IS NULL AND enter_time = ?")
+
+# 每次相遇后覆盖这一对agent的累计值，由EncounterTracker计算
+ENCOUNTER_UPSERT_QUERY = (
+    f"INSERT INTO encounter ({', '.join(ENCOUNTER_COLUMNS)}) "
+    f"VALUES ({', '.join('?' * len(ENCOUNTER_COLUMNS))}) "
+    f"ON CONFLICT(agent_a, agent_b) DO UPDATE SET "
+    f"count = excluded.count, last_time = excluded.last_time, "
+    f"room = excluded.room")
+
+# 长连接的PRAGMA：WAL下读写互不阻塞，synchronous=NORMAL只在检查点时fsync，
+# cache_size为负数时单位是KiB
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA temp_store=MEMORY",
+)
+# sqlite3按SQL文本缓存预编译语句的数量
+CACHED_STATEMENTS = 256
+
 
 class PlatformUtils:
 
@@ -42,43 +129,184 @@ class PlatformUtils:
 
         # 如果只有trace表需要记录时间，将进入_record_trace作为trace记录的时间
         if current_time is None:
-            current_time = self.sandbox_clock.time_transfer(
-                datetime.now(), self.start_time)
-        trace_insert_query = (
-            "INSERT INTO trace (user_id, created_at, action, info) "
-            "VALUES (?, ?, ?, ?)")
-        action_info_str = json.dumps(action_info)
+            current_time = self.sandbox_clock.now(self.start_time)
         self._execute_db_command(
-            trace_insert_query,
-            (user_id, current_time, action_type, action_info_str),
+            TRACE_INSERT_QUERY,
+            trace_row(user_id, current_time, action_type, action_info),
             commit=True)
 
 
 class AsyncPlatformUtils:
-    def __init__(self, db_path, start_time, sandbox_clock):
+    r"""Database helpers of the :obj:`Platform`.
+
+    All commands share one long-lived connection, opened on first use with
+    the :obj:`CONNECTION_PRAGMAS` and a statement cache of
+    :obj:`CACHED_STATEMENTS`, so repeated inserts reuse their prepared
+    statement instead of reconnecting and recompiling. Trace rows go
+    through a :obj:`TraceWriter` and are committed in groups. Call
+    :meth:`close` when the platform stops, the database cannot be used
+    afterwards.
+
+    Args:
+        db_path (str): Path of the database.
+        start_time (datetime): Sandbox start time.
+        sandbox_clock (BaseClock): Clock of the sandbox.
+        trace_flush_interval (float): Longest time in seconds a trace row
+            waits before it is committed, ``0`` to commit every row on its
+            own. (default: :obj:`0.05`)
+        trace_max_rows (int): Buffered trace rows that trigger a commit.
+            (default: :obj:`1000`)
+    """
+    TRACE_INSERT_QUERY = TRACE_INSERT_QUERY
+
+    def __init__(self, db_path, start_time, sandbox_clock,
+                 trace_flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+                 trace_max_rows: int = DEFAULT_MAX_ROWS):
         self.db_path = db_path
         self.start_time = start_time
         self.sandbox_clock = sandbox_clock
+        self._db: aiosqlite.Connection | None = None
+        self._connect_lock = asyncio.Lock()
+        self.closed = False
+        self.trace_writer = TraceWriter(self._write_traces, trace_max_rows,
+                                        trace_flush_interval)
+        self.trace_feed = TraceFeed(self.flush_traces, self._fetch_traces,
+                                    last_trace_seq)
+
+    async def connect(self) -> aiosqlite.Connection:
+        r"""Return the shared connection, opening it if needed.
+
+        Raises:
+            RuntimeError: After :meth:`close`.
+        """
+        if self._db is not None:
+            return self._db
+        if self.closed:
+            # 关闭后重新打开的连接没有人关闭，其线程会阻止进程退出
+            raise RuntimeError("The platform database is closed.")
+        async with self._connect_lock:
+            if self._db is None:
+                db = await aiosqlite.connect(
+                    self.db_path, cached_statements=CACHED_STATEMENTS)
+                for pragma in CONNECTION_PRAGMAS:
+                    await db.execute(pragma)
+                self._db = db
+        return self._db
+
+    async def close(self):
+        r"""Write the buffered traces, end the trace subscriptions, then
+        commit and close the shared connection. Subscribers that fell behind
+        catch up from the database before it is closed.
+        """
+        await self.trace_writer.close()
+        await self.trace_feed.wait_closed()
+        self.closed = True
+        if self._db is None:
+            return
+        db, self._db = self._db, None
+        await db.commit()
+        await db.close()
 
     async def _execute_db_command(self, command, args=(), commit=False):
-        async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute(command, args) as cursor:
-                if commit:
-                    await db.commit()
-                return cursor
-
-    async def _record_trace(
-            self, user_id, action_type, action_info, current_time=None):
+        db = await self.connect()
+        async with db.execute(command, args) as cursor:
+            if commit:
+                await db.commit()
+            return cursor
+
+    async def _execute_many_db_command(self, command, args_list,
+                                       commit=False):
+        db = await self.connect()
+        async with db.executemany(command, args_list) as cursor:
+            if commit:
+                await db.commit()
+            return cursor
+
+    async def _write_traces(self, rows):
+        await self._execute_many_db_command(self.TRACE_INSERT_QUERY, rows,
+                                            commit=True)
+
+    async def flush_traces(self):
+        r"""Wait until every trace, stay and encounter recorded so far is
+        committed.
+        """
+        await self.trace_writer.flush()
+        if self._db is not None:
+            await self._db.commit()
+
+    async def _fetch_traces(self, after_seq, until_seq, user_ids=None,
+                            actions=None, page_size=1000):
+        # 按seq分页读取，不在共享连接上长时间占用一条查询
+        where = "seq > ? AND seq <= ?"
+        filters = []
+        if user_ids is not None:
+            where += f" AND user_id IN ({', '.join('?' * len(user_ids))})"
+            filters.extend(user_ids)
+        if actions is not None:
+            where += f" AND action IN ({', '.join('?' * len(actions))})"
+            filters.extend(actions)
+        query = (f"SELECT {', '.join(TRACE_COLUMNS)} FROM trace "
+                 f"WHERE {where} ORDER BY seq LIMIT {page_size}")
+        db = await self.connect()
+        while True:
+            async with db.execute(query,
+                                  (after_seq, until_seq, *filters)) as cursor:
+                rows = await cursor.fetchall()
+            for row in rows:
+                yield row
+            if len(rows) < page_size:
+                return
+            after_seq = rows[-1][0]
+
+    async def _close_stay(self, user_id, exit_time):
+        # 停留区间不单独提交，随下一次trace写入或flush_traces一起提交
+        await self._execute_db_command(STAY_DISCARD_QUERY,
+                                       (user_id, exit_time))
+        await self._execute_db_command(STAY_CLOSE_QUERY,
+                                       (exit_time, user_id))
+
+    async def _open_stay(self, user_id, room, activity, enter_time):
+        await self._execute_db_command(STAY_OPEN_QUERY,
+                                       (user_id, room, activity, enter_time))
+
+    async def _save_encounter(self, encounter: Encounter):
+        # 与停留区间一样随下一次trace写入一起提交
+        await self._execute_db_command(ENCOUNTER_UPSERT_QUERY,
+                                       encounter.as_row())
+
+    @asynccontextmanager
+    async def batch_traces(self):
+        r"""Buffer the trace rows recorded by the current task and hand
+        them to the trace writer together on exit, so they are committed in
+        the same transaction.
+        """
+        buffer = []
+        token = _trace_buffer.set(buffer)
+        try:
+            yield
+        finally:
+            _trace_buffer.reset(token)
+            if buffer:
+                # 交给writer时重新编号并发布，保证seq与写入和发布的顺序一致
+                rows = [(next_trace_seq(), *row[1:]) for row in buffer]
+                self._publish_traces(rows)
+                await self.trace_writer.write_many(rows)
+
+    async def _record_trace(self, user_id, action_type, action_info,
+                            current_time=None, room=None, duration=None):
         if current_time is None:
-            current_time = self.sandbox_clock.time_transfer(
-                datetime.now(), self.start_time)
-        print('Current time in sandbox:', current_time)
-        trace_insert_query = (
-            "INSERT INTO trace (user_id, created_at, action, info) "
-            "VALUES (?, ?, ?, ?)")
-        action_info_str = json.dumps(action_info)
-        await self._execute_db_command(
-            trace_insert_query,
-            (user_id, current_time, action_type, action_info_str),
-            commit=True
-        )
+            current_time = self.sandbox_clock.now(self.start_time)
+        args = trace_row(user_id, current_time, action_type, action_info,
+                         room, duration)
+        buffer = _trace_buffer.get()
+        if buffer is not None:
+            buffer.append(args)
+            return
+        self._publish_traces((args, ))
+        await self.trace_writer.write(args)
+
+    def _publish_traces(self, rows):
+        if self.trace_feed.num_subscribers == 0:
+            return
+        for row in rows:
+            self.trace_feed.publish(TraceEvent.from_row(row))
@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+from typing import Any, Iterable, Sequence
+
+import numpy as np
+
+
+def _as_post_ids(values: Sequence[Any]) -> np.ndarray:
+    if len(values) == 0:
+        return np.empty(0, dtype=np.int64)
+    return np.asarray(values)
+
+
+class RecMatrix:
+    r"""Recommended posts of users ``1..num_users`` in CSR form: the posts
+    of user ``u`` are ``post_ids[indptr[u - 1]:indptr[u]]``.
+
+    It behaves like the list format used before, ``[None, [posts of user
+    1], [posts of user 2], ...]``: :func:`len`, indexing (index ``0`` is
+    :obj:`None`, rows come back as lists), slicing, iteration and equality
+    with such lists all work as they did. Use :meth:`row` and :meth:`pairs`
+    for array access.
+
+    Args:
+        indptr (Sequence[int]): ``num_users + 1`` row offsets into
+            :obj:`post_ids`, starting at ``0``.
+        post_ids (Sequence): Post ids of all rows, one after another.
+    """
+
+    def __init__(self, indptr: Sequence[int], post_ids: Sequence[Any]):
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.post_ids = _as_post_ids(post_ids)
+        if (len(self.indptr) == 0 or self.indptr[0] != 0
+                or self.indptr[-1] != len(self.post_ids)
+                or np.any(np.diff(self.indptr) < 0)):
+            raise ValueError("indptr must rise from 0 to len(post_ids).")
+
+    @classmethod
+    def empty(cls, num_users: int) -> RecMatrix:
+        return cls(np.zeros(num_users + 1, dtype=np.int64), [])
+
+    @classmethod
+    def uniform(cls, num_users: int, post_ids: Sequence[Any]) -> RecMatrix:
+        r"""Every user gets the same :obj:`post_ids`."""
+        post_ids = _as_post_ids(post_ids)
+        indptr = np.arange(num_users + 1, dtype=np.int64) * len(post_ids)
+        return cls(indptr, np.tile(post_ids, num_users))
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Sequence[Any]]) -> RecMatrix:
+        r"""Build from the rows of users ``1..n``, without the leading
+        :obj:`None`.
+        """
+        rows = list(rows)
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum([len(row) for row in rows], out=indptr[1:])
+        return cls(indptr, [post_id for row in rows for post_id in row])
+
+    @classmethod
+    def from_lists(cls, matrix: Sequence[Sequence[Any] | None]) -> RecMatrix:
+        r"""Build from the list format ``[None, [...], [...], ...]``."""
+        if isinstance(matrix, RecMatrix):
+            return matrix
+        return cls.from_rows(matrix[1:])
+
+    @classmethod
+    def from_pairs(cls, num_users: int, user_ids: np.ndarray,
+                   post_ids: np.ndarray) -> RecMatrix:
+        r"""Build from ``(user_id, post_id)`` pairs, with user ids in
+        ``1..num_users``. Posts keep their order within a user.
+        """
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        order = np.argsort(user_ids, kind="stable")
+        counts = np.bincount(user_ids, minlength=num_users + 1)[1:]
+        indptr = np.zeros(num_users + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        return cls(indptr, _as_post_ids(post_ids)[order])
+
+    @property
+    def num_users(self) -> int:
+        return len(self.indptr) - 1
+
+    def row(self, user_id: int) -> np.ndarray:
+        r"""Return the posts of :obj:`user_id` as an array view."""
+        if not 1 <= user_id <= self.num_users:
+            raise IndexError(f"User {user_id} is out of range.")
+        return self.post_ids[self.indptr[user_id - 1]:self.indptr[user_id]]
+
+    def pairs(self) -> tuple[np.ndarray, np.ndarray]:
+        r"""Return the ``(user_ids, post_ids)`` arrays of all entries."""
+        user_ids = np.repeat(np.arange(1, self.num_users + 1),
+                             np.diff(self.indptr))
+        return user_ids, self.post_ids
+
+    def to_lists(self) -> list[list[Any] | None]:
+        post_ids = self.post_ids.tolist()
+        bounds = self.indptr.tolist()
+        return [None] + [
+            post_ids[start:end] for start, end in zip(bounds, bounds[1:])
+        ]
+
+    def __len__(self) -> int:
+        return self.num_users + 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.to_lists()[index]
+        if index < 0:
+            index += len(self)
+        if index == 0:
+            return None
+        return self.row(index).tolist()
+
+    def __iter__(self):
+        return iter(self.to_lists())
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, RecMatrix):
+            return (np.array_equal(self.indptr, other.indptr)
+                    and np.array_equal(self.post_ids, other.post_ids))
+        if isinstance(other, list):
+            return self.to_lists() == other
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return (f"RecMatrix(num_users={self.num_users}, "
+                f"num_recs={len(self.post_ids)})")
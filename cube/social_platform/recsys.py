@@ -1,4 +1,6 @@
 '''注意需要在写入rec_matrix的时候判断是否超过max_rec_post_len'''
+from __future__ import annotations
+
 import heapq
 import random
 from datetime import datetime
@@ -9,6 +11,7 @@ import numpy as np
 # init model
 from sentence_transformers import SentenceTransformer
 
+from .rec_matrix import RecMatrix
 from .typing import ActionType
 
 try:
@@ -18,11 +21,11 @@ except Exception as e:
     model = None
 
 
-def rec_sys_random(user_table: List[Dict[str,
-                                         Any]], post_table: List[Dict[str,
-                                                                      Any]],
-                   trace_table: List[Dict[str, Any]], rec_matrix: List[List],
-                   max_rec_post_len: int) -> List[List]:
+def rec_sys_random(user_table: List[Dict[str, Any]],
+                   post_table: List[Dict[str, Any]],
+                   trace_table: List[Dict[str, Any]],
+                   rec_matrix: RecMatrix | List[List],
+                   max_rec_post_len: int) -> RecMatrix:
     """
     Randomly recommend posts to users.
 
@@ -30,24 +33,24 @@ def rec_sys_random(user_table: List[Dict[str,
         user_table (List[Dict[str, Any]]): List of users.
         post_table (List[Dict[str, Any]]): List of posts.
         trace_table (List[Dict[str, Any]]): List of user interactions.
-        rec_matrix (List[List]): Existing recommendation matrix.
+        rec_matrix (RecMatrix | List[List]): Existing recommendation matrix,
+            only its number of users is used.
         max_rec_post_len (int): Maximum number of recommended posts.
 
     Returns:
-        List[List]: Updated recommendation matrix.
+        RecMatrix: Updated recommendation matrix.
     """
     # 获取所有推文的ID
     post_ids = [post['post_id'] for post in post_table]
 
     if len(post_ids) <= max_rec_post_len:
         # 如果推文数量小于等于最大推荐数，每个用户获得所有推文ID
-        new_rec_matrix = [post_ids] * (len(rec_matrix) - 1)
-        new_rec_matrix = [None] + new_rec_matrix
+        new_rec_matrix = RecMatrix.uniform(len(rec_matrix) - 1, post_ids)
     else:
-        new_rec_matrix = [None]
         # 如果推文数量大于最大推荐数，每个用户随机获得指定数量的推文ID
-        for _ in range(1, len(rec_matrix)):
-            new_rec_matrix.append(random.sample(post_ids, max_rec_post_len))
+        new_rec_matrix = RecMatrix.from_rows(
+            random.sample(post_ids, max_rec_post_len)
+            for _ in range(1, len(rec_matrix)))
 
     return new_rec_matrix
 
@@ -82,26 +85,27 @@ def calculate_hot_score(num_likes: int, num_dislikes: int,
     return round(sign * order + seconds / 45000, 7)
 
 
-def rec_sys_reddit(post_table: List[Dict[str, Any]], rec_matrix: List[List],
-                   max_rec_post_len: int) -> List[List]:
+def rec_sys_reddit(post_table: List[Dict[str, Any]],
+                   rec_matrix: RecMatrix | List[List],
+                   max_rec_post_len: int) -> RecMatrix:
     """
     Recommend posts based on Reddit-like hot score.
 
     Args:
         post_table (List[Dict[str, Any]]): List of posts.
-        rec_matrix (List[List]): Existing recommendation matrix.
+        rec_matrix (RecMatrix | List[List]): Existing recommendation matrix,
+            only its number of users is used.
         max_rec_post_len (int): Maximum number of recommended posts.
 
     Returns:
-        List[List]: Updated recommendation matrix.
+        RecMatrix: Updated recommendation matrix.
     """
     # 获取所有推文的ID
     post_ids = [post['post_id'] for post in post_table]
 
     if len(post_ids) <= max_rec_post_len:
         # 如果推文数量小于等于最大推荐数，每个用户获得所有推文ID
-        new_rec_matrix = [post_ids] * (len(rec_matrix) - 1)
-        new_rec_matrix = [None] + new_rec_matrix
+        new_rec_matrix = RecMatrix.uniform(len(rec_matrix) - 1, post_ids)
     else:
         # 该推荐系统的时间复杂度是O(post_num * log max_rec_post_len)
         all_hot_score = []
@@ -119,19 +123,17 @@ def rec_sys_reddit(post_table: List[Dict[str, Any]], rec_matrix: List[List],
                                    key=lambda x: x[0])
         top_post_ids = [post_id for _, post_id in top_posts]
 
-        new_rec_matrix = [None]
-        # 如果推文数量大于最大推荐数，每个用户随机获得指定数量的推文ID
-        new_rec_matrix = [top_post_ids] * (len(rec_matrix) - 1)
-        new_rec_matrix = [None] + new_rec_matrix
+        new_rec_matrix = RecMatrix.uniform(
+            len(rec_matrix) - 1, top_post_ids)
 
     return new_rec_matrix
 
 
 def rec_sys_personalized(user_table: List[Dict[str, Any]],
                          post_table: List[Dict[str, Any]],
-                         trace_table: List[Dict[str,
-                                                Any]], rec_matrix: List[List],
-                         max_rec_post_len: int) -> List[List]:
+                         trace_table: List[Dict[str, Any]],
+                         rec_matrix: RecMatrix | List[List],
+                         max_rec_post_len: int) -> RecMatrix:
     """
     Recommend posts based on personalized similarity scores.
 
@@ -139,21 +141,21 @@ def rec_sys_personalized(user_table: List[Dict[str, Any]],
         user_table (List[Dict[str, Any]]): List of users.
         post_table (List[Dict[str, Any]]): List of posts.
         trace_table (List[Dict[str, Any]]): List of user interactions.
-        rec_matrix (List[List]): Existing recommendation matrix.
+        rec_matrix (RecMatrix | List[List]): Existing recommendation matrix,
+            only its number of users is used.
         max_rec_post_len (int): Maximum number of recommended posts.
 
     Returns:
-        List[List]: Updated recommendation matrix.
+        RecMatrix: Updated recommendation matrix.
     """
     # 获取所有推文的ID
     post_ids = [post['post_id'] for post in post_table]
 
     if len(post_ids) <= max_rec_post_len:
         # 如果推文数量小于等于最大推荐数，每个用户获得所有推文ID
-        new_rec_matrix = [post_ids] * (len(rec_matrix) - 1)
-        new_rec_matrix = [None] + new_rec_matrix
+        new_rec_matrix = RecMatrix.uniform(len(rec_matrix) - 1, post_ids)
     else:
-        new_rec_matrix = [None]
+        rec_rows = []
         # 如果推文数量大于最大推荐数，每个用户随机获得personalized推文ID
         for idx in range(1, len(rec_matrix)):
             user_id = user_table[idx - 1]['user_id']
@@ -183,7 +185,8 @@ def rec_sys_personalized(user_table: List[Dict[str, Any]],
             rec_post_ids = [
                 post_id for post_id, _ in post_scores[:max_rec_post_len]
             ]
-            new_rec_matrix.append(rec_post_ids)
+            rec_rows.append(rec_post_ids)
+        new_rec_matrix = RecMatrix.from_rows(rec_rows)
 
     return new_rec_matrix
 
@@ -265,10 +268,10 @@ def rec_sys_personalized_with_trace(
     user_table: List[Dict[str, Any]],
     post_table: List[Dict[str, Any]],
     trace_table: List[Dict[str, Any]],
-    rec_matrix: List[List],
+    rec_matrix: RecMatrix | List[List],
     max_rec_post_len: int,
     swap_rate: float = 0.1,
-) -> List[List]:
+) -> RecMatrix:
     """
     This version:
     1. If the number of posts is less than or equal to the maximum
@@ -288,21 +291,21 @@ def rec_sys_personalized_with_trace(
         user_table (List[Dict[str, Any]]): List of users.
         post_table (List[Dict[str, Any]]): List of posts.
         trace_table (List[Dict[str, Any]]): List of user interactions.
-        rec_matrix (List[List]): Existing recommendation matrix.
+        rec_matrix (RecMatrix | List[List]): Existing recommendation matrix,
+            only its number of users is used.
         max_rec_post_len (int): Maximum number of recommended posts.
         swap_rate (float): Percentage of posts to swap for diversity.
 
     Returns:
-        List[List]: Updated recommendation matrix.
+        RecMatrix: Updated recommendation matrix.
     """
     # 获取所有推文的ID
     post_ids = [post['post_id'] for post in post_table]
     if len(post_ids) <= max_rec_post_len:
         # 如果推文数量小于等于最大推荐数，每个用户获得所有推文ID
-        new_rec_matrix = [post_ids] * (len(rec_matrix) - 1)
-        new_rec_matrix = [None] + new_rec_matrix
+        new_rec_matrix = RecMatrix.uniform(len(rec_matrix) - 1, post_ids)
     else:
-        new_rec_matrix = [None]
+        rec_rows = []
         # 如果推文数量大于最大推荐数，每个用户随机获得personalized推文ID
         for idx in range(1, len(rec_matrix)):
             user_id = user_table[idx - 1]['user_id']
@@ -375,6 +378,7 @@ def rec_sys_personalized_with_trace(
                 rec_post_ids = swap_random_posts(rec_post_ids, swap_free_ids,
                                                  swap_rate)
 
-            new_rec_matrix.append(rec_post_ids)
+            rec_rows.append(rec_post_ids)
+        new_rec_matrix = RecMatrix.from_rows(rec_rows)
 
     return new_rec_matrix
@@ -0,0 +1,230 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import os
+import pickle
+import struct
+from typing import Any
+
+from cube.social_platform.channel import Channel
+from cube.social_platform.typing import CommunityActionType
+
+# 每帧以4字节的大端长度开头，后面是pickle序列化的消息
+_HEADER = struct.Struct("!I")
+
+
+def encode_frame(message: Any) -> bytes:
+    payload = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    return _HEADER.pack(len(payload)) + payload
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Any:
+    r"""Read one frame, or return :obj:`None` at the end of the stream."""
+    try:
+        header = await reader.readexactly(_HEADER.size)
+        (length, ) = _HEADER.unpack(header)
+        return pickle.loads(await reader.readexactly(length))
+    except asyncio.IncompleteReadError:
+        return None
+
+
+class ChannelServer:
+    r"""Expose a :obj:`Channel` to agents running in other processes.
+
+    Every request read from a connection is written to :obj:`channel` as if
+    it came from a local agent, and its response is written back on the
+    same connection. The :obj:`Platform` keeps reading the local channel
+    and stays the only writer of the database. Frames are pickled, so only
+    listen on addresses reachable by trusted processes.
+
+    Args:
+        channel (Channel): The channel read by the platform.
+        address (str | tuple[str, int]): Path of a unix socket, or a
+            ``(host, port)`` pair to listen on TCP.
+    """
+
+    def __init__(self, channel: Channel, address: str | tuple[str, int]):
+        self.channel = channel
+        self.address = address
+        self._server: asyncio.AbstractServer | None = None
+        self._tasks: set[asyncio.Task] = set()
+        self._writers: set[asyncio.StreamWriter] = set()
+
+    async def start(self):
+        if isinstance(self.address, str):
+            if os.path.exists(self.address):
+                os.remove(self.address)
+            self._server = await asyncio.start_unix_server(
+                self._handle_connection, self.address)
+        else:
+            host, port = self.address
+            self._server = await asyncio.start_server(
+                self._handle_connection, host, port)
+        return self
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            # 断开已有的连接，客户端会在下一次请求时重新连接
+            for writer in list(self._writers):
+                writer.close()
+            await self._server.wait_closed()
+            self._server = None
+        for task in list(self._tasks):
+            task.cancel()
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.remove(self.address)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader,
+                                 writer: asyncio.StreamWriter):
+        requests: dict[int, asyncio.Task] = {}
+        self._writers.add(writer)
+        try:
+            while True:
+                frame = await read_frame(reader)
+                if frame is None:
+                    break
+                if len(frame) == 1:
+                    # 客户端取消了请求
+                    task = requests.get(frame[0])
+                    if task is not None:
+                        task.cancel()
+                    continue
+                request_id, action_info, lane, timeout = frame
+                task = asyncio.create_task(
+                    self._forward(request_id, action_info, lane, timeout,
+                                  writer))
+                requests[request_id] = task
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+                task.add_done_callback(
+                    lambda _, request_id=request_id: requests.pop(
+                        request_id, None))
+        finally:
+            # 连接断开后，它的请求不会再有人读取
+            for task in list(requests.values()):
+                task.cancel()
+            self._writers.discard(writer)
+            writer.close()
+
+    async def _forward(self, request_id: int, action_info: Any,
+                       lane: str | None, timeout: float | None,
+                       writer: asyncio.StreamWriter):
+        message_id = await self.channel.write_to_receive_queue(
+            action_info, lane, timeout)
+        try:
+            response = await self.channel.read_from_send_queue(message_id)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            # 客户端已经超时或取消，请求在本地Channel中也已取消
+            return
+        if writer.is_closing():
+            return
+        # 换回客户端自己的请求编号
+        writer.write(encode_frame((request_id, *response[1:])))
+        await writer.drain()
+
+
+class RemoteChannel:
+    r"""Agent-side channel connected to a :obj:`ChannelServer` in the
+    platform process. It offers the same :meth:`write_to_receive_queue`,
+    :meth:`write_batch_to_receive_queue` and :meth:`read_from_send_queue`
+    as :obj:`Channel`, so agents can be created with it unchanged in worker
+    processes. Responses, deadlines and metrics are kept by a local
+    :obj:`Channel`, which is never read by a platform.
+
+    Args:
+        address (str | tuple[str, int]): Address of the server.
+        metrics_path (str, optional): See :obj:`Channel`.
+            (default: :obj:`None`)
+    """
+
+    def __init__(self, address: str | tuple[str, int],
+                 metrics_path: str | None = None):
+        self.address = address
+        self.channel = Channel(metrics_path)
+        # 本地超时或取消的请求，也要通知服务器取消
+        self.channel.add_cancel_listener(self._send_cancel)
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._reader_task: asyncio.Task | None = None
+        self._connect_lock = asyncio.Lock()
+        self._request_ids = itertools.count()
+
+    async def connect(self):
+        async with self._connect_lock:
+            if self._writer is not None:
+                return self
+            if isinstance(self.address, str):
+                reader, writer = await asyncio.open_unix_connection(
+                    self.address)
+            else:
+                host, port = self.address
+                reader, writer = await asyncio.open_connection(host, port)
+            self._reader, self._writer = reader, writer
+            self._reader_task = asyncio.create_task(self._read_responses())
+        return self
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            await self._writer.wait_closed()
+            self._writer = None
+        if self._reader_task is not None:
+            await self._reader_task
+            self._reader_task = None
+
+    async def _read_responses(self):
+        while True:
+            message = await read_frame(self._reader)
+            if message is None:
+                break
+            await self.channel.send_to(message)
+        # 服务器断开时清空连接，下一次请求会重新连接
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+        # 连接断开后，等待中的请求不会再有响应
+        for future in self.channel.pending.values():
+            if not future.done():
+                future.set_exception(
+                    ConnectionError("Channel server closed the connection"))
+
+    def _send_cancel(self, message_id):
+        if self._writer is not None:
+            # 通知服务器取消平台上的处理任务
+            self._writer.write(encode_frame((message_id, )))
+
+    async def write_to_receive_queue(self, action_info,
+                                     lane: str | None = None,
+                                     timeout: float | None = None):
+        await self.connect()
+        request_id = next(self._request_ids)
+        self.channel.register_request(request_id, action_info, timeout)
+        timeout = self.channel.request_timeout if timeout is None else timeout
+        self._writer.write(
+            encode_frame((request_id, action_info, lane, timeout)))
+        await self._writer.drain()
+        return request_id
+
+    async def write_batch_to_receive_queue(
+            self, agent_id: Any, actions: list[tuple[Any, str]],
+            lane: str | None = None, timeout: float | None = None) -> int:
+        r"""See :meth:`Channel.write_batch_to_receive_queue`."""
+        return await self.write_to_receive_queue(
+            (agent_id, list(actions), CommunityActionType.BATCH.value), lane,
+            timeout)
+
+    async def read_from_send_queue(self, message_id,
+                                   timeout: float | None = None):
+        r"""See :meth:`Channel.read_from_send_queue`."""
+        return await self.channel.read_from_send_queue(message_id, timeout)
+
+    def cancel(self, message_id) -> bool:
+        return self.channel.cancel(message_id)
+
+    def metrics(self) -> dict[str, Any]:
+        return self.channel.metrics()
+
+    def dump_metrics(self, path: str | None = None):
+        self.channel.dump_metrics(path)
@@ -0,0 +1,15 @@
+-- This is the schema definition for the encounter table
+-- 每对agent一行，agent_a在前；count是相遇次数，双方对同一次相遇的记录只算一次
+CREATE TABLE IF NOT EXISTS encounter (
+    agent_a INTEGER,
+    agent_b INTEGER,
+    count INTEGER NOT NULL,
+    first_time DATETIME,
+    last_time DATETIME,
+    -- 最近一次相遇的房间，走路途中相遇时为NULL
+    room TEXT,
+    PRIMARY KEY(agent_a, agent_b),
+    FOREIGN KEY(agent_a) REFERENCES user(user_id),
+    FOREIGN KEY(agent_b) REFERENCES user(user_id)
+);
+CREATE INDEX IF NOT EXISTS encounter_agent_b ON encounter(agent_b);
@@ -0,0 +1,19 @@
+-- This is the schema definition for the stay table
+-- 每行是agent在一个房间里连续停留、活动不变的一段时间，exit_time为NULL表示仍在停留
+CREATE TABLE IF NOT EXISTS stay (
+    stay_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER,
+    room TEXT,
+    activity TEXT,
+    enter_time DATETIME,
+    exit_time DATETIME,
+    FOREIGN KEY(user_id) REFERENCES user(user_id)
+);
+-- 按agent或按房间查询某一时刻或某段时间的停留
+CREATE INDEX IF NOT EXISTS stay_user_time
+    ON stay(user_id, enter_time, exit_time);
+CREATE INDEX IF NOT EXISTS stay_room_time
+    ON stay(room, enter_time, exit_time);
+-- 结束停留时查找agent当前的停留
+CREATE INDEX IF NOT EXISTS stay_open
+    ON stay(user_id) WHERE exit_time IS NULL;
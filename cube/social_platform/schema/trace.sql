@@ -1,9 +1,27 @@
 -- This is the schema definition for the trace table
-CREATE TABLE trace (
+-- trace_id是代理主键，同一agent在同一沙盒时刻可以有多条记录，例如逻辑移动模式下的meet和arrived
+-- seq是记录时取的单调递增序号，沙盒时刻相同时用它排序，分片合并后依然有效
+CREATE TABLE IF NOT EXISTS trace (
+    trace_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    seq INTEGER NOT NULL,
     user_id INTEGER,
     created_at DATETIME,
     action TEXT,
     info TEXT,
-    PRIMARY KEY(user_id, created_at),
+    -- 从info中取出的常用字段，写入时填好，查询时不必解析JSON
+    room TEXT,
+    activity TEXT,
+    other_agent_id INTEGER,
+    duration INTEGER,
     FOREIGN KEY(user_id) REFERENCES user(user_id)
 );
+-- 按agent或按动作查询一段时间内的记录
+CREATE INDEX IF NOT EXISTS trace_user_time
+    ON trace(user_id, created_at, seq);
+CREATE INDEX IF NOT EXISTS trace_action_time
+    ON trace(action, created_at, seq);
+-- 例如查询某个房间里的所有相遇
+CREATE INDEX IF NOT EXISTS trace_room_action_time
+    ON trace(room, action, created_at);
+-- 实时订阅按seq补读
+CREATE INDEX IF NOT EXISTS trace_seq ON trace(seq);
@@ -0,0 +1,395 @@
+from __future__ import annotations
+
+import asyncio
+import multiprocessing as mp
+import os
+import os.path as osp
+import queue
+import sqlite3
+import zlib
+from datetime import datetime
+from typing import Any, Callable
+
+from cube.clock.clock import BaseClock
+from cube.clock.virtual_clock import VirtualClock
+from cube.social_platform.database import (ENCOUNTER_COLUMNS, STAY_COLUMNS,
+                                           TRACE_COLUMNS, create_db_async)
+from cube.social_platform.typing import CommunityActionType, MovementMode
+from cube.social_platform.unity_api.unity_queue_manager import \
+    UnityQueueManager
+
+# 分片进程收件箱中的消息类型
+_REQUEST = "request"
+_UNITY = "unity"
+_CANCEL = "cancel"
+_EXIT = "exit"
+# 转发线程检查分片进程是否还活着的间隔秒数
+_LIVENESS_INTERVAL = 0.5
+
+
+def shard_for(agent_id: Any, num_shards: int) -> int:
+    r"""Return the index of the shard that owns :obj:`agent_id`. Numeric
+    ids are spread round-robin, other ids by a stable hash.
+    """
+    try:
+        return int(agent_id) % num_shards
+    except (TypeError, ValueError):
+        return zlib.crc32(str(agent_id).encode("utf-8")) % num_shards
+
+
+def get_shard_db_path(db_path: str, shard_id: int) -> str:
+    root, ext = osp.splitext(db_path)
+    return f"{root}.shard{shard_id}{ext}"
+
+
+def merge_shard_traces(db_path: str, shard_db_paths: list[str]) -> int:
+    r"""Copy the trace rows of every shard database into :obj:`db_path`,
+    in sandbox time order. Rows at the same sandbox time keep the order
+    given by their :obj:`seq`, and get new :obj:`trace_id` values. The stay
+    intervals are copied as well, ordered by their enter time, and the
+    encounters of a pair seen by two shards are combined.
+
+    Returns:
+        int: The number of merged trace rows.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        for i, shard_db_path in enumerate(shard_db_paths):
+            conn.execute(f"ATTACH DATABASE ? AS shard{i}", (shard_db_path, ))
+        merged = _merge_table(conn, "trace", TRACE_COLUMNS,
+                              "created_at, seq", len(shard_db_paths))
+        _merge_table(conn, "stay", STAY_COLUMNS, "enter_time, user_id",
+                     len(shard_db_paths))
+        _merge_encounters(conn, len(shard_db_paths))
+        conn.commit()
+        for i in range(len(shard_db_paths)):
+            conn.execute(f"DETACH DATABASE shard{i}")
+        return merged
+    finally:
+        conn.close()
+
+
+def _merge_table(conn: sqlite3.Connection, table_name: str,
+                 columns: tuple[str, ...], order_by: str,
+                 num_shards: int) -> int:
+    columns = ", ".join(columns)
+    union = " UNION ALL ".join(f"SELECT {columns} FROM shard{i}.{table_name}"
+                               for i in range(num_shards))
+    cursor = conn.execute(f"INSERT INTO {table_name} ({columns}) "
+                          f"SELECT {columns} FROM ({union}) "
+                          f"ORDER BY {order_by}")
+    return cursor.rowcount
+
+
+def _merge_encounters(conn: sqlite3.Connection, num_shards: int):
+    # 两个agent在不同分片时，每个分片都记录了自己一方的相遇，
+    # 次数取较大者，时间取并集，房间取最近一次相遇的
+    columns = ", ".join(ENCOUNTER_COLUMNS)
+    merged: dict[tuple, list] = {}
+    for i in range(num_shards):
+        for row in conn.execute(f"SELECT {columns} FROM shard{i}.encounter"):
+            agent_a, agent_b, count, first_time, last_time, room = row
+            encounter = merged.get((agent_a, agent_b))
+            if encounter is None:
+                merged[(agent_a, agent_b)] = list(row)
+                continue
+            encounter[2] = max(encounter[2], count)
+            encounter[3] = min(encounter[3], first_time)
+            if last_time > encounter[4]:
+                encounter[4] = last_time
+                encounter[5] = room
+    conn.executemany(
+        f"INSERT INTO encounter ({columns}) "
+        f"VALUES ({', '.join('?' * len(ENCOUNTER_COLUMNS))})",
+        merged.values())
+
+
+class ShardChannel:
+    r"""Platform-side channel of a shard process. Requests, cancellations
+    and Unity messages arrive on :obj:`inbox`, responses go out on
+    :obj:`outbox`.
+    """
+
+    def __init__(self, inbox: mp.Queue, outbox: mp.Queue,
+                 unity_queue_manager: UnityQueueManager):
+        self.inbox = inbox
+        self.outbox = outbox
+        self.unity_queue_mgr = unity_queue_manager
+        self._cancel_listeners: list[Callable[[Any], None]] = []
+
+    def add_cancel_listener(self, listener: Callable[[Any], None]):
+        r"""Call :obj:`listener` with the message id of every request
+        cancelled by the router.
+        """
+        self._cancel_listeners.append(listener)
+
+    async def receive_from(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            kind, *payload = await loop.run_in_executor(None, self.inbox.get)
+            if kind == _REQUEST:
+                message_id, data = payload
+                return message_id, data
+            if kind == _UNITY:
+                agent_id, message = payload
+                await self.unity_queue_mgr.put_message(agent_id, message)
+            elif kind == _CANCEL:
+                message_id, = payload
+                for listener in self._cancel_listeners:
+                    listener(message_id)
+            elif kind == _EXIT:
+                return None, (None, None, CommunityActionType.EXIT)
+
+    async def send_to(self, message):
+        self.outbox.put(message)
+
+
+async def _shard_main(db_path: str, agent_ids: list[str],
+                      sandbox_clock: BaseClock, start_time: datetime,
+                      inbox: mp.Queue, outbox: mp.Queue,
+                      platform_kwargs: dict[str, Any]):
+    from cube.social_platform.platform import Platform
+    from cube.social_platform.unity_api.unity_server import message_sender
+
+    sender_task = None
+    try:
+        unity_queue_mgr = UnityQueueManager(agent_ids)
+        channel = ShardChannel(inbox, outbox, unity_queue_mgr)
+        platform = Platform(db_path, channel, unity_queue_mgr, sandbox_clock,
+                            start_time, **platform_kwargs)
+        await platform.create_async_db()
+        # 每个分片自己把位置和STOP指令发给Unity
+        sender_task = asyncio.create_task(message_sender())
+        await platform.running()
+    finally:
+        # 启动失败时也要发出结束标记，路由进程根据退出码判断分片是否出错
+        if sender_task is not None:
+            sender_task.cancel()
+        outbox.put(None)
+
+
+def _run_shard(*args):
+    asyncio.run(_shard_main(*args))
+
+
+class ShardUnityForwarder:
+    r"""Stands in for :obj:`UnityQueueManager` in the router process and
+    forwards every Unity message to the shard owning the agent.
+    """
+
+    def __init__(self, sharded_platform: ShardedPlatform):
+        self.sharded_platform = sharded_platform
+
+    async def put_message(self, agent_id: str, message: dict):
+        shard_id = shard_for(agent_id, self.sharded_platform.num_shards)
+        self.sharded_platform.inboxes[shard_id].put(
+            (_UNITY, agent_id, message))
+
+
+class ShardedPlatform:
+    r"""Run the platform as :obj:`num_shards` worker processes.
+
+    Every worker owns the agents with :obj:`shard_for(agent_id) == i`, runs
+    its own :obj:`Platform` and writes its trace rows to its own database.
+    This router reads the shared :obj:`Channel`, forwards each request to
+    the owning worker and relays the responses back. Unity messages are
+    forwarded the same way when :attr:`unity_queue_mgr` is passed to
+    :obj:`start_server`, and so are the cancellations of requests that time
+    out or are cancelled on the agent side. On EXIT the shard traces are
+    merged into :obj:`db_path`.
+
+    If a worker dies, the requests it had not answered get an error
+    response, the other workers are stopped and :meth:`running` raises.
+
+    Only the Unity movement mode is supported: in the logical mode meets
+    are found from the room occupants a worker knows, so two agents of
+    different workers in the same room would never meet.
+
+    Args:
+        db_path (str): Path of the merged database.
+        channel (Channel): The channel shared with the agents.
+        agent_ids (list[str]): Ids of all agents.
+        sandbox_clock (BaseClock): The sandbox clock. Must be a real-time
+            :obj:`Clock`, which is copied to every worker.
+        start_time (datetime): Sandbox start time.
+        num_shards (int): Number of worker processes. (default: :obj:`2`)
+        **platform_kwargs: Extra keyword arguments of :obj:`Platform`.
+
+    Raises:
+        ValueError: For a :obj:`VirtualClock`, the logical movement mode or
+            :obj:`platform_kwargs` that :obj:`Platform` rejects.
+    """
+
+    def __init__(self, db_path: str, channel: Any, agent_ids: list[str],
+                 sandbox_clock: BaseClock, start_time: datetime,
+                 num_shards: int = 2, **platform_kwargs):
+        if isinstance(sandbox_clock, VirtualClock):
+            raise ValueError("ShardedPlatform needs a real-time Clock, a "
+                             "VirtualClock cannot be shared by processes.")
+        movement_mode = platform_kwargs.get("movement_mode",
+                                            MovementMode.UNITY)
+        if MovementMode(movement_mode) == MovementMode.LOGICAL:
+            raise ValueError("ShardedPlatform does not support the logical "
+                             "movement mode, agents of different shards "
+                             "would never meet.")
+        from cube.social_platform.platform import Platform
+
+        # 在启动分片进程之前检查参数，否则错误只会出现在子进程里
+        try:
+            Platform(db_path, None, UnityQueueManager([]), sandbox_clock,
+                     start_time, **platform_kwargs)
+        except TypeError as e:
+            raise ValueError(f"Invalid platform_kwargs: {e}") from e
+        self.db_path = db_path
+        self.channel = channel
+        self.sandbox_clock = sandbox_clock
+        self.start_time = start_time
+        self.num_shards = num_shards
+        self.platform_kwargs = platform_kwargs
+        self.shard_agent_ids: list[list[str]] = [[] for _ in range(num_shards)]
+        for agent_id in agent_ids:
+            self.shard_agent_ids[shard_for(agent_id,
+                                           num_shards)].append(agent_id)
+        self.shard_db_paths = [
+            get_shard_db_path(db_path, i) for i in range(num_shards)
+        ]
+        # fork一个正在运行事件循环的进程并不安全，因此使用spawn
+        self._mp_context = mp.get_context("spawn")
+        self.inboxes = [self._mp_context.Queue() for _ in range(num_shards)]
+        self.outboxes = [self._mp_context.Queue() for _ in range(num_shards)]
+        self.processes: list[mp.Process] = []
+        self.unity_queue_mgr = ShardUnityForwarder(self)
+        # 已转发、尚未响应的请求所在的分片和所属的agent
+        self._request_shards: dict[Any, tuple[int, Any]] = {}
+        add_cancel_listener = getattr(self.channel, "add_cancel_listener",
+                                      None)
+        if add_cancel_listener is not None:
+            add_cancel_listener(self._cancel_message)
+
+    async def create_async_db(self):
+        await create_db_async(self.db_path)
+        return self
+
+    def start(self):
+        for shard_db_path in self.shard_db_paths:
+            # 上一次运行遗留的分片数据库会被重复合并
+            if os.path.exists(shard_db_path):
+                os.remove(shard_db_path)
+        for i in range(self.num_shards):
+            process = self._mp_context.Process(
+                target=_run_shard,
+                args=(self.shard_db_paths[i], self.shard_agent_ids[i],
+                      self.sandbox_clock, self.start_time, self.inboxes[i],
+                      self.outboxes[i], self.platform_kwargs),
+                daemon=True,
+            )
+            process.start()
+            self.processes.append(process)
+
+    async def running(self):
+        r"""Route requests until EXIT, then merge the shard traces.
+
+        Raises:
+            RuntimeError: If a worker process died.
+        """
+        if not self.processes:
+            self.start()
+        loop = asyncio.get_running_loop()
+        relays = [
+            asyncio.create_task(self._relay_responses(i))
+            for i in range(self.num_shards)
+        ]
+        router = asyncio.create_task(self._route_requests())
+        try:
+            await asyncio.gather(router, *relays)
+        except Exception:
+            router.cancel()
+            await self._stop_after_failure(relays)
+            raise
+        for process in self.processes:
+            await loop.run_in_executor(None, process.join)
+        await loop.run_in_executor(None, merge_shard_traces, self.db_path,
+                                   self.shard_db_paths)
+        dump_metrics = getattr(self.channel, "dump_metrics", None)
+        if dump_metrics is not None:
+            dump_metrics()
+
+    async def _route_requests(self):
+        while True:
+            message_id, data = await self.channel.receive_from()
+            if data[2] == CommunityActionType.EXIT:
+                # 越过的请求先转发给分片，分片的收件箱按顺序处理
+                receive_queued = getattr(self.channel, "receive_queued", None)
+                if receive_queued is not None:
+                    for queued_id, queued_data in receive_queued():
+                        self._forward_request(queued_id, queued_data)
+                for inbox in self.inboxes:
+                    inbox.put((_EXIT, ))
+                return
+            self._forward_request(message_id, data)
+
+    def _forward_request(self, message_id, data):
+        shard_id = shard_for(data[0], self.num_shards)
+        self._request_shards[message_id] = (shard_id, data[0])
+        self.inboxes[shard_id].put((_REQUEST, message_id, data))
+
+    async def _stop_after_failure(self, relays: list[asyncio.Task]):
+        # 其余分片处理完手上的请求后退出
+        for inbox in self.inboxes:
+            inbox.put((_EXIT, ))
+        await asyncio.gather(*relays, return_exceptions=True)
+        error = "Platform shard failed"
+        for message_id, (_, agent_id) in list(self._request_shards.items()):
+            await self.channel.send_to((message_id, agent_id, {
+                "success": False,
+                "error": error
+            }))
+        self._request_shards.clear()
+        reject = getattr(self.channel, "reject_queued_requests", None)
+        if reject is not None:
+            await reject(error)
+        loop = asyncio.get_running_loop()
+        for process in self.processes:
+            await loop.run_in_executor(None, process.join, _LIVENESS_INTERVAL)
+            if process.is_alive():
+                process.terminate()
+
+    def _cancel_message(self, message_id):
+        # 仍在Channel中排队的请求不会被转发，不用通知分片
+        shard = self._request_shards.pop(message_id, None)
+        if shard is not None:
+            self.inboxes[shard[0]].put((_CANCEL, message_id))
+
+    async def _relay_responses(self, shard_id: int):
+        loop = asyncio.get_running_loop()
+        outbox = self.outboxes[shard_id]
+        process = self.processes[shard_id]
+        while True:
+            try:
+                message = await loop.run_in_executor(
+                    None, outbox.get, True, _LIVENESS_INTERVAL)
+            except queue.Empty:
+                # 被杀死的分片进程来不及发出结束标记
+                if process.is_alive():
+                    continue
+                message = None
+            if message is None:
+                break
+            self._request_shards.pop(message[0], None)
+            await self.channel.send_to(message)
+        await loop.run_in_executor(None, process.join)
+        if process.exitcode != 0:
+            await self._fail_shard_requests(shard_id)
+            raise RuntimeError(f"Platform shard {shard_id} exited with code "
+                               f"{process.exitcode}")
+
+    async def _fail_shard_requests(self, shard_id: int):
+        for message_id, (request_shard, agent_id) in list(
+                self._request_shards.items()):
+            if request_shard != shard_id:
+                continue
+            del self._request_shards[message_id]
+            await self.channel.send_to((message_id, agent_id, {
+                "success": False,
+                "error": f"Platform shard {shard_id} failed"
+            }))
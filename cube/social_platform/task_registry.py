@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import asyncio
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import Any, AsyncIterator, Callable, Coroutine
+
+
+class TaskRegistry:
+    r"""Keep track of the platform's in-flight handler tasks.
+
+    Finished tasks remove themselves in a done-callback, so registering and
+    retiring a task is O(1). At most :obj:`max_in_flight` tasks run handler
+    code at a time: :meth:`submit` waits for a free slot, which pushes back
+    on the channel reader while the handlers are busy. Requests of the same
+    agent run one after another in the order they were submitted.
+
+    A slot bounds the handlers doing work, not the tasks alive: a task gives
+    its slot back while it sleeps on the sandbox clock (see
+    :meth:`yield_slot`) or waits behind an earlier request of its agent, so
+    :attr:`backlog` can grow past :obj:`max_in_flight`. Otherwise sleeping
+    handlers could fill every slot and keep the requests that would let a
+    discrete-event clock move on from ever starting.
+
+    Args:
+        max_in_flight (int): Maximum number of tasks running handler code at
+            the same time. Sleeping and queued tasks are not counted.
+            (default: :obj:`1024`)
+    """
+
+    def __init__(self, max_in_flight: int = 1024):
+        self.max_in_flight = max_in_flight
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._tasks: set[asyncio.Task] = set()
+        self._agent_locks: dict[Any, asyncio.Lock] = {}
+        self._agent_pending: dict[Any, int] = {}
+        # 暂时让出了名额的任务
+        self._yielded: set[asyncio.Task] = set()
+
+    @property
+    def backlog(self) -> int:
+        r"""Number of submitted tasks that have not finished yet."""
+        return len(self._tasks)
+
+    @property
+    def waiting(self) -> int:
+        r"""Number of submitted tasks queued behind an earlier request of
+        the same agent.
+        """
+        return sum(self._agent_pending.values()) - sum(
+            1 for lock in self._agent_locks.values() if lock.locked())
+
+    async def submit(
+            self, agent_id: Any, coro: Coroutine[Any, Any, Any],
+            on_start: Callable[[], None] | None = None) -> asyncio.Task:
+        r"""Schedule :obj:`coro` as a task once a slot is free.
+
+        Args:
+            agent_id (Any): The agent the request belongs to. Requests with
+                the same id are run in submission order.
+            coro (Coroutine): The handler coroutine.
+            on_start (Callable[[], None], optional): Called in the first
+                step of the task, before it waits for earlier requests of
+                the agent. (default: :obj:`None`)
+
+        Returns:
+            asyncio.Task: The task running the handler.
+        """
+        await self._semaphore.acquire()
+        lock = self._agent_locks.get(agent_id)
+        if lock is None:
+            lock = self._agent_locks[agent_id] = asyncio.Lock()
+        self._agent_pending[agent_id] = self._agent_pending.get(agent_id,
+                                                                0) + 1
+        task = asyncio.create_task(self._run(lock, coro, on_start))
+        self._tasks.add(task)
+        task.add_done_callback(partial(self._on_done, agent_id, coro))
+        return task
+
+    async def drain(self):
+        r"""Wait until every submitted task has finished."""
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    @asynccontextmanager
+    async def yield_slot(self) -> AsyncIterator[None]:
+        r"""Give up the slot of the current task while it waits, e.g. for
+        a sandbox-clock deadline, and take one again afterwards. Does
+        nothing outside a task of this registry.
+        """
+        task = asyncio.current_task()
+        if task not in self._tasks or task in self._yielded:
+            yield
+            return
+        self._give_slot(task)
+        try:
+            yield
+        finally:
+            await self._take_slot(task)
+
+    def _give_slot(self, task: asyncio.Task):
+        self._yielded.add(task)
+        self._semaphore.release()
+
+    async def _take_slot(self, task: asyncio.Task):
+        # 等待名额时被取消，任务已经没有名额，结束时不再归还
+        await self._semaphore.acquire()
+        self._yielded.discard(task)
+
+    async def _run(self, lock: asyncio.Lock, coro: Coroutine[Any, Any, Any],
+                   on_start: Callable[[], None] | None) -> Any:
+        if on_start is not None:
+            on_start()
+        if lock.locked():
+            # 排在同一agent之前的请求后面，等待期间不占名额
+            task = asyncio.current_task()
+            self._give_slot(task)
+            await lock.acquire()
+            try:
+                await self._take_slot(task)
+            except BaseException:
+                lock.release()
+                raise
+        else:
+            await lock.acquire()
+        try:
+            return await coro
+        finally:
+            lock.release()
+
+    def _on_done(self, agent_id: Any, coro: Coroutine[Any, Any, Any],
+                 task: asyncio.Task):
+        # 任务在开始前被取消时，关闭协程以免产生never awaited警告
+        coro.close()
+        self._tasks.discard(task)
+        if task in self._yielded:
+            self._yielded.discard(task)
+        else:
+            self._semaphore.release()
+        pending = self._agent_pending[agent_id] - 1
+        if pending:
+            self._agent_pending[agent_id] = pending
+        else:
+            del self._agent_pending[agent_id]
+            del self._agent_locks[agent_id]
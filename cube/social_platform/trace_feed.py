@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterable
+
+# 订阅者队列的默认长度，处理不过来时改为从数据库补读
+DEFAULT_SUBSCRIBER_QUEUE_SIZE = 10_000
+# 关闭时等待订阅者读完剩余事件的默认秒数
+DEFAULT_DRAIN_TIMEOUT = 10.0
+
+
+def _as_agent_id(value: Any) -> Any:
+    # 与trace表INTEGER列的类型亲和性一致
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+
+@dataclass
+class TraceEvent:
+    seq: int
+    user_id: Any
+    created_at: datetime
+    action: str
+    info: Any
+    room: str | None = None
+    activity: str | None = None
+    other_agent_id: Any = None
+    duration: int | None = None
+
+    @classmethod
+    def from_row(cls, row: tuple) -> TraceEvent:
+        r"""Build an event from trace values in :obj:`TRACE_COLUMNS`
+        order, as written to or read from the database.
+        """
+        (seq, user_id, created_at, action, info, room, activity,
+         other_agent_id, duration) = row
+        if isinstance(created_at, str):
+            created_at = datetime.fromisoformat(created_at)
+        return cls(seq, _as_agent_id(user_id), created_at, action,
+                   json.loads(info), room, activity,
+                   _as_agent_id(other_agent_id), duration)
+
+
+class _Subscriber:
+
+    def __init__(self, user_ids: set | None, actions: set[str] | None,
+                 maxsize: int):
+        self.user_ids = user_ids
+        self.actions = actions
+        self.queue: asyncio.Queue[TraceEvent | None] = asyncio.Queue(maxsize)
+        # 队列满时丢弃后续事件，由订阅者从数据库补读
+        self.lagging = False
+        self.reading_db = False
+
+    @property
+    def needs_db(self) -> bool:
+        return self.lagging or self.reading_db
+
+    def matches(self, event: TraceEvent) -> bool:
+        return ((self.user_ids is None or event.user_id in self.user_ids)
+                and (self.actions is None or event.action in self.actions))
+
+
+class TraceFeed:
+    r"""Deliver trace events to subscribers as they are recorded.
+
+    :meth:`subscribe` first reads the rows after a :obj:`seq` checkpoint
+    from the database, then switches to the events published in memory,
+    so a late subscriber misses nothing and a live one never polls the
+    database. A subscriber that falls more than its queue size behind
+    catches up from the database again, so the database must stay open
+    until :meth:`wait_closed` returns.
+
+    Events must be published in :obj:`seq` order, when they get their
+    :obj:`seq`, and handed to the writer flushed by :obj:`flush` at the
+    same time.
+
+    Args:
+        flush (Callable[[], Awaitable[Any]]): Commits every recorded trace.
+        fetch_rows (Callable): Async generator of the trace rows with
+            ``after < seq <= until`` matching the filters, ordered by
+            :obj:`seq`.
+        current_seq (Callable[[], int]): Returns the last :obj:`seq`
+            handed out.
+    """
+
+    def __init__(self, flush: Callable[[], Awaitable[Any]],
+                 fetch_rows: Callable[..., AsyncIterator[tuple]],
+                 current_seq: Callable[[], int]):
+        self.flush = flush
+        self.fetch_rows = fetch_rows
+        self.current_seq = current_seq
+        self._subscribers: set[_Subscriber] = set()
+        self.closed = False
+        # 订阅者读完数据库或结束时设置
+        self._db_released = asyncio.Event()
+
+    @property
+    def num_subscribers(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, event: TraceEvent):
+        for subscriber in self._subscribers:
+            if subscriber.lagging or not subscriber.matches(event):
+                continue
+            try:
+                subscriber.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                subscriber.lagging = True
+
+    def close(self):
+        r"""End every subscription once its queued events are read."""
+        self.closed = True
+        for subscriber in self._subscribers:
+            if subscriber.queue.full():
+                # 腾出位置放结束标记，被挤掉的事件从数据库补读
+                subscriber.queue.get_nowait()
+                subscriber.lagging = True
+            subscriber.queue.put_nowait(None)
+
+    async def wait_closed(self, timeout: float | None = DEFAULT_DRAIN_TIMEOUT
+                          ) -> bool:
+        r"""Close the feed and wait until no subscription reads from the
+        database anymore. Subscriptions that fell behind catch up first,
+        the others only have queued events left.
+
+        Args:
+            timeout (float, optional): Seconds to wait, :obj:`None` to wait
+                forever. (default: :obj:`10.0`)
+
+        Returns:
+            bool: :obj:`False` if some subscriber still needed the database
+                when the time ran out.
+        """
+        if not self.closed:
+            self.close()
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while any(subscriber.needs_db for subscriber in self._subscribers):
+            self._db_released.clear()
+            remaining = None if deadline is None else deadline - loop.time()
+            try:
+                await asyncio.wait_for(self._db_released.wait(), remaining)
+            except asyncio.TimeoutError:
+                return False
+        return True
+
+    async def subscribe(
+            self,
+            after_seq: int = 0,
+            user_ids: Iterable[Any] | None = None,
+            actions: Iterable[str] | None = None,
+            maxsize: int = DEFAULT_SUBSCRIBER_QUEUE_SIZE
+    ) -> AsyncIterator[TraceEvent]:
+        r"""Yield the trace events after :obj:`after_seq`, first from the
+        database and then live, until the feed is closed.
+
+        Args:
+            after_seq (int): Checkpoint, the :obj:`seq` of the last event
+                already seen. ``0`` starts from the first row.
+                (default: :obj:`0`)
+            user_ids (Iterable, optional): Only events of these agents.
+                (default: :obj:`None`)
+            actions (Iterable[str], optional): Only these actions.
+                (default: :obj:`None`)
+            maxsize (int): Events buffered for a slow subscriber before it
+                falls back to the database. (default: :obj:`10000`)
+        """
+        if user_ids is not None:
+            user_ids = {_as_agent_id(user_id) for user_id in user_ids}
+        if actions is not None:
+            actions = set(actions)
+        subscriber = _Subscriber(user_ids, actions, maxsize)
+        self._subscribers.add(subscriber)
+        last_seq = after_seq
+        try:
+            while True:
+                # 此刻之前的事件从数据库读，之后的从队列读
+                while not subscriber.queue.empty():
+                    subscriber.queue.get_nowait()
+                subscriber.reading_db = True
+                subscriber.lagging = False
+                until_seq = self.current_seq()
+                await self.flush()
+                async for row in self.fetch_rows(last_seq, until_seq,
+                                                 user_ids, actions):
+                    event = TraceEvent.from_row(row)
+                    last_seq = event.seq
+                    yield event
+                last_seq = max(last_seq, until_seq)
+                subscriber.reading_db = False
+                self._db_released.set()
+                if self.closed and subscriber.queue.empty():
+                    return
+                while not subscriber.lagging:
+                    event = await subscriber.queue.get()
+                    if event is None:
+                        if subscriber.lagging:
+                            break
+                        return
+                    if event.seq > last_seq:
+                        last_seq = event.seq
+                        yield event
+        finally:
+            self._subscribers.discard(subscriber)
+            self._db_released.set()
@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Iterable
+
+twitter_log = logging.getLogger(name='social.twitter')
+
+# 默认攒够1000行或者距离第一行50毫秒时写入一次
+DEFAULT_MAX_ROWS = 1000
+DEFAULT_FLUSH_INTERVAL = 0.05
+
+
+class TraceWriter:
+    r"""Group commit for trace rows.
+
+    Rows passed to :meth:`write` are buffered in memory. A background task
+    writes the buffer with :obj:`write_rows` (one ``executemany`` in one
+    transaction) once it holds :obj:`max_rows` rows or its oldest row is
+    :obj:`flush_interval` seconds old. A crash can therefore lose at most
+    the rows of the last :obj:`flush_interval`. With ``flush_interval=0``
+    every :meth:`write` waits for its own commit, as before.
+
+    :meth:`flush` is a barrier: it returns once every row written before the
+    call is committed. :meth:`close` stops the background task and flushes
+    what is left.
+
+    Args:
+        write_rows (Callable[[list[tuple]], Awaitable[Any]]): Writes and
+            commits a list of rows.
+        max_rows (int): Buffered rows that trigger a flush.
+            (default: :obj:`1000`)
+        flush_interval (float): Longest time in seconds a row waits in the
+            buffer. (default: :obj:`0.05`)
+    """
+
+    def __init__(self,
+                 write_rows: Callable[[list[tuple]], Awaitable[Any]],
+                 max_rows: int = DEFAULT_MAX_ROWS,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL):
+        if max_rows <= 0:
+            raise ValueError("max_rows must be positive.")
+        if flush_interval < 0:
+            raise ValueError("flush_interval must not be negative.")
+        self.write_rows = write_rows
+        self.max_rows = max_rows
+        self.flush_interval = flush_interval
+        self._rows: list[tuple] = []
+        self._flush_lock = asyncio.Lock()
+        # 缓冲区非空时唤醒后台任务，达到max_rows时让它立即写入
+        self._has_rows = asyncio.Event()
+        self._full = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._closing = False
+        self.num_rows = 0
+        self.num_flushes = 0
+
+    @property
+    def buffered(self) -> int:
+        r"""Number of rows not written yet."""
+        return len(self._rows)
+
+    async def write(self, row: tuple):
+        await self.write_many((row, ))
+
+    async def write_many(self, rows: Iterable[tuple]):
+        self._rows.extend(rows)
+        if self.flush_interval == 0:
+            await self.flush()
+            return
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        self._has_rows.set()
+        if len(self._rows) >= self.max_rows:
+            self._full.set()
+
+    async def flush(self):
+        r"""Write every buffered row and wait for the commit.
+
+        Raises:
+            Exception: Whatever :obj:`write_rows` raised. The rows are kept
+                and written by the next flush.
+        """
+        async with self._flush_lock:
+            if not self._rows:
+                return
+            rows, self._rows = self._rows, []
+            try:
+                await self.write_rows(rows)
+            except BaseException:
+                # 写入失败时放回缓冲区，保持原有顺序
+                self._rows[:0] = rows
+                raise
+            self.num_rows += len(rows)
+            self.num_flushes += 1
+
+    async def _run(self):
+        while not self._closing:
+            await self._has_rows.wait()
+            if not self._closing and len(self._rows) < self.max_rows:
+                try:
+                    await asyncio.wait_for(self._full.wait(),
+                                           self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._has_rows.clear()
+            self._full.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                twitter_log.error(f"Failed to write trace rows: {e}")
+                await asyncio.sleep(self.flush_interval)
+            if self._rows:
+                self._has_rows.set()
+
+    async def close(self):
+        r"""Stop the background task and write the remaining rows. Writing
+        again afterwards starts a new task.
+        """
+        if self._task is not None:
+            self._closing = True
+            self._has_rows.set()
+            self._full.set()
+            try:
+                await self._task
+            finally:
+                self._task = None
+                self._closing = False
+                self._has_rows.clear()
+                self._full.clear()
+        await self.flush()
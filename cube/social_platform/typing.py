@@ -25,6 +25,7 @@ class ActionType(Enum):
     DISLIKE_COMMENT = "dislike_comment"
     UNDO_DISLIKE_COMMENT = "undo_dislike_comment"
     DO_NOTHING = "do_nothing"
+    BATCH = "batch"
 
 
 class CommunityActionType(Enum):
@@ -33,6 +34,14 @@ class CommunityActionType(Enum):
     STOP = "stop"
     DO_SOMETHING = "do_something"
     MEET = "meet"
+    BATCH = "batch"
+
+
+class MovementMode(Enum):
+    # 由Unity导航并上报到达和相遇
+    UNITY = "unity"
+    # 按预先算好的步行时间到达，同一房间的agent视为相遇
+    LOGICAL = "logical"
 
 
 class RoomName(Enum):
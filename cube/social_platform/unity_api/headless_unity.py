@@ -0,0 +1,275 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import math
+from collections import defaultdict
+
+from cube.social_platform.unity_api.spatial_hash import SpatialHash
+
+# 与AgentController.cs中的默认值保持一致
+DEFAULT_SPEED = 3.5
+DEFAULT_ARRIVAL_THRESHOLD = 2.0
+DEFAULT_ENCOUNTER_RADIUS = 5.0
+DEFAULT_ENCOUNTER_INTERVAL = 0.5
+
+
+def _format_coordinate(value: float) -> str:
+    # C#的float.ToString()不会输出多余的".0"
+    return f"{value:g}"
+
+
+class KinematicSimulator:
+    r"""Headless replacement for the Unity scene: agents walk in straight
+    lines toward their targets at a constant speed.
+
+    It mirrors :obj:`AgentController.cs`: an agent reports
+    ``ARRIVED x,y,z`` once it is within :obj:`arrival_threshold` of its
+    target, and every :obj:`encounter_interval` seconds each agent reports
+    ``NEW_AGENT:<id>`` for every agent that came within
+    :obj:`encounter_radius` since the previous check. Neighbors are found
+    through a :obj:`SpatialHash` with cells of :obj:`encounter_radius`, so
+    a check costs O(n) rather than O(n²) in the number of agents.
+
+    Args:
+        agent_ids (list[str]): Ids of the simulated agents.
+        speed (float): Walking speed in world units per second.
+            (default: :obj:`3.5`)
+        arrival_threshold (float): Distance to the target at which an agent
+            counts as arrived. (default: :obj:`2.0`)
+        encounter_radius (float): Distance within which two agents meet.
+            (default: :obj:`5.0`)
+        encounter_interval (float): Seconds between two encounter checks.
+            (default: :obj:`0.5`)
+        spawn_positions (dict[str, tuple[float, float, float]], optional):
+            Initial positions. Agents without one are lined up along the x
+            axis, :obj:`encounter_radius` apart, so that nobody meets at
+            spawn. (default: :obj:`None`)
+    """
+
+    def __init__(
+        self,
+        agent_ids: list[str],
+        speed: float = DEFAULT_SPEED,
+        arrival_threshold: float = DEFAULT_ARRIVAL_THRESHOLD,
+        encounter_radius: float = DEFAULT_ENCOUNTER_RADIUS,
+        encounter_interval: float = DEFAULT_ENCOUNTER_INTERVAL,
+        spawn_positions: dict[str, tuple[float, float, float]] | None = None,
+    ):
+        self.speed = speed
+        self.arrival_threshold = arrival_threshold
+        self.encounter_radius = encounter_radius
+        self.encounter_interval = encounter_interval
+        spawn_positions = spawn_positions or {}
+        self.positions: dict[str, list[float]] = {}
+        self.spatial_hash = SpatialHash(encounter_radius)
+        for i, agent_id in enumerate(agent_ids):
+            spawn = spawn_positions.get(agent_id,
+                                        (i * (encounter_radius + 1), 0, 0))
+            self.positions[agent_id] = [float(c) for c in spawn]
+            self.spatial_hash.update(agent_id, self.positions[agent_id])
+        self.targets: dict[str, tuple[float, float, float] | None] = {
+            agent_id: None
+            for agent_id in agent_ids
+        }
+        self.navigating: set[str] = set()
+        # 只保存附近有其他智能体的条目
+        self.nearby: dict[str, set[str]] = {}
+        self._since_encounter_check = 0.0
+
+    def receive_message(self, agent_id: str, message: str):
+        r"""Apply a command sent by :obj:`send_position_to_unity` or
+        :obj:`send_stop_to_unity`. Unknown agents and malformed commands
+        are ignored, as in Unity.
+        """
+        if agent_id not in self.positions:
+            return
+        split_data = message.split(",")
+        if len(split_data) == 3:
+            try:
+                target = tuple(float(c) for c in split_data)
+            except ValueError:
+                return
+            self.targets[agent_id] = target
+            self.navigating.add(agent_id)
+        elif message.strip() == "STOP":
+            self.targets[agent_id] = None
+            self.navigating.discard(agent_id)
+
+    def step(self, dt: float) -> list[tuple[str, str]]:
+        r"""Advance the simulation by :obj:`dt` seconds.
+
+        Returns:
+            list[tuple[str, str]]: The ``(agent_name, message)`` pairs to
+                send back to Python.
+        """
+        outgoing = []
+        max_distance = self.speed * dt
+        for agent_id, target in self.targets.items():
+            if target is None:
+                continue
+            position = self.positions[agent_id]
+            dx = target[0] - position[0]
+            dy = target[1] - position[1]
+            dz = target[2] - position[2]
+            distance = math.sqrt(dx * dx + dy * dy + dz * dz)
+            if distance <= max_distance:
+                position[:] = target
+                distance = 0.0
+            else:
+                scale = max_distance / distance
+                position[0] += dx * scale
+                position[1] += dy * scale
+                position[2] += dz * scale
+                distance -= max_distance
+            self.spatial_hash.update(agent_id, position)
+            if agent_id in self.navigating and (distance
+                                                <= self.arrival_threshold):
+                self.navigating.discard(agent_id)
+                coordinates = ",".join(_format_coordinate(c) for c in target)
+                outgoing.append((agent_id, f"ARRIVED {coordinates}"))
+            if distance == 0.0:
+                self.targets[agent_id] = None
+
+        self._since_encounter_check += dt
+        if self._since_encounter_check >= self.encounter_interval:
+            self._since_encounter_check = 0.0
+            outgoing.extend(self.check_encounters())
+        return outgoing
+
+    def neighbor_pairs(self) -> set[tuple[str, str]]:
+        r"""Return every unordered pair of agents closer than
+        :obj:`encounter_radius`.
+        """
+        return set(self.spatial_hash.neighbor_pairs(self.encounter_radius))
+
+    def check_encounters(self) -> list[tuple[str, str]]:
+        outgoing = []
+        current: dict[str, set[str]] = defaultdict(set)
+        for agent_a, agent_b in self.spatial_hash.neighbor_pairs(
+                self.encounter_radius):
+            current[agent_a].add(agent_b)
+            current[agent_b].add(agent_a)
+        for agent_id, nearby in current.items():
+            previous = self.nearby.get(agent_id)
+            new_agents = nearby - previous if previous else nearby
+            for other in sorted(new_agents):
+                outgoing.append((agent_id, f"NEW_AGENT:{other}"))
+        self.nearby = dict(current)
+        return outgoing
+
+
+class HeadlessUnityServer:
+    r"""Python stand-in for the Unity scene, speaking the same TCP protocol
+    as :obj:`RouterController.cs`: commands arrive as one JSON message per
+    connection on :obj:`listen_port`, and events are sent as one JSON
+    message per connection to :obj:`python_port`.
+
+    Args:
+        simulator (KinematicSimulator): The movement model.
+        host (str): Host of both sockets. (default: :obj:`"127.0.0.1"`)
+        listen_port (int): Port Unity listens on. (default: :obj:`8003`)
+        python_port (int): Port the Python side listens on.
+            (default: :obj:`8004`)
+        tick_rate (float): Simulation steps per second.
+            (default: :obj:`10.0`)
+    """
+
+    def __init__(self, simulator: KinematicSimulator,
+                 host: str = "127.0.0.1", listen_port: int = 8003,
+                 python_port: int = 8004, tick_rate: float = 10.0):
+        self.simulator = simulator
+        self.host = host
+        self.listen_port = listen_port
+        self.python_port = python_port
+        self.tick_rate = tick_rate
+        self.sent_messages = 0
+        self._server: asyncio.AbstractServer | None = None
+        self._tick_task: asyncio.Task | None = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_command,
+                                                  self.host, self.listen_port)
+        self._tick_task = asyncio.create_task(self._tick_loop())
+        print(f"Headless Unity listening on {self.host}:{self.listen_port}")
+
+    async def stop(self):
+        if self._tick_task is not None:
+            self._tick_task.cancel()
+            try:
+                await self._tick_task
+            except asyncio.CancelledError:
+                pass
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handle_command(self, reader: asyncio.StreamReader,
+                              writer: asyncio.StreamWriter):
+        try:
+            data = await reader.read()
+            if data:
+                message = json.loads(data.decode("utf-8"))
+                self.simulator.receive_message(str(message["agent_name"]),
+                                               str(message["message"]))
+        except Exception as e:
+            print(f"Headless Unity failed to handle command: {e}")
+        finally:
+            writer.close()
+            await writer.wait_closed()
+
+    async def _tick_loop(self):
+        loop = asyncio.get_running_loop()
+        interval = 1.0 / self.tick_rate
+        last = loop.time()
+        next_tick = last + interval
+        while True:
+            await asyncio.sleep(max(next_tick - loop.time(), 0))
+            now = loop.time()
+            outgoing = self.simulator.step(now - last)
+            last = now
+            next_tick += interval
+            for agent_id, message in outgoing:
+                await self._send_to_python(agent_id, message)
+
+    async def _send_to_python(self, agent_id: str, message: str):
+        try:
+            _, writer = await asyncio.open_connection(self.host,
+                                                      self.python_port)
+            writer.write(
+                json.dumps({
+                    "agent_name": agent_id,
+                    "message": message
+                }).encode("utf-8"))
+            await writer.drain()
+            writer.close()
+            await writer.wait_closed()
+            self.sent_messages += 1
+        except OSError as e:
+            print(f"Unable to connect to Python: {e}")
+
+
+async def main(args: argparse.Namespace):
+    agent_ids = [str(i) for i in range(args.num_agents)]
+    simulator = KinematicSimulator(agent_ids,
+                                   speed=args.speed,
+                                   encounter_radius=args.encounter_radius)
+    server = HeadlessUnityServer(simulator, tick_rate=args.tick_rate)
+    await server.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Headless stand-in for the Unity scene.")
+    parser.add_argument("--num_agents", type=int, default=7)
+    parser.add_argument("--speed", type=float, default=DEFAULT_SPEED)
+    parser.add_argument("--encounter_radius",
+                        type=float,
+                        default=DEFAULT_ENCOUNTER_RADIUS)
+    parser.add_argument("--tick_rate", type=float, default=10.0)
+    asyncio.run(main(parser.parse_args()))
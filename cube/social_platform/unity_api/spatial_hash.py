@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import math
+from typing import Hashable, Iterable, Sequence
+
+# 只检查一半的相邻格子，每对格子只比较一次
+_HALF_NEIGHBORHOOD = ((1, -1), (1, 0), (1, 1), (0, 1))
+
+
+class SpatialHash:
+    r"""Uniform grid over the ground plane (x, z) of the world coordinates,
+    the same space as the room coordinates sent to Unity.
+
+    Every item lives in the square cell containing it. With
+    :obj:`cell_size` at least as large as the query radius, the neighbors
+    of an item can only be in its own or the eight surrounding cells, so
+    :meth:`neighbor_pairs` costs O(n) for a bounded density instead of
+    comparing all O(n²) pairs. Distances are measured in 3D.
+
+    Args:
+        cell_size (float): Edge length of a grid cell.
+    """
+
+    def __init__(self, cell_size: float):
+        if cell_size <= 0:
+            raise ValueError("cell_size must be positive.")
+        self.cell_size = cell_size
+        self.positions: dict[Hashable, Sequence[float]] = {}
+        self.cells: dict[tuple[int, int], dict[Hashable,
+                                               Sequence[float]]] = {}
+        self._item_cells: dict[Hashable, tuple[int, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def _cell_of(self, position: Sequence[float]) -> tuple[int, int]:
+        return (math.floor(position[0] / self.cell_size),
+                math.floor(position[2] / self.cell_size))
+
+    def update(self, item: Hashable, position: Sequence[float]):
+        r"""Insert :obj:`item` or move it to :obj:`position` (x, y, z)."""
+        cell = self._cell_of(position)
+        old_cell = self._item_cells.get(item)
+        if old_cell != cell:
+            if old_cell is not None:
+                old_items = self.cells[old_cell]
+                del old_items[item]
+                if not old_items:
+                    del self.cells[old_cell]
+            self.cells.setdefault(cell, {})
+            self._item_cells[item] = cell
+        self.cells[cell][item] = position
+        self.positions[item] = position
+
+    def update_many(self, items: Iterable[tuple[Hashable,
+                                                Sequence[float]]]):
+        for item, position in items:
+            self.update(item, position)
+
+    def remove(self, item: Hashable):
+        cell = self._item_cells.pop(item)
+        del self.positions[item]
+        items = self.cells[cell]
+        del items[item]
+        if not items:
+            del self.cells[cell]
+
+    def query(self, position: Sequence[float],
+              radius: float) -> list[Hashable]:
+        r"""Return the items within :obj:`radius` of :obj:`position`."""
+        radius_sq = radius * radius
+        cx, cz = self._cell_of(position)
+        reach = math.ceil(radius / self.cell_size)
+        x, y, z = position
+        found = []
+        for dx in range(-reach, reach + 1):
+            for dz in range(-reach, reach + 1):
+                items = self.cells.get((cx + dx, cz + dz))
+                if not items:
+                    continue
+                for item, (ox, oy, oz) in items.items():
+                    if ((ox - x)**2 + (oy - y)**2 +
+                            (oz - z)**2) <= radius_sq:
+                        found.append(item)
+        return found
+
+    def neighbor_pairs(self, radius: float) -> list[tuple[Hashable,
+                                                          Hashable]]:
+        r"""Return every unordered pair of items within :obj:`radius` of
+        each other. :obj:`radius` must not exceed :obj:`cell_size`.
+        """
+        if radius > self.cell_size:
+            raise ValueError(
+                f"radius {radius} exceeds cell_size {self.cell_size}.")
+        radius_sq = radius * radius
+        pairs = []
+        cells = self.cells
+        for (cx, cz), items in cells.items():
+            members = list(items.items())
+            for i, (item_a, (ax, ay, az)) in enumerate(members):
+                for item_b, (bx, by, bz) in members[i + 1:]:
+                    if ((ax - bx)**2 + (ay - by)**2 +
+                            (az - bz)**2) <= radius_sq:
+                        pairs.append((item_a, item_b))
+            for dx, dz in _HALF_NEIGHBORHOOD:
+                others = cells.get((cx + dx, cz + dz))
+                if not others:
+                    continue
+                for item_a, (ax, ay, az) in members:
+                    for item_b, (bx, by, bz) in others.items():
+                        if ((ax - bx)**2 + (ay - by)**2 +
+                                (az - bz)**2) <= radius_sq:
+                            pairs.append((item_a, item_b))
+        return pairs
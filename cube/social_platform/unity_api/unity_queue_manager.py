@@ -1,19 +1,114 @@
+from __future__ import annotations
+
 import asyncio
-from typing import Dict, List
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Awaitable, Callable, Dict, List
+
+
+class UnityEventType(Enum):
+    ARRIVED = "ARRIVED"
+    NEW_AGENT = "NEW_AGENT"
+
+
+@dataclass
+class UnityEvent:
+    r"""A message from Unity parsed into a typed event.
+
+    Args:
+        agent_id (str): The agent the message was sent for.
+        event_type (UnityEventType): The kind of the event.
+        payload (str | None): The part of the message after the event
+            name, e.g. the id of the other agent for
+            :obj:`UnityEventType.NEW_AGENT`. (default: :obj:`None`)
+        raw (dict): The original message received from Unity.
+    """
+    agent_id: str
+    event_type: UnityEventType
+    payload: str | None = None
+    raw: dict = field(default_factory=dict)
+
+    @classmethod
+    def parse(cls, agent_id: str, message: dict) -> UnityEvent | None:
+        text = message.get('message', '')
+        if text.startswith(UnityEventType.ARRIVED.value):
+            payload = text[len(UnityEventType.ARRIVED.value):].strip()
+            return cls(agent_id, UnityEventType.ARRIVED, payload or None,
+                       message)
+        if text.startswith(UnityEventType.NEW_AGENT.value + ":"):
+            payload = text.split(":", 1)[1]
+            return cls(agent_id, UnityEventType.NEW_AGENT, payload, message)
+        return None
 
 
 # 作用：1.生成所有队列， 2.存取所有消息
 # agent的ID示例：1，2，3，4
 class UnityQueueManager:
     def __init__(self, agent_ids: List[str]):
-        self.queue_dict = {}
+        self.queue_dict: Dict[str, asyncio.Queue] = {}
         for agent_id in agent_ids:
             self.queue_dict[agent_id] = asyncio.Queue()
+        self.listeners: Dict[str, tuple[
+            Callable[[UnityEvent], Awaitable[None]],
+            set[UnityEventType] | None]] = {}
 
     async def put_message(self, agent_id: str, message: dict):
         # print('put_message:', agent_id, message)
+        listener = self.listeners.get(agent_id)
+        if listener is not None:
+            callback, event_types = listener
+            event = UnityEvent.parse(agent_id, message)
+            if event is not None and (event_types is None
+                                      or event.event_type in event_types):
+                await callback(event)
+                return
         await self.queue_dict[agent_id].put(message)
 
+    def add_listener(
+        self,
+        agent_id: str,
+        callback: Callable[[UnityEvent], Awaitable[None]],
+        event_types: set[UnityEventType] | None = None,
+    ):
+        r"""Deliver an agent's matching events to :obj:`callback` as they
+        arrive instead of queueing them. Only one listener per agent is
+        kept; non-matching messages still go to the agent's queue.
+
+        Args:
+            agent_id (str): The agent to listen for.
+            callback (Callable[[UnityEvent], Awaitable[None]]): Coroutine
+                function called with each matching event.
+            event_types (set[UnityEventType], optional): The events to
+                deliver. All events are delivered if :obj:`None`.
+                (default: :obj:`None`)
+        """
+        self.listeners[agent_id] = (callback, event_types)
+
+    def remove_listener(self, agent_id: str):
+        self.listeners.pop(agent_id, None)
+
+    def discard(self, agent_id: str, event_types: set[UnityEventType]) -> int:
+        r"""Drop the queued messages of an agent that are one of
+        :obj:`event_types`, e.g. a stale ARRIVED before a new move. Other
+        messages stay queued in order.
+
+        Returns:
+            int: The number of dropped messages.
+        """
+        queue = self.queue_dict[agent_id]
+        kept = []
+        dropped = 0
+        while not queue.empty():
+            message = queue.get_nowait()
+            event = UnityEvent.parse(agent_id, message)
+            if event is not None and event.event_type in event_types:
+                dropped += 1
+            else:
+                kept.append(message)
+        for message in kept:
+            queue.put_nowait(message)
+        return dropped
+
     async def get_message(self, agent_id: str, timeout: float = 0.1) -> dict:
         try:
             receive_result = await asyncio.wait_for(
@@ -22,3 +117,52 @@ class UnityQueueManager:
             return receive_result
         except asyncio.TimeoutError:
             return None
+
+    async def wait_for_event(
+        self,
+        agent_id: str,
+        event_types: set[UnityEventType] | None = None,
+        deadline: float | None = None,
+    ) -> UnityEvent | None:
+        r"""Wait until Unity sends one of the given events for an agent.
+
+        Unlike :meth:`get_message`, this does not wake up periodically: the
+        caller is only resumed when a matching message arrives or when the
+        deadline passes. Messages that are not one of :obj:`event_types`
+        are consumed and dropped.
+
+        Args:
+            agent_id (str): The agent to listen for.
+            event_types (set[UnityEventType], optional): The events to wait
+                for. All events are accepted if :obj:`None`.
+                (default: :obj:`None`)
+            deadline (float, optional): Absolute time on the running event
+                loop's clock (:meth:`asyncio.AbstractEventLoop.time`) after
+                which to give up. Waits forever if :obj:`None`.
+                (default: :obj:`None`)
+
+        Returns:
+            UnityEvent | None: The received event, or :obj:`None` if the
+                deadline passed first.
+        """
+        queue = self.queue_dict[agent_id]
+        loop = asyncio.get_running_loop()
+        while True:
+            if not queue.empty():
+                message = queue.get_nowait()
+            elif deadline is None:
+                message = await queue.get()
+            else:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return None
+                try:
+                    message = await asyncio.wait_for(queue.get(),
+                                                     timeout=remaining)
+                except asyncio.TimeoutError:
+                    return None
+            event = UnityEvent.parse(agent_id, message)
+            if event is None:
+                continue
+            if event_types is None or event.event_type in event_types:
+                return event
@@ -21,10 +21,10 @@ def print_db_contents(db_file):
             print(f"  {col[1]} ({col[2]})")
 
         # 打印表内容
+        # 逐行读取，不把整张表放进内存
         cursor.execute(f"SELECT * FROM {table_name[0]}")
-        rows = cursor.fetchall()
         print("Contents:")
-        for row in rows:
+        for row in cursor:
             print(" ", row)
     # 关闭连接
     conn.close()
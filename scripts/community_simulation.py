@@ -14,10 +14,12 @@ sys.path.append(
     os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
 
 from cube.clock.clock import Clock
+from cube.clock.virtual_clock import VirtualClock
 from cube.social_agent.agents_generator import generate_community_agents
 from cube.social_platform.channel import Channel
+from cube.social_platform.export import export_db
 from cube.social_platform.platform import Platform
-from cube.social_platform.typing import CommunityActionType
+from cube.social_platform.typing import CommunityActionType, MovementMode
 from cube.testing.show_db import print_db_contents
 from cube.social_platform.unity_api.unity_queue_manager import UnityQueueManager
 from cube.social_platform.unity_api.unity_server import start_server, stop_server
@@ -54,15 +56,20 @@ ROUND_POST_NUM = 20
 # 分步计划：先按照时间步写，后面变成纯异步持续action
 
 async def agent_task(agent):
-    while True:
-        await agent.perform_action_by_llm()
-        await asyncio.sleep(0.1)  # 短暂休眠以允许其他任务运行
+    # 使用虚拟时钟时，agent在两次动作之间也要占住时钟
+    with agent.env.clock.hold():
+        while True:
+            await agent.perform_action_by_llm()
+            await asyncio.sleep(0.1)  # 短暂休眠以允许其他任务运行
 
 async def running(
     db_path: str | None = DEFAULT_DB_PATH,
     user_path: str | None = DEFAULT_USER_PATH,
     # num_timesteps: int = 3,
     clock_factor: int = 120,
+    virtual_clock: bool = False,
+    movement_mode: str | None = None,
+    export_dir: str | None = None,
 ) -> None:
     db_path = DEFAULT_DB_PATH if db_path is None else db_path
     user_path = DEFAULT_USER_PATH if user_path is None else user_path
@@ -70,8 +77,15 @@ async def running(
         os.remove(db_path)
     # 实验从2024年7月1日早上八点开始
     start_time = datetime(2024, 7, 1, 8, 0)
-    clock = Clock(k=clock_factor)
-    channel = Channel()
+    # 虚拟时钟按事件跳跃沙盒时间，与真实时间无关
+    clock = VirtualClock() if virtual_clock else Clock(k=clock_factor)
+    # 虚拟时钟只能配合逻辑移动模式，默认按时钟选择
+    if movement_mode is None:
+        movement_mode = (MovementMode.LOGICAL.value
+                         if virtual_clock else MovementMode.UNITY.value)
+    # 结束时把Channel的队列深度和往返延迟写到数据库旁边
+    channel = Channel(
+        metrics_path=os.path.splitext(db_path)[0] + "_channel_metrics.json")
     unity_queue_mgr = UnityQueueManager(['0', '1', '2', '3', '4', '5', '6'])
     infra = Platform(
         db_path,
@@ -79,6 +93,7 @@ async def running(
         unity_queue_mgr,
         clock,
         start_time,
+        movement_mode=movement_mode,
     )
     await infra.create_async_db()
     task = asyncio.create_task(infra.running())
@@ -90,9 +105,12 @@ async def running(
         start_time
     )
 
-    server_tasks = await start_server(unity_queue_mgr)
-    print(Fore.GREEN + "please start unity in 10s...\n" + Fore.RESET)
-    await asyncio.sleep(10)
+    # 逻辑移动模式不需要Unity
+    server_tasks = None
+    if infra.movement_mode == MovementMode.UNITY:
+        server_tasks = await start_server(unity_queue_mgr)
+        print(Fore.GREEN + "please start unity in 10s...\n" + Fore.RESET)
+        await asyncio.sleep(10)
 
     try:
         tasks = []
@@ -121,9 +139,21 @@ async def running(
         print("Stopping the control script...")
     finally:
         # 停止服务器
-        await stop_server(*server_tasks)
-
-    print_db_contents(db_path)
+        if server_tasks is not None:
+            await stop_server(*server_tasks)
+
+    if export_dir is not None:
+        # 导出为Parquet，评估时不必再读SQLite
+        export_db(db_path, export_dir, run_config={
+            "db_path": db_path,
+            "user_path": user_path,
+            "clock_factor": clock_factor,
+            "virtual_clock": virtual_clock,
+            "movement_mode": movement_mode,
+            "start_time": start_time.isoformat(),
+        })
+    else:
+        print_db_contents(db_path)
 
 
 if __name__ == "__main__":
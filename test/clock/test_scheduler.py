@@ -0,0 +1,71 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from cube.clock.clock import Clock
+from cube.clock.scheduler import DeadlineScheduler
+
+
+@pytest.mark.asyncio
+async def test_sleep_until_wakes_in_deadline_order():
+    # K = 3600时，沙盒中1小时对应真实时间1秒
+    clock = Clock(k=3600)
+    start_time = datetime(2024, 7, 1, 8, 0)
+    scheduler = DeadlineScheduler(clock, start_time)
+    woken = []
+
+    async def sleeper(minutes: int):
+        await scheduler.sleep_until(start_time + timedelta(minutes=minutes))
+        woken.append(minutes)
+
+    tasks = [asyncio.create_task(sleeper(m)) for m in (6, 3, 9)]
+    await asyncio.sleep(0)
+    assert len(scheduler) == 3
+    await asyncio.gather(*tasks)
+
+    assert woken == [3, 6, 9]
+    assert len(scheduler) == 0
+    now = clock.time_transfer(datetime.now(), start_time)
+    assert now >= start_time + timedelta(minutes=9)
+
+
+@pytest.mark.asyncio
+async def test_many_sleepers_share_one_timer():
+    clock = Clock(k=36000)
+    start_time = datetime(2024, 7, 1, 8, 0)
+    scheduler = DeadlineScheduler(clock, start_time)
+    end_time = start_time + timedelta(hours=1)
+
+    tasks = [
+        asyncio.create_task(scheduler.sleep_until(end_time))
+        for _ in range(2000)
+    ]
+    await asyncio.sleep(0)
+    assert len(scheduler) == 2000
+    assert scheduler._timer is not None
+    await asyncio.gather(*tasks)
+    assert len(scheduler) == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_sleeper_is_dropped():
+    clock = Clock(k=60)
+    start_time = datetime(2024, 7, 1, 8, 0)
+    scheduler = DeadlineScheduler(clock, start_time)
+    task = asyncio.create_task(
+        scheduler.sleep_until(start_time + timedelta(hours=8)))
+    await asyncio.sleep(0)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert len(scheduler) == 0
+
+
+@pytest.mark.asyncio
+async def test_past_deadline_returns_immediately():
+    clock = Clock(k=60)
+    start_time = datetime(2024, 7, 1, 8, 0)
+    scheduler = DeadlineScheduler(clock, start_time)
+    await scheduler.sleep_until(start_time - timedelta(minutes=1))
+    assert len(scheduler) == 0
@@ -0,0 +1,85 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from cube.clock.virtual_clock import VirtualClock
+
+
+@pytest.mark.asyncio
+async def test_virtual_clock_jumps_to_next_event():
+    clock = VirtualClock(settle_time=0.001)
+    start_time = datetime(2024, 7, 1, 8, 0)
+    scheduler = clock.create_scheduler(start_time)
+    woken = []
+
+    async def sleeper(hours: int):
+        await scheduler.sleep_until(start_time + timedelta(hours=hours))
+        woken.append((hours, clock.now(start_time)))
+
+    real_start = time.monotonic()
+    # 模拟一周的沙盒时间
+    await asyncio.gather(*(sleeper(h) for h in (24 * 7, 8, 30)))
+    assert time.monotonic() - real_start < 1
+
+    assert [hours for hours, _ in woken] == [8, 30, 24 * 7]
+    for hours, now in woken:
+        assert now == start_time + timedelta(hours=hours)
+    assert clock.now(start_time) == start_time + timedelta(days=7)
+
+
+@pytest.mark.asyncio
+async def test_virtual_clock_waits_while_held():
+    clock = VirtualClock(settle_time=0.001)
+    start_time = datetime(2024, 7, 1, 8, 0)
+    scheduler = clock.create_scheduler(start_time)
+
+    sleeper = asyncio.create_task(
+        scheduler.sleep_until(start_time + timedelta(hours=1)))
+    with clock.hold():
+        # 模拟等待LLM响应
+        await asyncio.sleep(0.02)
+        assert not sleeper.done()
+        assert clock.now(start_time) == start_time
+    await sleeper
+    assert clock.now(start_time) == start_time + timedelta(hours=1)
+
+
+@pytest.mark.asyncio
+async def test_holder_sleeping_releases_clock():
+    clock = VirtualClock(settle_time=0.001)
+    start_time = datetime(2024, 7, 1, 8, 0)
+    scheduler = clock.create_scheduler(start_time)
+
+    async def handler(minutes: int):
+        with clock.hold():
+            await scheduler.sleep_until(start_time +
+                                        timedelta(minutes=minutes))
+            return clock.now(start_time)
+
+    results = await asyncio.gather(handler(30), handler(10))
+    assert results == [
+        start_time + timedelta(minutes=30),
+        start_time + timedelta(minutes=10),
+    ]
+    assert len(scheduler) == 0
+
+
+@pytest.mark.asyncio
+async def test_pending_hold_is_not_bound_to_a_task():
+    clock = VirtualClock(settle_time=0)
+    start_time = datetime(2024, 7, 1, 8, 0)
+    scheduler = clock.create_scheduler(start_time)
+
+    sleeper = asyncio.create_task(
+        scheduler.sleep_until(start_time + timedelta(hours=1)))
+    # 例如排队中的请求，还没有处理它的任务
+    release = clock.hold_pending()
+    await asyncio.sleep(0.02)
+    assert not sleeper.done()
+    release()
+    release()
+    await sleeper
+    assert clock.now(start_time) == start_time + timedelta(hours=1)
+    assert clock._busy == 0
@@ -0,0 +1,19 @@
+from datetime import datetime
+
+import pytest_asyncio
+
+from cube.clock.virtual_clock import VirtualClock
+from cube.social_platform.database import create_db_async
+from cube.social_platform.platform_utils import AsyncPlatformUtils
+
+START_TIME = datetime(2024, 7, 1, 8, 0)
+
+
+@pytest_asyncio.fixture
+async def pl_utils(tmp_path):
+    db_path = str(tmp_path / "trace.db")
+    await create_db_async(db_path)
+    pl_utils = AsyncPlatformUtils(db_path, START_TIME, VirtualClock())
+    yield pl_utils
+    # 测试中已经关闭时再次关闭不会出错
+    await pl_utils.close()
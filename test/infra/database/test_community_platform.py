@@ -0,0 +1,382 @@
+import asyncio
+import json
+import os
+import os.path as osp
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from cube.clock.clock import Clock
+from cube.clock.virtual_clock import VirtualClock
+from cube.social_platform.channel import Channel
+from cube.social_platform.platform import Platform
+from cube.social_platform.typing import CommunityActionType
+from cube.social_platform.unity_api.unity_queue_manager import \
+    UnityQueueManager
+
+parent_folder = osp.dirname(osp.abspath(__file__))
+test_db_filepath = osp.join(parent_folder, "test_community.db")
+
+
+@pytest.fixture
+def setup_db():
+    if os.path.exists(test_db_filepath):
+        os.remove(test_db_filepath)
+    yield
+    if os.path.exists(test_db_filepath):
+        os.remove(test_db_filepath)
+
+
+@pytest.mark.asyncio
+async def test_do_something_on_virtual_clock(setup_db):
+    start_time = datetime(2024, 7, 1, 8, 0)
+    clock = VirtualClock(settle_time=0.001)
+    channel = Channel()
+    unity_queue_mgr = UnityQueueManager(['0', '1'])
+    platform = Platform(test_db_filepath, channel, unity_queue_mgr, clock,
+                        start_time, movement_mode="logical")
+    await platform.create_async_db()
+    task = asyncio.create_task(platform.running())
+
+    async def act(agent_id, message, action):
+        message_id = await channel.write_to_receive_queue(
+            (agent_id, message, action))
+        return (await channel.read_from_send_queue(message_id))[2]
+
+    results = await asyncio.gather(
+        act('0', ('sleeping', 8 * 60), CommunityActionType.DO_SOMETHING.value),
+        act('1', ('reading', 30), CommunityActionType.DO_SOMETHING.value),
+    )
+    assert results == [{
+        "success": True,
+        "activity": "sleeping"
+    }, {
+        "success": True,
+        "activity": "reading"
+    }]
+    await channel.write_to_receive_queue(
+        (None, None, CommunityActionType.EXIT))
+    await task
+
+    conn = sqlite3.connect(test_db_filepath)
+    rows = conn.execute(
+        "SELECT user_id, created_at, action, info FROM trace "
+        "WHERE user_id = '0' ORDER BY created_at").fetchall()
+    conn.close()
+    assert [row[2] for row in rows] == ["start_activity", "end_activity"]
+    assert json.loads(rows[0][3]) == {"activity": "sleeping"}
+    assert rows[0][1] == str(start_time)
+    assert rows[1][1] == str(start_time + timedelta(hours=8))
+
+
+@pytest.mark.asyncio
+async def test_registered_handler_and_latency_stats(setup_db):
+    start_time = datetime(2024, 7, 1, 8, 0)
+    clock = VirtualClock(settle_time=0.001)
+    channel = Channel()
+    platform = Platform(test_db_filepath, channel, UnityQueueManager(['0']),
+                        clock, start_time, movement_mode="logical")
+    await platform.create_async_db()
+
+    async def fail(agent_id, message):
+        raise RuntimeError("boom")
+
+    platform.register_handler(CommunityActionType.STOP, fail)
+    task = asyncio.create_task(platform.running())
+
+    message_id = await channel.write_to_receive_queue(
+        ('0', None, CommunityActionType.STOP.value))
+    response = await channel.read_from_send_queue(message_id)
+    assert response[2] == {"success": False, "error": "boom"}
+
+    message_id = await channel.write_to_receive_queue(
+        ('0', ('eating', 20), CommunityActionType.DO_SOMETHING.value))
+    response = await channel.read_from_send_queue(message_id)
+    assert response[2]["success"] is True
+
+    await channel.write_to_receive_queue(
+        (None, None, CommunityActionType.EXIT))
+    await task
+
+    summary = platform.latency_stats.summary()
+    assert summary["stop"]["errors"] == {"count": 1}
+    assert summary["do_something"]["handler"]["count"] == 1
+    assert summary["do_something"]["queue_wait"]["count"] == 1
+
+
+@pytest.mark.asyncio
+async def test_go_to_rejects_unknown_room(setup_db):
+    start_time = datetime(2024, 7, 1, 8, 0)
+    platform = Platform(test_db_filepath, Channel(), UnityQueueManager(['0']),
+                        Clock(k=60), start_time)
+    await platform.create_async_db()
+    result = await platform.go_to('0', "moon base")
+    assert result == {"success": False, "error": "Unknown room: 'moon base'"}
+    assert platform.estimate_travel_time('0', "square") is None
+
+    conn = sqlite3.connect(test_db_filepath)
+    assert conn.execute("SELECT COUNT(*) FROM trace").fetchone()[0] == 0
+    conn.close()
+
+
+@pytest.mark.asyncio
+async def test_logical_go_to_on_virtual_clock(setup_db):
+    start_time = datetime(2024, 7, 1, 8, 0)
+    channel = Channel()
+    platform = Platform(test_db_filepath,
+                        channel,
+                        UnityQueueManager(['0', '1']),
+                        VirtualClock(settle_time=0.001),
+                        start_time,
+                        movement_mode="logical")
+    await platform.create_async_db()
+    task = asyncio.create_task(platform.running())
+
+    async def go_to(agent_id, room_name):
+        message_id = await channel.write_to_receive_queue(
+            (agent_id, room_name, CommunityActionType.GO_TO.value))
+        return (await channel.read_from_send_queue(message_id))[2]
+
+    assert await go_to('0', "square") == {"success": True, "arrived": "square"}
+    assert await go_to('1', "square") == {"success": True, "arrived": "square"}
+    assert await go_to('0', "west garden") == {
+        "success": True,
+        "arrived": "west garden"
+    }
+    assert platform.room_occupants["square"] == {'1'}
+    await channel.write_to_receive_queue(
+        (None, None, CommunityActionType.EXIT))
+    await task
+
+    conn = sqlite3.connect(test_db_filepath)
+    rows = conn.execute(
+        "SELECT user_id, created_at, action, info FROM trace "
+        "ORDER BY created_at, rowid").fetchall()
+    conn.close()
+    assert [(row[0], row[2], json.loads(row[3])) for row in rows] == [
+        (0, "plan_to", {"room": "square"}),
+        (0, "arrived", {"room": "square"}),
+        (1, "plan_to", {"room": "square"}),
+        (1, "meet", {"new_agent": "0"}),
+        (0, "meet", {"new_agent": "1"}),
+        (1, "arrived", {"room": "square"}),
+        (0, "plan_to", {"room": "west garden"}),
+        (0, "arrived", {"room": "west garden"}),
+    ]
+    travel_time = platform.room_graph.travel_time("square", "west garden")
+    assert rows[-1][1] == str(start_time + travel_time)
+
+    # 相遇的房间和对方写在类型化的列中
+    conn = sqlite3.connect(test_db_filepath)
+    meets = conn.execute(
+        "SELECT user_id, other_agent_id FROM trace "
+        "WHERE room = 'square' AND action = 'meet' ORDER BY seq").fetchall()
+    conn.close()
+    assert meets == [(1, 0), (0, 1)]
+
+
+@pytest.mark.asyncio
+async def test_batch_request(setup_db):
+    start_time = datetime(2024, 7, 1, 8, 0)
+    channel = Channel()
+    platform = Platform(test_db_filepath,
+                        channel,
+                        UnityQueueManager(['0']),
+                        VirtualClock(settle_time=0.001),
+                        start_time,
+                        movement_mode="logical")
+    await platform.create_async_db()
+    task = asyncio.create_task(platform.running())
+
+    message_id = await channel.write_batch_to_receive_queue('0', [
+        ("square", CommunityActionType.GO_TO.value),
+        (("reading", 30), CommunityActionType.DO_SOMETHING.value),
+        (1, "follow"),
+        ([], CommunityActionType.BATCH.value),
+    ])
+    response = await channel.read_from_send_queue(message_id)
+    await channel.write_to_receive_queue(
+        (None, None, CommunityActionType.EXIT))
+    await task
+
+    results = response[2]["results"]
+    assert response[2]["success"] is True
+    assert results[0] == {"success": True, "arrived": "square"}
+    assert results[1] == {"success": True, "activity": "reading"}
+    assert results[2]["success"] is False
+    assert results[3] == {
+        "success": False,
+        "error": "Nested batches are not supported"
+    }
+
+    conn = sqlite3.connect(test_db_filepath)
+    actions = [
+        row[0] for row in conn.execute(
+            "SELECT action FROM trace ORDER BY rowid").fetchall()
+    ]
+    conn.close()
+    assert actions == [
+        "plan_to", "arrived", "start_activity", "end_activity"
+    ]
+
+
+@pytest.mark.asyncio
+async def test_timed_out_request_cancels_handler(setup_db):
+    from cube.social_platform.unity_api.unity_server import send_queue
+
+    start_time = datetime(2024, 7, 1, 8, 0)
+    channel = Channel()
+    platform = Platform(test_db_filepath, channel, UnityQueueManager(['0']),
+                        Clock(k=60), start_time)
+    await platform.create_async_db()
+    task = asyncio.create_task(platform.running())
+    while not send_queue.empty():
+        send_queue.get_nowait()
+
+    # 没有Unity时go_to永远等不到ARRIVED
+    message_id = await channel.write_to_receive_queue(
+        ('0', "square", CommunityActionType.GO_TO.value), timeout=0.2)
+    with pytest.raises(asyncio.TimeoutError):
+        await channel.read_from_send_queue(message_id)
+    await asyncio.sleep(0.05)
+    assert platform._message_tasks == {}
+    assert platform.backlog == 0
+    messages = [send_queue.get_nowait()["message"] for _ in range(2)]
+    assert messages[1] == "STOP"
+
+    await channel.write_to_receive_queue(
+        (None, None, CommunityActionType.EXIT))
+    await task
+    # 只剩下已确认但没人读取的EXIT
+    assert all(future.done() for future in channel.pending.values())
+
+
+@pytest.mark.asyncio
+async def test_queued_requests_hold_virtual_clock(setup_db):
+    start_time = datetime(2024, 7, 1, 8, 0)
+    # 不靠settle_time兜底，且名额远少于agent数
+    clock = VirtualClock(settle_time=0)
+    channel = Channel()
+    agent_ids = [str(i) for i in range(60)]
+    platform = Platform(test_db_filepath, channel,
+                        UnityQueueManager(agent_ids), clock, start_time,
+                        max_concurrent_handlers=4, movement_mode="logical")
+    await platform.create_async_db()
+    task = asyncio.create_task(platform.running())
+
+    async def agent(agent_id):
+        with clock.hold():
+            for _ in range(3):
+                with clock.release():
+                    message_id = await channel.write_to_receive_queue(
+                        (agent_id, ("working", 10),
+                         CommunityActionType.DO_SOMETHING.value))
+                    await channel.read_from_send_queue(message_id)
+
+    await asyncio.gather(*(agent(agent_id) for agent_id in agent_ids))
+    await channel.write_to_receive_queue(
+        (None, None, CommunityActionType.EXIT))
+    await task
+
+    conn = sqlite3.connect(test_db_filepath)
+    rows = conn.execute(
+        "SELECT created_at, COUNT(*) FROM trace "
+        "WHERE action = 'start_activity' GROUP BY created_at").fetchall()
+    conn.close()
+    assert rows == [(str(start_time + timedelta(minutes=minutes)), 60)
+                    for minutes in (0, 10, 20)]
+
+
+@pytest.mark.asyncio
+async def test_exit_serves_requests_it_overtook(setup_db):
+    start_time = datetime(2024, 7, 1, 8, 0)
+    channel = Channel()
+    platform = Platform(test_db_filepath, channel,
+                        UnityQueueManager(['0', '1']),
+                        VirtualClock(settle_time=0.001), start_time,
+                        movement_mode="logical")
+    await platform.create_async_db()
+    # 平台启动前，EXIT已经排在control通道，越过了其他通道的请求
+    message_ids = [
+        await channel.write_to_receive_queue(
+            ('0', ('reading', 30), CommunityActionType.DO_SOMETHING.value)),
+        await channel.write_batch_to_receive_queue(
+            '1', [(('cooking', 10), CommunityActionType.DO_SOMETHING.value)]),
+    ]
+    await channel.write_to_receive_queue(
+        (None, None, CommunityActionType.EXIT))
+    await asyncio.wait_for(platform.running(), 10)
+
+    results = [(await channel.read_from_send_queue(message_id))[2]
+               for message_id in message_ids]
+    assert results[0] == {"success": True, "activity": "reading"}
+    assert results[1]["success"] is True
+    assert channel.metrics()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_late_arrival_is_not_taken_by_next_go_to(setup_db,
+                                                       monkeypatch):
+    unity_queue_mgr = UnityQueueManager(['0'])
+    positions = []
+
+    async def send_position(agent_id, x, y, z):
+        positions.append(agent_id)
+        await unity_queue_mgr.put_message(agent_id, {
+            'agent_name': agent_id,
+            'message': 'ARRIVED'
+        })
+
+    async def send_stop(agent_id):
+        pass
+
+    monkeypatch.setattr("cube.social_platform.platform.send_position_to_unity",
+                        send_position)
+    monkeypatch.setattr("cube.social_platform.platform.send_stop_to_unity",
+                        send_stop)
+    channel = Channel()
+    # K = 3600时，沙盒中1分钟对应真实时间1/60秒
+    platform = Platform(test_db_filepath, channel, unity_queue_mgr,
+                        Clock(k=3600), datetime(2024, 7, 1, 8, 0))
+    await platform.create_async_db()
+    task = asyncio.create_task(platform.running())
+
+    async def act(message, action):
+        message_id = await channel.write_to_receive_queue(
+            ('0', message, action))
+        return (await asyncio.wait_for(
+            channel.read_from_send_queue(message_id), 5))[2]
+
+    activity = asyncio.create_task(
+        act(('reading', 30), CommunityActionType.DO_SOMETHING.value))
+    await asyncio.sleep(0.05)
+    # 活动期间收到上一次移动迟到的ARRIVED
+    await unity_queue_mgr.put_message('0', {
+        'agent_name': '0',
+        'message': 'ARRIVED'
+    })
+    assert (await activity)["success"] is True
+    assert unity_queue_mgr.queue_dict['0'].empty()
+
+    # 活动之前就排在队列里的迟到ARRIVED也被丢弃，go_to等的是自己的到达
+    await unity_queue_mgr.put_message('0', {
+        'agent_name': '0',
+        'message': 'ARRIVED'
+    })
+    assert await act("west garden", CommunityActionType.GO_TO.value) == {
+        "success": True,
+        "arrived": "west garden"
+    }
+    assert positions == ['0']
+    assert unity_queue_mgr.queue_dict['0'].empty()
+
+    await channel.write_to_receive_queue(
+        (None, None, CommunityActionType.EXIT))
+    await task
+
+
+def test_virtual_clock_rejects_unity_movement(setup_db):
+    with pytest.raises(ValueError, match="logical"):
+        Platform(test_db_filepath, Channel(), UnityQueueManager(['0']),
+                 VirtualClock(), datetime(2024, 7, 1, 8, 0))
@@ -0,0 +1,95 @@
+import asyncio
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from cube.clock.virtual_clock import VirtualClock
+from cube.social_platform.channel import Channel
+from cube.social_platform.database import create_db_async
+from cube.social_platform.encounter import EncounterTracker
+from cube.social_platform.platform import Platform
+from cube.social_platform.sharding import merge_shard_traces
+from cube.social_platform.typing import CommunityActionType
+from cube.social_platform.unity_api.unity_queue_manager import \
+    UnityQueueManager
+
+START_TIME = datetime(2024, 7, 1, 8, 0)
+
+
+def test_tracker_merges_both_sides_of_a_meeting():
+    tracker = EncounterTracker(window=timedelta(minutes=5))
+    tracker.observe('10', '2', START_TIME, "square")
+    encounter = tracker.observe('2', '10', START_TIME + timedelta(seconds=3))
+    assert (encounter.agent_a, encounter.agent_b) == ('2', '10')
+    assert encounter.count == 1
+    assert encounter.room == "square"
+
+    encounter = tracker.observe('2', '10', START_TIME + timedelta(hours=1),
+                                "kitchen")
+    assert encounter.count == 2
+    assert encounter.first_time == START_TIME
+    assert encounter.last_time == START_TIME + timedelta(hours=1)
+    assert encounter.room == "kitchen"
+    assert len(tracker) == 1
+
+
+@pytest.mark.asyncio
+async def test_platform_keeps_encounter_table(tmp_path):
+    db_path = str(tmp_path / "community.db")
+    channel = Channel()
+    platform = Platform(db_path,
+                        channel,
+                        UnityQueueManager(['0', '1', '2']),
+                        VirtualClock(settle_time=0.001),
+                        START_TIME,
+                        movement_mode="logical")
+    await platform.create_async_db()
+    task = asyncio.create_task(platform.running())
+
+    async def act(agent_id, message, action):
+        message_id = await channel.write_to_receive_queue(
+            (agent_id, message, action.value))
+        return (await channel.read_from_send_queue(message_id))[2]
+
+    for agent_id in ['0', '1', '2']:
+        await act(agent_id, "square", CommunityActionType.GO_TO)
+    # 离开超过合并窗口后再回来，算作新的相遇
+    await act('2', "west garden", CommunityActionType.GO_TO)
+    await act('2', ("walking", 30), CommunityActionType.DO_SOMETHING)
+    await act('2', "square", CommunityActionType.GO_TO)
+    await channel.write_to_receive_queue(
+        (None, None, CommunityActionType.EXIT))
+    await task
+
+    with sqlite3.connect(db_path) as conn:
+        encounters = conn.execute(
+            "SELECT agent_a, agent_b, count, room FROM encounter "
+            "ORDER BY agent_a, agent_b").fetchall()
+        meets = conn.execute(
+            "SELECT COUNT(*) FROM trace WHERE action = 'meet'").fetchone()[0]
+    # 每次相遇双方各有一条meet记录，encounter中只算一次
+    assert meets == 10
+    assert encounters == [(0, 1, 1, "square"), (0, 2, 2, "square"),
+                          (1, 2, 2, "square")]
+
+
+@pytest.mark.asyncio
+async def test_merge_combines_encounters_of_shards(tmp_path):
+    db_path = str(tmp_path / "merged.db")
+    shard_db_paths = [str(tmp_path / f"shard{i}.db") for i in range(2)]
+    for path in [db_path, *shard_db_paths]:
+        await create_db_async(path)
+    rows = [(0, 1, 2, "2024-07-01 08:00:00", "2024-07-01 09:00:00", "square"),
+            (0, 1, 2, "2024-07-01 08:00:01", "2024-07-01 09:30:00", "kitchen")]
+    for path, row in zip(shard_db_paths, rows):
+        with sqlite3.connect(path) as conn:
+            conn.execute("INSERT INTO encounter VALUES (?, ?, ?, ?, ?, ?)",
+                         row)
+
+    merge_shard_traces(db_path, shard_db_paths)
+
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT * FROM encounter").fetchall() == [
+            (0, 1, 2, "2024-07-01 08:00:00", "2024-07-01 09:30:00", "kitchen")
+        ]
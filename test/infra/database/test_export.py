@@ -0,0 +1,69 @@
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from cube.clock.virtual_clock import VirtualClock
+from cube.social_platform.database import create_db_async
+from cube.social_platform.platform_utils import AsyncPlatformUtils
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+from cube.social_platform.export import export_db, read_run_config  # noqa
+
+
+@pytest.mark.asyncio
+async def test_export_trace_in_chunks(tmp_path):
+    db_path = str(tmp_path / "trace.db")
+    await create_db_async(db_path)
+    start_time = datetime(2024, 7, 1, 8, 0)
+    pl_utils = AsyncPlatformUtils(db_path, start_time, VirtualClock())
+    for user_id in range(25):
+        await pl_utils._record_trace(user_id, "meet", {"new_agent": "0"},
+                                     room="square")
+    await pl_utils.close()
+    with sqlite3.connect(db_path) as conn:
+        # 文本列中混入的数字也能导出
+        conn.execute("UPDATE trace SET room = 7 WHERE user_id = 3")
+        # INTEGER列中的文本agent id会让整列导出为字符串
+        conn.execute(
+            "UPDATE trace SET other_agent_id = 'alice' WHERE user_id = 5")
+
+    paths = export_db(db_path, str(tmp_path / "export"), chunk_size=10,
+                      run_config={"clock_factor": 120})
+
+    assert set(paths) == {"trace", "stay", "encounter"}
+    parquet_file = pq.ParquetFile(paths["trace"])
+    assert parquet_file.num_row_groups == 3
+    table = parquet_file.read()
+    assert table.num_rows == 25
+    assert table.schema.field("user_id").type == pa.int64()
+    assert table.schema.field("created_at").type == pa.timestamp("us")
+    assert table.column("user_id").to_pylist() == list(range(25))
+    assert table.column("created_at")[0].as_py() == start_time
+    assert table.column("room").to_pylist()[3] == "7"
+    assert table.schema.field("other_agent_id").type == pa.string()
+    assert table.column("other_agent_id").to_pylist()[4:6] == ["0", "alice"]
+    assert read_run_config(paths["trace"]) == {"clock_factor": 120}
+
+
+@pytest.mark.asyncio
+async def test_failed_export_removes_partial_file(tmp_path):
+    db_path = str(tmp_path / "trace.db")
+    await create_db_async(db_path)
+    pl_utils = AsyncPlatformUtils(db_path, datetime(2024, 7, 1, 8, 0),
+                                  VirtualClock())
+    for user_id in range(25):
+        await pl_utils._record_trace(user_id, "meet", {"new_agent": "0"})
+    await pl_utils.close()
+    with sqlite3.connect(db_path) as conn:
+        # 第三个chunk中无法解析的时间
+        conn.execute(
+            "UPDATE trace SET created_at = 'later' WHERE user_id = 24")
+
+    output_dir = tmp_path / "export"
+    with pytest.raises(pa.ArrowInvalid):
+        export_db(db_path, str(output_dir), tables=("trace", ),
+                  chunk_size=10)
+    assert not (output_dir / "trace.parquet").exists()
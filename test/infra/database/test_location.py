@@ -0,0 +1,69 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from cube.clock.virtual_clock import VirtualClock
+from cube.social_platform.channel import Channel
+from cube.social_platform.location import LocationQuery
+from cube.social_platform.platform import Platform
+from cube.social_platform.typing import CommunityActionType
+from cube.social_platform.unity_api.unity_queue_manager import \
+    UnityQueueManager
+
+
+@pytest.mark.asyncio
+async def test_stays_follow_moves_and_activities(tmp_path):
+    db_path = str(tmp_path / "community.db")
+    start_time = datetime(2024, 7, 1, 8, 0)
+    channel = Channel()
+    platform = Platform(db_path,
+                        channel,
+                        UnityQueueManager(['0', '1']),
+                        VirtualClock(settle_time=0.001),
+                        start_time,
+                        movement_mode="logical")
+    await platform.create_async_db()
+    task = asyncio.create_task(platform.running())
+
+    async def act(agent_id, message, action):
+        message_id = await channel.write_to_receive_queue(
+            (agent_id, message, action.value))
+        return (await channel.read_from_send_queue(message_id))[2]
+
+    await act('0', "square", CommunityActionType.GO_TO)
+    await act('1', "square", CommunityActionType.GO_TO)
+    await act('0', ("chatting", 30), CommunityActionType.DO_SOMETHING)
+    await act('0', "west garden", CommunityActionType.GO_TO)
+    leave_time = start_time + timedelta(minutes=30)
+    arrival_time = leave_time + platform.room_graph.travel_time(
+        "square", "west garden")
+    await platform.flush_traces()
+
+    with LocationQuery(db_path) as query:
+        # 运行中也能查询已提交的停留
+        assert query.where_was(0, arrival_time).room == "west garden"
+        await channel.write_to_receive_queue(
+            (None, None, CommunityActionType.EXIT))
+        await task
+
+        # 到达和开始活动在同一时刻，没有长度的停留不会留下
+        history = query.history(0)
+        assert [(stay.room, stay.activity) for stay in history] == [
+            ("square", "chatting"),
+            ("west garden", None),
+        ]
+        assert history[0].enter_time == start_time
+        assert history[0].exit_time == leave_time
+        assert history[1].enter_time == arrival_time
+        assert history[1].exit_time is None
+
+        assert query.where_was(0, start_time + timedelta(minutes=10)) \
+            .activity == "chatting"
+        # 在路上时不在任何房间
+        assert query.where_was(0, leave_time) is None
+        assert [stay.user_id
+                for stay in query.who_was_in("square", leave_time)] == [1]
+        assert [stay.user_id for stay in query.occupancy(
+            "square", start_time, leave_time)] == [0, 1]
+        assert len(query.history(0, start=leave_time)) == 1
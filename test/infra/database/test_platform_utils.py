@@ -0,0 +1,36 @@
+import sqlite3
+
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_connection_is_shared_and_tuned(pl_utils):
+    db = await pl_utils.connect()
+    assert await pl_utils.connect() is db
+    async with db.execute("PRAGMA journal_mode") as cursor:
+        assert (await cursor.fetchone())[0] == "wal"
+    async with db.execute("PRAGMA synchronous") as cursor:
+        # 1 即 NORMAL
+        assert (await cursor.fetchone())[0] == 1
+
+
+@pytest.mark.asyncio
+async def test_close_keeps_written_traces(pl_utils):
+    for user_id in range(10):
+        await pl_utils._record_trace(user_id, "meet", {"new_agent": "0"})
+    async with pl_utils.batch_traces():
+        for user_id in range(10, 20):
+            await pl_utils._record_trace(user_id, "meet", {"new_agent": "0"})
+    await pl_utils.close()
+    await pl_utils.close()
+
+    with sqlite3.connect(pl_utils.db_path) as conn:
+        user_ids = [
+            row[0]
+            for row in conn.execute("SELECT user_id FROM trace ORDER BY 1")
+        ]
+    assert user_ids == list(range(20))
+
+    # 关闭后不再重新打开连接
+    with pytest.raises(RuntimeError):
+        await pl_utils.connect()
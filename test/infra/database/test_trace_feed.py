@@ -0,0 +1,140 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from cube.clock.virtual_clock import VirtualClock
+from cube.social_platform.channel import Channel
+from cube.social_platform.platform import Platform
+from cube.social_platform.typing import CommunityActionType
+from cube.social_platform.unity_api.unity_queue_manager import \
+    UnityQueueManager
+
+START_TIME = datetime(2024, 7, 1, 8, 0)
+
+
+async def collect(subscription, events):
+    async for event in subscription:
+        events.append(event)
+
+
+@pytest.mark.asyncio
+async def test_late_subscriber_catches_up_then_goes_live(pl_utils):
+    for user_id in range(3):
+        await pl_utils._record_trace(user_id, "plan_to", {"room": "square"})
+
+    events = []
+    task = asyncio.create_task(
+        collect(pl_utils.trace_feed.subscribe(), events))
+    await asyncio.sleep(0.01)
+    assert [event.user_id for event in events] == [0, 1, 2]
+
+    async with pl_utils.batch_traces():
+        await pl_utils._record_trace(3, "meet", {"new_agent": "0"})
+        await pl_utils._record_trace(0, "meet", {"new_agent": "3"})
+    await pl_utils._record_trace(3, "arrived", {"room": "square"})
+    await asyncio.sleep(0)
+    assert [(event.user_id, event.action) for event in events[3:]] == [
+        (3, "meet"), (0, "meet"), (3, "arrived")
+    ]
+    assert events[3].other_agent_id == 0
+    assert events[3].created_at == START_TIME
+    seqs = [event.seq for event in events]
+    assert seqs == sorted(seqs)
+
+    pl_utils.trace_feed.close()
+    await asyncio.wait_for(task, 1)
+
+
+@pytest.mark.asyncio
+async def test_filters_checkpoint_and_slow_subscriber(pl_utils):
+    await pl_utils._record_trace(0, "plan_to", {"room": "square"})
+    await pl_utils._record_trace(1, "plan_to", {"room": "square"})
+    checkpoint = pl_utils.trace_feed.current_seq()
+
+    events = []
+    subscription = pl_utils.trace_feed.subscribe(after_seq=checkpoint,
+                                                 user_ids=['1'],
+                                                 actions=["meet"],
+                                                 maxsize=2)
+    # 订阅者只取第一个事件，其余事件挤满队列
+    first = asyncio.create_task(subscription.__anext__())
+    await asyncio.sleep(0)
+    for i in range(10):
+        await pl_utils._record_trace(1, "meet", {"new_agent": str(i)})
+        await pl_utils._record_trace(0, "meet", {"new_agent": str(i)})
+    events.append(await first)
+    pl_utils.trace_feed.close()
+    await collect(subscription, events)
+
+    assert [event.info for event in events] == [{
+        "new_agent": str(i)
+    } for i in range(10)]
+    assert {event.user_id for event in events} == {1}
+
+
+@pytest.mark.asyncio
+async def test_platform_subscription_ends_on_exit(tmp_path):
+    channel = Channel()
+    platform = Platform(str(tmp_path / "community.db"),
+                        channel,
+                        UnityQueueManager(['0', '1']),
+                        VirtualClock(settle_time=0.001),
+                        START_TIME,
+                        movement_mode="logical")
+    await platform.create_async_db()
+    events = []
+    subscriber = asyncio.create_task(
+        collect(platform.subscribe_traces(actions=["arrived"]), events))
+    task = asyncio.create_task(platform.running())
+
+    for agent_id in ['0', '1']:
+        message_id = await channel.write_to_receive_queue(
+            (agent_id, "square", CommunityActionType.GO_TO.value))
+        await channel.read_from_send_queue(message_id)
+    await channel.write_to_receive_queue(
+        (None, None, CommunityActionType.EXIT))
+    await task
+    await asyncio.wait_for(subscriber, 1)
+
+    assert [(event.user_id, event.room) for event in events] == [
+        (0, "square"), (1, "square")
+    ]
+
+
+@pytest.mark.asyncio
+async def test_lagging_subscriber_catches_up_before_exit(tmp_path):
+    channel = Channel()
+    platform = Platform(str(tmp_path / "community.db"),
+                        channel,
+                        UnityQueueManager(['0', '1']),
+                        VirtualClock(settle_time=0.001),
+                        START_TIME,
+                        movement_mode="logical")
+    await platform.create_async_db()
+    events = []
+
+    async def slow_collect(subscription):
+        async for event in subscription:
+            events.append(event)
+            await asyncio.sleep(0.01)
+
+    # 队列只有2个位置，EXIT时订阅者已经落后，要从数据库补读
+    subscriber = asyncio.create_task(
+        slow_collect(platform.pl_utils.trace_feed.subscribe(maxsize=2)))
+    task = asyncio.create_task(platform.running())
+    for agent_id in ['0', '1']:
+        message_id = await channel.write_to_receive_queue(
+            (agent_id, "square", CommunityActionType.GO_TO.value))
+        await channel.read_from_send_queue(message_id)
+    await channel.write_to_receive_queue(
+        (None, None, CommunityActionType.EXIT))
+    await task
+    await asyncio.wait_for(subscriber, 1)
+
+    assert [(event.user_id, event.action) for event in events
+            if event.action == "arrived"] == [(0, "arrived"), (1, "arrived")]
+    assert platform.pl_utils._db is None
+    # EXIT之后的订阅不会重新打开数据库
+    with pytest.raises(RuntimeError):
+        await platform.subscribe_traces().__anext__()
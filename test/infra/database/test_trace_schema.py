@@ -0,0 +1,128 @@
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from cube.clock.virtual_clock import VirtualClock
+from cube.social_platform.database import create_db_async
+from cube.social_platform.platform_utils import AsyncPlatformUtils
+
+LEGACY_TRACE_SQL = """
+CREATE TABLE trace (
+    user_id INTEGER,
+    created_at DATETIME,
+    action TEXT,
+    info TEXT,
+    PRIMARY KEY(user_id, created_at)
+);
+"""
+
+
+@pytest.mark.asyncio
+async def test_same_agent_and_time_do_not_collide(tmp_path):
+    db_path = str(tmp_path / "trace.db")
+    await create_db_async(db_path)
+    start_time = datetime(2024, 7, 1, 8, 0)
+    pl_utils = AsyncPlatformUtils(db_path, start_time, VirtualClock())
+    for action in ["plan_to", "meet", "arrived"]:
+        await pl_utils._record_trace(0, action, {}, start_time)
+    await pl_utils.close()
+
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute("SELECT trace_id, seq, action FROM trace "
+                            "ORDER BY created_at, seq").fetchall()
+    assert [row[2] for row in rows] == ["plan_to", "meet", "arrived"]
+    assert [row[0] for row in rows] == [1, 2, 3]
+    assert rows[0][1] < rows[1][1] < rows[2][1]
+
+
+@pytest.mark.asyncio
+async def test_time_range_queries_use_the_indexes(tmp_path):
+    db_path = str(tmp_path / "trace.db")
+    await create_db_async(db_path)
+    with sqlite3.connect(db_path) as conn:
+        for query in [
+                "SELECT seq FROM trace WHERE user_id = 1 "
+                "AND created_at BETWEEN '2024-07-01' AND '2024-07-02'",
+                "SELECT user_id FROM trace WHERE action = 'meet' "
+                "AND created_at >= '2024-07-01'",
+        ]:
+            plan = " ".join(
+                row[-1]
+                for row in conn.execute(f"EXPLAIN QUERY PLAN {query}"))
+            assert "USING COVERING INDEX" in plan or "USING INDEX" in plan
+
+
+@pytest.mark.asyncio
+async def test_legacy_trace_table_is_migrated(tmp_path):
+    db_path = str(tmp_path / "legacy.db")
+    with sqlite3.connect(db_path) as conn:
+        conn.executescript(LEGACY_TRACE_SQL)
+        conn.executemany(
+            "INSERT INTO trace VALUES (?, ?, ?, ?)",
+            [(0, "2024-07-01 08:00:00", "plan_to", "{}"),
+             (1, "2024-07-01 08:00:00", "plan_to", "{}"),
+             (0, "2024-07-01 08:05:00", "arrived", "{}")])
+
+    await create_db_async(db_path)
+    # 再次创建不会重复迁移
+    await create_db_async(db_path)
+
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute("SELECT trace_id, seq, user_id, action "
+                            "FROM trace ORDER BY trace_id").fetchall()
+        tables = {
+            row[0]
+            for row in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table'")
+        }
+    assert rows == [(1, 1, 0, "plan_to"), (2, 2, 1, "plan_to"),
+                    (3, 3, 0, "arrived")]
+    assert "trace_legacy" not in tables
+
+
+@pytest.mark.asyncio
+async def test_typed_columns_are_filled_at_write_time(tmp_path):
+    db_path = str(tmp_path / "trace.db")
+    await create_db_async(db_path)
+    start_time = datetime(2024, 7, 1, 8, 0)
+    pl_utils = AsyncPlatformUtils(db_path, start_time, VirtualClock())
+    await pl_utils._record_trace(0, "arrived", {"room": "square"})
+    await pl_utils._record_trace(0, "meet", {"new_agent": "1"},
+                                 room="square")
+    await pl_utils._record_trace(0, "start_activity", {"activity": "chat"},
+                                 room="square", duration=30)
+    await pl_utils.close()
+
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute("SELECT action, room, activity, other_agent_id, "
+                            "duration FROM trace ORDER BY seq").fetchall()
+        plan = " ".join(row[-1] for row in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT user_id FROM trace "
+            "WHERE room = 'square' AND action = 'meet'"))
+    assert rows == [("arrived", "square", None, None, None),
+                    ("meet", "square", None, 1, None),
+                    ("start_activity", "square", "chat", None, 30)]
+    assert "trace_room_action_time" in plan
+
+
+@pytest.mark.asyncio
+async def test_typed_columns_are_backfilled(tmp_path):
+    db_path = str(tmp_path / "untyped.db")
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("CREATE TABLE trace (trace_id INTEGER PRIMARY KEY "
+                     "AUTOINCREMENT, seq INTEGER NOT NULL, user_id INTEGER, "
+                     "created_at DATETIME, action TEXT, info TEXT)")
+        conn.executemany(
+            "INSERT INTO trace (seq, user_id, created_at, action, info) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [(1, 0, "2024-07-01 08:00:00", "arrived", '{"room": "square"}'),
+             (2, 0, "2024-07-01 08:01:00", "meet", '{"new_agent": "1"}'),
+             (3, 0, "2024-07-01 08:02:00", "sign_up", '"not an object"')])
+
+    await create_db_async(db_path)
+
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute("SELECT room, other_agent_id FROM trace "
+                            "ORDER BY seq").fetchall()
+    assert rows == [("square", None), (None, 1), (None, None)]
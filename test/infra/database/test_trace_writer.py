@@ -0,0 +1,91 @@
+import asyncio
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from cube.clock.virtual_clock import VirtualClock
+from cube.social_platform.database import create_db_async
+from cube.social_platform.platform_utils import AsyncPlatformUtils
+from cube.social_platform.trace_writer import TraceWriter
+
+
+class RecordingSink:
+
+    def __init__(self, fail_times=0):
+        self.batches = []
+        self.fail_times = fail_times
+
+    async def __call__(self, rows):
+        await asyncio.sleep(0)
+        if self.fail_times:
+            self.fail_times -= 1
+            raise RuntimeError("database is locked")
+        self.batches.append(list(rows))
+
+
+@pytest.mark.asyncio
+async def test_rows_are_grouped_until_the_interval():
+    sink = RecordingSink()
+    writer = TraceWriter(sink, max_rows=100, flush_interval=0.05)
+    for i in range(10):
+        await writer.write((i, ))
+    assert sink.batches == []
+    await asyncio.sleep(0.1)
+    assert sink.batches == [[(i, ) for i in range(10)]]
+    await writer.close()
+
+
+@pytest.mark.asyncio
+async def test_full_buffer_flushes_without_waiting():
+    sink = RecordingSink()
+    writer = TraceWriter(sink, max_rows=5, flush_interval=60)
+    await writer.write_many([(i, ) for i in range(5)])
+    await asyncio.sleep(0.01)
+    assert sink.batches == [[(i, ) for i in range(5)]]
+    await writer.close()
+
+
+@pytest.mark.asyncio
+async def test_zero_interval_commits_every_write():
+    sink = RecordingSink()
+    writer = TraceWriter(sink, flush_interval=0)
+    await writer.write((0, ))
+    await writer.write((1, ))
+    assert sink.batches == [[(0, )], [(1, )]]
+
+
+@pytest.mark.asyncio
+async def test_flush_is_a_barrier_and_keeps_failed_rows():
+    sink = RecordingSink(fail_times=1)
+    writer = TraceWriter(sink, flush_interval=60)
+    await writer.write_many([(0, ), (1, )])
+    with pytest.raises(RuntimeError):
+        await writer.flush()
+    assert writer.buffered == 2
+    await writer.write((2, ))
+    await writer.flush()
+    assert sink.batches == [[(0, ), (1, ), (2, )]]
+    await writer.close()
+
+
+@pytest.mark.asyncio
+async def test_close_flushes_platform_traces(tmp_path):
+    db_path = str(tmp_path / "trace.db")
+    await create_db_async(db_path)
+    pl_utils = AsyncPlatformUtils(db_path, datetime(2024, 7, 1, 8, 0),
+                                  VirtualClock(), trace_flush_interval=60)
+
+    def count_rows():
+        with sqlite3.connect(db_path) as conn:
+            return conn.execute("SELECT COUNT(*) FROM trace").fetchone()[0]
+
+    for user_id in range(3):
+        await pl_utils._record_trace(user_id, "meet", {"new_agent": "0"})
+    assert count_rows() == 0
+    await pl_utils.flush_traces()
+    assert count_rows() == 3
+
+    await pl_utils._record_trace(3, "arrived", {"room": "kitchen"})
+    await pl_utils.close()
+    assert count_rows() == 4
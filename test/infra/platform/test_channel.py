@@ -0,0 +1,170 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from cube.social_platform.channel import Channel
+
+
+async def echo_platform(channel: Channel, count: int):
+    for _ in range(count):
+        message_id, data = await channel.receive_from()
+        await channel.send_to((message_id, data[0], data))
+
+
+@pytest.mark.asyncio
+async def test_round_trip_is_not_polled():
+    channel = Channel()
+    task = asyncio.create_task(echo_platform(channel, 1))
+    start = time.perf_counter()
+    message_id = await channel.write_to_receive_queue(('0', 'hi', 'echo'))
+    response = await channel.read_from_send_queue(message_id)
+    assert time.perf_counter() - start < 0.05
+    assert response == (message_id, '0', ('0', 'hi', 'echo'))
+    assert channel.pending == {}
+    await task
+
+
+@pytest.mark.asyncio
+async def test_many_concurrent_requests():
+    channel = Channel()
+    count = 2000
+    task = asyncio.create_task(echo_platform(channel, count))
+
+    async def request(i):
+        message_id = await channel.write_to_receive_queue((str(i), i, 'echo'))
+        return (await channel.read_from_send_queue(message_id))[1]
+
+    results = await asyncio.gather(*(request(i) for i in range(count)))
+    assert results == [str(i) for i in range(count)]
+    assert channel.pending == {}
+    await task
+
+
+@pytest.mark.asyncio
+async def test_response_before_read():
+    channel = Channel()
+    await channel.send_to(('unknown', '0', {"success": True}))
+    response = await channel.read_from_send_queue('unknown')
+    assert response == ('unknown', '0', {"success": True})
+    assert channel.pending == {}
+
+
+@pytest.mark.asyncio
+async def test_metrics(tmp_path):
+    channel = Channel(metrics_path=str(tmp_path / "metrics.json"))
+    ids = [
+        await channel.write_to_receive_queue(('0', i, 'go_to'))
+        for i in range(3)
+    ]
+    await channel.write_to_receive_queue((None, None, 'exit'))
+    snapshot = channel.metrics()
+    assert snapshot["queue_depth"] == 4
+    assert snapshot["max_queue_depth"] == 4
+    assert snapshot["pending_responses"] == 4
+
+    # EXIT走control通道，先于排队的请求被取出
+    assert (await channel.receive_from())[1][2] == 'exit'
+    await echo_platform(channel, 3)
+    for message_id in ids:
+        await channel.read_from_send_queue(message_id)
+    snapshot = channel.metrics()
+    assert snapshot["queue_depth"] == 0
+    assert snapshot["in_flight"] == 0
+    assert (snapshot["requests"], snapshot["responses"]) == (4, 3)
+    assert snapshot["latency"]["go_to"]["dequeue"]["count"] == 3
+    assert snapshot["latency"]["go_to"]["round_trip"]["count"] == 3
+    assert snapshot["latency"]["exit"]["dequeue"]["count"] == 1
+
+    channel.dump_metrics()
+    with open(tmp_path / "metrics.json") as f:
+        assert json.load(f)["responses"] == 3
+
+
+@pytest.mark.asyncio
+async def test_exit_overtakes_bulk_and_rejects_queued():
+    channel = Channel()
+    batch_ids = [
+        await channel.write_batch_to_receive_queue('0', [(i, 'go_to')])
+        for i in range(3)
+    ]
+    normal_id = await channel.write_to_receive_queue(('1', 'x', 'go_to'))
+    await channel.write_to_receive_queue((None, None, 'exit'))
+    assert channel.metrics()["lane_depths"] == {
+        "control": 1,
+        "interactive": 0,
+        "default": 1,
+        "bulk": 3
+    }
+
+    _, data = await channel.receive_from()
+    assert data[2] == 'exit'
+    assert await channel.reject_queued_requests("bye") == 4
+    response = await channel.read_from_send_queue(normal_id)
+    assert response == (normal_id, '1', {"success": False, "error": "bye"})
+    for message_id in batch_ids:
+        assert (await channel.read_from_send_queue(message_id))[1] == '0'
+    assert channel.metrics()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_timeout_cancels_request():
+    channel = Channel(request_timeout=0.05)
+    cancelled = []
+    channel.add_cancel_listener(cancelled.append)
+    message_id = await channel.write_to_receive_queue(('0', 'x', 'go_to'))
+    received_id, _ = await channel.receive_from()
+    with pytest.raises(asyncio.TimeoutError):
+        await channel.read_from_send_queue(message_id)
+    assert cancelled == [received_id]
+    # 迟到的响应被丢弃，不会残留在pending里
+    await channel.send_to((message_id, '0', {"success": True}))
+    assert channel.pending == {}
+    assert channel.metrics()["cancelled"] == 1
+    assert channel.metrics()["responses"] == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_while_queued_is_skipped():
+    channel = Channel()
+    first = await channel.write_to_receive_queue(('0', 1, 'go_to'))
+    second = await channel.write_to_receive_queue(('0', 2, 'go_to'))
+    reader = asyncio.create_task(channel.read_from_send_queue(first))
+    await asyncio.sleep(0)
+    reader.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await reader
+    message_id, _ = await channel.receive_from()
+    assert message_id == second
+    assert channel.receive_queue.empty()
+
+
+@pytest.mark.asyncio
+async def test_unread_responses_are_evicted():
+    channel = Channel(orphan_ttl=0.0)
+    message_id = await channel.write_to_receive_queue(('0', 1, 'go_to'))
+    await channel.receive_from()
+    await channel.send_to((message_id, '0', {"success": True}))
+    assert message_id in channel.pending
+    await asyncio.sleep(0.01)
+    assert channel.evict_orphans() == 1
+    assert channel.pending == {}
+
+
+@pytest.mark.asyncio
+async def test_receive_queued_takes_overtaken_requests():
+    channel = Channel()
+    batch_id = await channel.write_batch_to_receive_queue('0', [(1, 'go_to')])
+    normal_id = await channel.write_to_receive_queue(('1', 'x', 'go_to'))
+    cancelled_id = await channel.write_to_receive_queue(('2', 'y', 'go_to'))
+    channel.cancel(cancelled_id)
+    await channel.write_to_receive_queue((None, None, 'exit'))
+    await channel.write_to_receive_queue((None, None, 'exit'))
+
+    _, data = await channel.receive_from()
+    assert data[2] == 'exit'
+    # 第二个EXIT被确认，已取消的请求被丢弃，其余按通道顺序返回
+    assert [message_id for message_id, _ in channel.receive_queued()
+            ] == [normal_id, batch_id]
+    assert channel.receive_queue.empty()
@@ -0,0 +1,51 @@
+import asyncio
+from collections import Counter
+
+import pytest
+
+from cube.social_platform.lane_queue import LaneQueue
+
+
+@pytest.mark.asyncio
+async def test_strict_lane_goes_first():
+    queue = LaneQueue()
+    for i in range(5):
+        await queue.put(("bulk", i), "bulk")
+    await queue.put("exit", "control")
+    assert await queue.get() == "exit"
+    assert await queue.get() == ("bulk", 0)
+
+
+@pytest.mark.asyncio
+async def test_weighted_round_robin():
+    queue = LaneQueue()
+    for lane in ("interactive", "default", "bulk"):
+        for i in range(100):
+            queue.put_nowait(lane, lane)
+    served = Counter([await queue.get() for _ in range(26)])
+    assert served == {"interactive": 16, "default": 8, "bulk": 2}
+    # 其他通道为空时，bulk不会被推迟
+    while not queue.empty():
+        await queue.get()
+    queue.put_nowait(1, "bulk")
+    assert queue.get_nowait() == 1
+
+
+@pytest.mark.asyncio
+async def test_get_waits_for_put():
+    queue = LaneQueue({"a": None, "b": 1}, default_lane="b")
+    getter = asyncio.create_task(queue.get())
+    await asyncio.sleep(0)
+    assert not getter.done()
+    queue.put_nowait("x")
+    assert await getter == "x"
+    assert queue.lane_sizes() == {"a": 0, "b": 0}
+
+
+def test_invalid_lanes():
+    with pytest.raises(ValueError):
+        LaneQueue({"a": 1}, default_lane="b")
+    with pytest.raises(ValueError):
+        LaneQueue({"default": 0})
+    with pytest.raises(ValueError):
+        LaneQueue().put_nowait(1, "nowhere")
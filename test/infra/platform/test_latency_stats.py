@@ -0,0 +1,31 @@
+import pytest
+
+from cube.social_platform.metrics import LatencyHistogram, LatencyStats
+
+
+def test_latency_histogram():
+    histogram = LatencyHistogram()
+    for seconds in (0.002, 0.003, 0.004, 2.0):
+        histogram.observe(seconds)
+    assert histogram.count == 4
+    assert histogram.total == pytest.approx(2.009)
+    assert histogram.max == 2.0
+    assert histogram.quantile(0.5) == 0.005
+    assert histogram.quantile(0.99) == 2.0
+
+
+def test_latency_stats_summary():
+    stats = LatencyStats()
+    stats.observe("go_to", "handler", 3.0)
+    stats.observe("go_to", "unity_wait", 2.5)
+    stats.observe("do_something", "handler", 0.1)
+    with stats.measure("do_something", "queue_wait"):
+        pass
+    stats.record_error("go_to")
+
+    summary = stats.summary()
+    assert summary["go_to"]["handler"]["count"] == 1
+    assert summary["go_to"]["errors"] == {"count": 1}
+    assert summary["do_something"]["queue_wait"]["count"] == 1
+    # 报表按总耗时排序，go_to的handler排在第一行
+    assert stats.report().splitlines()[1].startswith("go_to")
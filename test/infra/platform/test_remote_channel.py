@@ -0,0 +1,144 @@
+import asyncio
+import gc
+import multiprocessing as mp
+import os.path as osp
+
+import pytest
+
+from cube.social_platform.channel import Channel
+from cube.social_platform.remote_channel import ChannelServer, RemoteChannel
+from cube.social_platform.typing import CommunityActionType
+
+
+async def echo_platform(channel: Channel):
+    while True:
+        message_id, data = await channel.receive_from()
+        agent_id, message, action = data
+        if action == CommunityActionType.BATCH.value:
+            result = {"success": True, "results": [m for m, _ in message]}
+        else:
+            result = {"success": True, "echo": message}
+        await channel.send_to((message_id, agent_id, result))
+
+
+async def run_agents(address, agent_ids):
+    channel = RemoteChannel(address)
+
+    async def act(agent_id):
+        message_id = await channel.write_to_receive_queue(
+            (agent_id, f"hello from {agent_id}", "echo"))
+        return (await channel.read_from_send_queue(message_id))[2]["echo"]
+
+    results = await asyncio.gather(*(act(agent_id) for agent_id in agent_ids))
+    await channel.close()
+    return results
+
+
+def worker(address, agent_ids, results):
+    results.put(asyncio.run(run_agents(address, agent_ids)))
+
+
+@pytest.mark.asyncio
+async def test_requests_over_unix_socket(tmp_path):
+    address = str(tmp_path / "channel.sock")
+    channel = Channel()
+    platform_task = asyncio.create_task(echo_platform(channel))
+    server = await ChannelServer(channel, address).start()
+    try:
+        results = await run_agents(address, [str(i) for i in range(100)])
+        assert results == [f"hello from {i}" for i in range(100)]
+
+        remote = RemoteChannel(address)
+        message_id = await remote.write_batch_to_receive_queue(
+            '0', [(1, "a"), (2, "b")])
+        response = await remote.read_from_send_queue(message_id)
+        assert response[1:] == ('0', {"success": True, "results": [1, 2]})
+        await remote.close()
+    finally:
+        await server.stop()
+        platform_task.cancel()
+    assert not osp.exists(address)
+
+
+@pytest.mark.asyncio
+async def test_agents_in_worker_processes(tmp_path):
+    address = str(tmp_path / "channel.sock")
+    channel = Channel()
+    platform_task = asyncio.create_task(echo_platform(channel))
+    server = await ChannelServer(channel, address).start()
+    ctx = mp.get_context("spawn")
+    results = ctx.Queue()
+    processes = [
+        ctx.Process(target=worker,
+                    args=(address, [f"{p}-{i}" for i in range(20)], results))
+        for p in range(2)
+    ]
+    loop = asyncio.get_running_loop()
+    try:
+        for process in processes:
+            process.start()
+        outputs = [
+            await loop.run_in_executor(None, results.get, True, 30)
+            for _ in processes
+        ]
+        for process in processes:
+            await loop.run_in_executor(None, process.join)
+    finally:
+        await server.stop()
+        platform_task.cancel()
+    assert sorted(sum(outputs, [])) == sorted(f"hello from {p}-{i}"
+                                              for p in range(2)
+                                              for i in range(20))
+
+
+@pytest.mark.asyncio
+async def test_remote_timeout_cancels_on_server(tmp_path, caplog):
+    address = str(tmp_path / "channel.sock")
+    channel = Channel()
+    server = await ChannelServer(channel, address).start()
+    remote = RemoteChannel(address)
+    try:
+        # 平台不响应，请求在客户端超时
+        message_id = await remote.write_to_receive_queue(('0', 'x', 'go_to'),
+                                                         timeout=0.1)
+        with pytest.raises(asyncio.TimeoutError):
+            await remote.read_from_send_queue(message_id)
+        for _ in range(50):
+            if channel.metrics()["cancelled"]:
+                break
+            await asyncio.sleep(0.01)
+        assert channel.metrics()["cancelled"] == 1
+        assert channel.metrics()["in_flight"] == 0
+        await asyncio.sleep(0.05)
+        gc.collect()
+        assert "exception was never retrieved" not in caplog.text
+    finally:
+        await remote.close()
+        await server.stop()
+
+
+@pytest.mark.asyncio
+async def test_remote_reconnects_after_server_restart(tmp_path):
+    address = str(tmp_path / "channel.sock")
+    channel = Channel()
+    platform_task = asyncio.create_task(echo_platform(channel))
+    server = await ChannelServer(channel, address).start()
+    remote = RemoteChannel(address)
+    try:
+        message_id = await remote.write_to_receive_queue(('0', 'a', 'echo'))
+        await remote.read_from_send_queue(message_id)
+        # 服务器重启后，同一个RemoteChannel重新连接
+        await server.stop()
+        for _ in range(50):
+            if remote._writer is None:
+                break
+            await asyncio.sleep(0.01)
+        server = await ChannelServer(channel, address).start()
+        message_id = await remote.write_to_receive_queue(('0', 'b', 'echo'))
+        response = await asyncio.wait_for(
+            remote.read_from_send_queue(message_id), 5)
+        assert response[2]["echo"] == 'b'
+    finally:
+        await remote.close()
+        await server.stop()
+        platform_task.cancel()
@@ -0,0 +1,64 @@
+import json
+import math
+import os.path as osp
+from datetime import timedelta
+
+import pytest
+
+from cube.social_platform.config import RoomGraph
+
+parent_folder = osp.dirname(osp.abspath(__file__))
+
+
+def test_default_environment():
+    graph = RoomGraph.load()
+    assert graph.name == "community"
+    assert graph.coordinate("west garden") == (12.0, 0.0, -5.0)
+    assert "west garden" in graph
+    assert "nowhere" not in graph
+    assert graph.distance("west garden", "square") == pytest.approx(
+        math.dist((12, 0, -5), (11, 0, -20)))
+    assert graph.distance("square", "square") == 0.0
+
+
+def test_travel_time_uses_walking_speed():
+    graph = RoomGraph({"a": (0, 0, 0), "b": (3, 0, 4)}, walking_speed=0.5)
+    assert graph.distance("a", "b") == 5.0
+    assert graph.travel_time("a", "b") == timedelta(seconds=10)
+    assert graph.travel_time("b", "a") == timedelta(seconds=10)
+
+
+def test_edges_use_shortest_paths():
+    rooms = {"a": (0, 0, 0), "b": (10, 0, 0), "c": (10, 0, 10),
+             "d": (50, 0, 50)}
+    graph = RoomGraph(rooms, edges=[["a", "b"], ["b", "c"], ["a", "c", 30]])
+    # 经过b比直接的走廊更近
+    assert graph.distance("a", "c") == 20.0
+    assert graph.distance("c", "a") == 20.0
+    assert graph.distance("a", "d") == math.inf
+    with pytest.raises(ValueError):
+        graph.travel_time("a", "d")
+
+
+def test_unknown_rooms_are_rejected():
+    graph = RoomGraph({"a": (0, 0, 0)})
+    with pytest.raises(ValueError, match="Unknown room"):
+        graph.coordinate("b")
+    with pytest.raises(ValueError, match="Unknown room"):
+        RoomGraph({"a": (0, 0, 0)}, edges=[["a", "b"]])
+
+
+def test_load_from_file(tmp_path):
+    path = tmp_path / "tiny.json"
+    path.write_text(
+        json.dumps({
+            "name": "tiny",
+            "walking_speed": 2.0,
+            "rooms": {
+                "a": [0, 0, 0],
+                "b": [0, 0, 8]
+            }
+        }))
+    graph = RoomGraph.load(str(path))
+    assert graph.name == "tiny"
+    assert graph.travel_time("a", "b") == timedelta(seconds=4)
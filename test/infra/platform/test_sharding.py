@@ -0,0 +1,188 @@
+import asyncio
+import os
+import os.path as osp
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from cube.clock.clock import Clock
+from cube.social_platform.channel import Channel
+from cube.social_platform.sharding import (ShardedPlatform,
+                                           get_shard_db_path, shard_for)
+from cube.social_platform.typing import CommunityActionType
+
+parent_folder = osp.dirname(osp.abspath(__file__))
+test_db_filepath = osp.join(parent_folder, "test_sharding.db")
+NUM_SHARDS = 2
+
+
+def _remove_dbs():
+    for db_path in [test_db_filepath] + [
+            get_shard_db_path(test_db_filepath, i) for i in range(NUM_SHARDS)
+    ]:
+        # 被杀死的分片进程会留下WAL文件
+        for path in (db_path, db_path + "-wal", db_path + "-shm"):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+@pytest.fixture
+def setup_db():
+    _remove_dbs()
+    yield
+    _remove_dbs()
+
+
+def test_shard_for():
+    assert shard_for('3', 2) == 1
+    assert shard_for(4, 2) == 0
+    assert shard_for('alice', 4) == shard_for('alice', 4)
+
+
+@pytest.mark.asyncio
+async def test_sharded_platform_merges_traces(setup_db):
+    agent_ids = [str(i) for i in range(4)]
+    channel = Channel()
+    # K = 3600时，沙盒中1分钟对应真实时间1/60秒
+    platform = ShardedPlatform(test_db_filepath,
+                               channel,
+                               agent_ids,
+                               Clock(k=3600),
+                               datetime(2024, 7, 1, 8, 0),
+                               num_shards=NUM_SHARDS)
+    await platform.create_async_db()
+    task = asyncio.create_task(platform.running())
+
+    async def act(agent_id):
+        message_id = await channel.write_to_receive_queue(
+            (agent_id, ('reading', 1), CommunityActionType.DO_SOMETHING.value))
+        return (await channel.read_from_send_queue(message_id))[1:]
+
+    results = await asyncio.wait_for(
+        asyncio.gather(*(act(agent_id) for agent_id in agent_ids)), 60)
+    assert results == [(agent_id, {
+        "success": True,
+        "activity": "reading"
+    }) for agent_id in agent_ids]
+
+    await channel.write_to_receive_queue(
+        (None, None, CommunityActionType.EXIT))
+    await asyncio.wait_for(task, 60)
+
+    conn = sqlite3.connect(test_db_filepath)
+    rows = conn.execute(
+        "SELECT user_id, action FROM trace ORDER BY user_id, created_at"
+    ).fetchall()
+    conn.close()
+    assert len(rows) == 8
+    assert {row[0] for row in rows} == {0, 1, 2, 3}
+
+
+@pytest.mark.asyncio
+async def test_sharded_platform_cancels_timed_out_request(setup_db):
+    agent_ids = [str(i) for i in range(4)]
+    channel = Channel()
+    platform = ShardedPlatform(test_db_filepath,
+                               channel,
+                               agent_ids,
+                               Clock(k=3600),
+                               datetime(2024, 7, 1, 8, 0),
+                               num_shards=NUM_SHARDS)
+    await platform.create_async_db()
+    task = asyncio.create_task(platform.running())
+
+    async def act(agent_id, duration, timeout=None):
+        message_id = await channel.write_to_receive_queue(
+            (agent_id, ('reading', duration),
+             CommunityActionType.DO_SOMETHING.value),
+            timeout=timeout)
+        return (await channel.read_from_send_queue(message_id))[2]
+
+    # 先等分片进程启动完毕
+    await asyncio.wait_for(
+        asyncio.gather(*(act(agent_id, 1) for agent_id in agent_ids)), 60)
+    # 沙盒中10小时对应真实时间10秒，远超请求的截止时间
+    with pytest.raises(asyncio.TimeoutError):
+        await act('1', 600, timeout=0.5)
+    assert platform._request_shards == {}
+
+    await channel.write_to_receive_queue(
+        (None, None, CommunityActionType.EXIT))
+    await asyncio.wait_for(task, 8)
+
+    conn = sqlite3.connect(test_db_filepath)
+    rows = conn.execute(
+        "SELECT action FROM trace WHERE user_id = 1 ORDER BY seq").fetchall()
+    conn.close()
+    # 被取消的活动没有end_activity
+    assert [row[0] for row in rows] == [
+        "start_activity", "end_activity", "start_activity"
+    ]
+
+
+def test_sharded_platform_rejects_logical_movement(setup_db):
+    with pytest.raises(ValueError, match="logical"):
+        ShardedPlatform(test_db_filepath, Channel(), ['0', '1'],
+                        Clock(k=60), datetime(2024, 7, 1, 8, 0),
+                        num_shards=NUM_SHARDS, movement_mode="logical")
+
+
+def test_sharded_platform_validates_platform_kwargs(setup_db):
+    for platform_kwargs in ({
+            "trace_flush_interval": -1
+    }, {
+            "no_such_option": 1
+    }):
+        with pytest.raises(ValueError):
+            ShardedPlatform(test_db_filepath, Channel(), ['0', '1'],
+                            Clock(k=60), datetime(2024, 7, 1, 8, 0),
+                            num_shards=NUM_SHARDS, **platform_kwargs)
+
+
+@pytest.mark.asyncio
+async def test_sharded_platform_fails_requests_of_dead_shard(setup_db):
+    agent_ids = [str(i) for i in range(4)]
+    channel = Channel()
+    platform = ShardedPlatform(test_db_filepath,
+                               channel,
+                               agent_ids,
+                               Clock(k=3600),
+                               datetime(2024, 7, 1, 8, 0),
+                               num_shards=NUM_SHARDS)
+    await platform.create_async_db()
+    task = asyncio.create_task(platform.running())
+
+    async def act(agent_id):
+        message_id = await channel.write_to_receive_queue(
+            (agent_id, ('reading', 1), CommunityActionType.DO_SOMETHING.value))
+        return (await channel.read_from_send_queue(message_id))[2]
+
+    await asyncio.wait_for(
+        asyncio.gather(*(act(agent_id) for agent_id in agent_ids)), 60)
+    # 分片进程被杀死，来不及发出结束标记
+    platform.processes[shard_for('1', NUM_SHARDS)].kill()
+    result = await asyncio.wait_for(act('1'), 10)
+    assert result["success"] is False
+    with pytest.raises(RuntimeError, match="exited"):
+        await asyncio.wait_for(task, 10)
+    assert not any(process.is_alive() for process in platform.processes)
+
+
+@pytest.mark.asyncio
+async def test_sharded_platform_raises_when_shards_fail_to_start(setup_db):
+    channel = Channel()
+    platform = ShardedPlatform(test_db_filepath, channel, ['0', '1'],
+                               Clock(k=3600), datetime(2024, 7, 1, 8, 0),
+                               num_shards=NUM_SHARDS)
+    # 绕过路由进程中的检查，让分片进程在创建Platform时出错
+    platform.platform_kwargs = {"trace_flush_interval": -1}
+    await platform.create_async_db()
+    task = asyncio.create_task(platform.running())
+    message_id = await channel.write_to_receive_queue(
+        ('0', ('reading', 1), CommunityActionType.DO_SOMETHING.value))
+    response = await asyncio.wait_for(channel.read_from_send_queue(message_id),
+                                      60)
+    assert response[2]["success"] is False
+    with pytest.raises(RuntimeError, match="exited"):
+        await asyncio.wait_for(task, 10)
@@ -0,0 +1,134 @@
+import asyncio
+
+import pytest
+
+from cube.social_platform.task_registry import TaskRegistry
+
+
+@pytest.mark.asyncio
+async def test_finished_tasks_are_removed():
+    registry = TaskRegistry()
+
+    async def work():
+        await asyncio.sleep(0)
+
+    for _ in range(100):
+        await registry.submit('0', work())
+    assert registry.backlog == 100
+    await registry.drain()
+    assert registry.backlog == 0
+    assert registry._agent_locks == {}
+    assert registry._agent_pending == {}
+
+
+@pytest.mark.asyncio
+async def test_same_agent_requests_run_in_order():
+    registry = TaskRegistry()
+    order = []
+
+    async def work(agent_id, i, delay):
+        await asyncio.sleep(delay)
+        order.append((agent_id, i))
+
+    await registry.submit('0', work('0', 0, 0.03))
+    await registry.submit('0', work('0', 1, 0.0))
+    await registry.submit('1', work('1', 0, 0.01))
+    await asyncio.sleep(0)
+    assert registry.waiting == 1
+    await registry.drain()
+    assert order == [('1', 0), ('0', 0), ('0', 1)]
+
+
+@pytest.mark.asyncio
+async def test_in_flight_tasks_are_capped():
+    registry = TaskRegistry(max_in_flight=2)
+    release = asyncio.Event()
+    running = 0
+    max_running = 0
+
+    async def work():
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await release.wait()
+        running -= 1
+
+    async def submit_all():
+        for i in range(5):
+            await registry.submit(str(i), work())
+
+    submitter = asyncio.create_task(submit_all())
+    await asyncio.sleep(0.01)
+    assert registry.backlog == 2
+    assert not submitter.done()
+    release.set()
+    await submitter
+    await registry.drain()
+    assert max_running == 2
+
+
+@pytest.mark.asyncio
+async def test_cancelled_task_is_cleaned_up():
+    registry = TaskRegistry()
+    task = await registry.submit('0', asyncio.sleep(10))
+    task.cancel()
+    await registry.drain()
+    assert registry.backlog == 0
+    assert registry._agent_pending == {}
+
+
+@pytest.mark.asyncio
+async def test_yielded_slot_is_taken_again():
+    registry = TaskRegistry(max_in_flight=1)
+    wake = asyncio.Event()
+    started = []
+
+    async def sleeper():
+        started.append("sleeper")
+        async with registry.yield_slot():
+            await wake.wait()
+        started.append("woke")
+
+    async def work(i):
+        started.append(i)
+
+    await registry.submit('0', sleeper())
+    # 睡眠中的任务让出了名额，后面的请求不用等它
+    await asyncio.wait_for(registry.submit('1', work(1)), 1)
+    await asyncio.wait_for(registry.submit('2', work(2)), 1)
+    await asyncio.sleep(0)
+    wake.set()
+    await registry.drain()
+    assert started == ["sleeper", 1, 2, "woke"]
+    assert registry._semaphore._value == 1
+    assert registry._yielded == set()
+
+
+@pytest.mark.asyncio
+async def test_request_queued_behind_its_agent_gives_up_its_slot():
+    registry = TaskRegistry(max_in_flight=1)
+    wake = asyncio.Event()
+    order = []
+
+    async def sleeper():
+        async with registry.yield_slot():
+            await wake.wait()
+        order.append("first")
+
+    async def work(name):
+        order.append(name)
+
+    await registry.submit('0', sleeper(), lambda: order.append("start 0"))
+    await asyncio.wait_for(
+        registry.submit('0', work("second"), lambda: order.append("start 1")),
+        1)
+    await asyncio.sleep(0)
+    # 第二个请求在等同一agent的第一个请求，名额留给其他agent
+    await asyncio.wait_for(registry.submit('1', work("other")), 1)
+    await asyncio.sleep(0)
+    # 名额只限制运行中的处理，睡眠和排队的任务不计
+    assert registry.backlog == 2
+    wake.set()
+    await registry.drain()
+    assert order == ["start 0", "start 1", "other", "first", "second"]
+    assert registry._semaphore._value == 1
@@ -0,0 +1,74 @@
+import os.path as osp
+import sqlite3
+
+import numpy as np
+import pytest
+
+from cube.social_platform.database import (fetch_rec_table_as_matrix,
+                                           insert_matrix_into_rec_table)
+from cube.social_platform.rec_matrix import RecMatrix
+
+schema_dir = osp.join(osp.dirname(osp.abspath(__file__)), "../../..",
+                      "cube/social_platform/schema")
+
+
+def create_rec_db(num_users):
+    conn = sqlite3.connect(":memory:")
+    for name in ("user.sql", "rec.sql"):
+        with open(osp.join(schema_dir, name)) as f:
+            conn.executescript(f.read())
+    conn.executemany("INSERT INTO user (user_name) VALUES (?)",
+                     [(f"user{i}", ) for i in range(num_users)])
+    return conn
+
+
+def test_matrix_behaves_like_lists():
+    matrix = RecMatrix.from_lists([None, [3], [], [2, 3]])
+    assert matrix.num_users == 3
+    assert len(matrix) == 4
+    assert matrix[0] is None
+    assert matrix[1] == [3]
+    assert matrix[-1] == [2, 3]
+    assert matrix[1:] == [[3], [], [2, 3]]
+    assert list(matrix) == [None, [3], [], [2, 3]]
+    assert matrix == [None, [3], [], [2, 3]]
+    assert np.array_equal(matrix.row(3), [2, 3])
+    users, posts = matrix.pairs()
+    assert users.tolist() == [1, 3, 3]
+    assert posts.tolist() == [3, 2, 3]
+    with pytest.raises(IndexError):
+        matrix.row(4)
+
+    uniform = RecMatrix.uniform(2, ['1', '2'])
+    assert uniform == [None, ['1', '2'], ['1', '2']]
+    assert uniform == RecMatrix.from_rows([['1', '2'], ['1', '2']])
+    assert RecMatrix.empty(2) == [None, [], []]
+
+
+def test_rec_table_round_trip():
+    conn = create_rec_db(4)
+    cursor = conn.cursor()
+    matrix = RecMatrix.from_rows([[5, 1], [], [2], [7, 3, 4]])
+    insert_matrix_into_rec_table(cursor, matrix)
+    conn.commit()
+    # 从数据库读出时每行按post_id排序
+    assert fetch_rec_table_as_matrix(cursor) == [
+        None, [1, 5], [], [2], [3, 4, 7]
+    ]
+
+    # 旧的列表格式同样可以写入
+    cursor.execute("DELETE FROM rec")
+    insert_matrix_into_rec_table(cursor, [None, [1], [2], [], []])
+    conn.commit()
+    assert fetch_rec_table_as_matrix(cursor) == [None, [1], [2], [], []]
+
+
+def test_fetch_ignores_unknown_users():
+    conn = create_rec_db(2)
+    conn.executemany("INSERT INTO rec (user_id, post_id) VALUES (?, ?)",
+                     [(2, 4), (3, 1), (9, 2)])
+    matrix = fetch_rec_table_as_matrix(conn.cursor())
+    assert matrix == [None, [], [4]]
+
+    conn.execute("DELETE FROM rec")
+    assert fetch_rec_table_as_matrix(conn.cursor()) == RecMatrix.empty(2)
@@ -0,0 +1,93 @@
+import asyncio
+import os
+import os.path as osp
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from cube.clock.clock import Clock
+from cube.social_platform.channel import Channel
+from cube.social_platform.platform import Platform
+from cube.social_platform.typing import CommunityActionType
+from cube.social_platform.unity_api.headless_unity import (
+    HeadlessUnityServer, KinematicSimulator)
+from cube.social_platform.unity_api.unity_queue_manager import \
+    UnityQueueManager
+from cube.social_platform.unity_api.unity_server import (start_server,
+                                                         stop_server)
+
+parent_folder = osp.dirname(osp.abspath(__file__))
+test_db_filepath = osp.join(parent_folder, "test_headless.db")
+
+
+def test_simulator_arrival_and_stop():
+    simulator = KinematicSimulator(['0'], speed=10.0)
+    simulator.receive_message('0', '30,0,0')
+    messages = []
+    for _ in range(3):
+        messages.extend(simulator.step(1.0))
+    assert messages == [('0', 'ARRIVED 30,0,0')]
+    assert simulator.positions['0'] == [30.0, 0.0, 0.0]
+
+    simulator.receive_message('0', '0,0,0')
+    simulator.step(1.0)
+    simulator.receive_message('0', 'STOP')
+    assert simulator.step(1.0) == []
+    assert simulator.positions['0'] == [20.0, 0.0, 0.0]
+
+
+def test_simulator_encounters_are_reported_once():
+    simulator = KinematicSimulator(['0', '1'],
+                                   speed=10.0,
+                                   spawn_positions={
+                                       '0': (0, 0, 0),
+                                       '1': (20, 0, 0)
+                                   })
+    simulator.receive_message('0', '20,0,0')
+    messages = simulator.step(0.5)
+    assert ('0', 'NEW_AGENT:1') not in messages
+    messages = simulator.step(1.0)
+    assert ('0', 'NEW_AGENT:1') in messages
+    assert ('1', 'NEW_AGENT:0') in messages
+    # 仍然相邻时不会重复报告
+    assert [m for m in simulator.step(0.5) if 'NEW_AGENT' in m[1]] == []
+
+
+@pytest.mark.asyncio
+async def test_platform_go_to_against_headless_unity():
+    if os.path.exists(test_db_filepath):
+        os.remove(test_db_filepath)
+    simulator = KinematicSimulator(['0'],
+                                   speed=50.0,
+                                   spawn_positions={'0': (0, 0, 0)})
+    headless = HeadlessUnityServer(simulator, tick_rate=50.0)
+    await headless.start()
+    unity_queue_mgr = UnityQueueManager(['0'])
+    server_tasks = await start_server(unity_queue_mgr)
+    channel = Channel()
+    platform = Platform(test_db_filepath, channel, unity_queue_mgr,
+                        Clock(k=60), datetime(2024, 7, 1, 8, 0))
+    await platform.create_async_db()
+    task = asyncio.create_task(platform.running())
+    try:
+        message_id = await channel.write_to_receive_queue(
+            ('0', 'west garden', CommunityActionType.GO_TO.value))
+        response = await asyncio.wait_for(
+            channel.read_from_send_queue(message_id), 10)
+        assert response[2] == {"success": True, "arrived": "west garden"}
+        await channel.write_to_receive_queue(
+            (None, None, CommunityActionType.EXIT))
+        await task
+    finally:
+        await stop_server(*server_tasks)
+        await headless.stop()
+
+    conn = sqlite3.connect(test_db_filepath)
+    actions = [
+        row[0] for row in conn.execute(
+            "SELECT action FROM trace ORDER BY created_at").fetchall()
+    ]
+    conn.close()
+    os.remove(test_db_filepath)
+    assert actions == ["plan_to", "arrived"]
@@ -0,0 +1,59 @@
+import random
+
+import pytest
+
+from cube.social_platform.unity_api.spatial_hash import SpatialHash
+
+
+def brute_force_pairs(positions, radius):
+    pairs = set()
+    items = list(positions)
+    for i, a in enumerate(items):
+        for b in items[i + 1:]:
+            if sum((x - y)**2 for x, y in zip(positions[a],
+                                              positions[b])) <= radius**2:
+                pairs.add(frozenset((a, b)))
+    return pairs
+
+
+def test_neighbor_pairs_match_brute_force():
+    rng = random.Random(0)
+    positions = {
+        i: (rng.uniform(-50, 50), rng.uniform(0, 2), rng.uniform(-50, 50))
+        for i in range(400)
+    }
+    grid = SpatialHash(5.0)
+    grid.update_many(positions.items())
+    pairs = grid.neighbor_pairs(5.0)
+    assert len(pairs) == len(set(map(frozenset, pairs)))
+    assert set(map(frozenset, pairs)) == brute_force_pairs(positions, 5.0)
+
+
+def test_update_moves_items_between_cells():
+    grid = SpatialHash(5.0)
+    grid.update('a', (0, 0, 0))
+    grid.update('b', (30, 0, 0))
+    assert grid.neighbor_pairs(5.0) == []
+
+    grid.update('b', (-3, 0, 1))
+    assert set(map(frozenset, grid.neighbor_pairs(5.0))) == {
+        frozenset(('a', 'b'))
+    }
+    assert len(grid.cells) == 2
+
+    grid.remove('a')
+    assert len(grid) == 1
+    assert grid.neighbor_pairs(5.0) == []
+
+
+def test_query():
+    grid = SpatialHash(2.0)
+    grid.update_many([('a', (0, 0, 0)), ('b', (4, 0, 0)), ('c', (9, 0, 0))])
+    assert sorted(grid.query((1, 0, 0), 3.0)) == ['a', 'b']
+    assert grid.query((20, 0, 20), 3.0) == []
+
+
+def test_radius_larger_than_cell_is_rejected():
+    grid = SpatialHash(1.0)
+    with pytest.raises(ValueError):
+        grid.neighbor_pairs(2.0)
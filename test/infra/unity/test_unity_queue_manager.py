@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+from cube.social_platform.unity_api.unity_queue_manager import (
+    UnityEventType, UnityQueueManager)
+
+
+@pytest.mark.asyncio
+async def test_wait_for_event_wakes_on_message():
+    manager = UnityQueueManager(['0'])
+
+    async def send_later():
+        await asyncio.sleep(0.05)
+        await manager.put_message('0', {
+            'agent_name': '0',
+            'message': 'NEW_AGENT:3'
+        })
+        await manager.put_message('0', {
+            'agent_name': '0',
+            'message': 'ARRIVED 1.0,0.0,2.0'
+        })
+
+    asyncio.create_task(send_later())
+    event = await manager.wait_for_event('0')
+    assert event.event_type == UnityEventType.NEW_AGENT
+    assert event.payload == '3'
+
+    event = await manager.wait_for_event('0', {UnityEventType.ARRIVED})
+    assert event.event_type == UnityEventType.ARRIVED
+    assert event.payload == '1.0,0.0,2.0'
+
+
+@pytest.mark.asyncio
+async def test_wait_for_event_deadline():
+    manager = UnityQueueManager(['0'])
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    event = await manager.wait_for_event('0', deadline=start + 0.05)
+    assert event is None
+    assert loop.time() - start >= 0.05
+
+
+@pytest.mark.asyncio
+async def test_wait_for_event_skips_other_types():
+    manager = UnityQueueManager(['0'])
+    await manager.put_message('0', {'agent_name': '0', 'message': 'ARRIVED'})
+    await manager.put_message('0', {'agent_name': '0', 'message': 'garbage'})
+    loop = asyncio.get_running_loop()
+    event = await manager.wait_for_event('0', {UnityEventType.NEW_AGENT},
+                                         loop.time() + 0.01)
+    assert event is None
+    assert manager.queue_dict['0'].empty()
+
+
+@pytest.mark.asyncio
+async def test_listener_receives_matching_events():
+    manager = UnityQueueManager(['0'])
+    received = []
+
+    async def on_event(event):
+        received.append(event.payload)
+
+    manager.add_listener('0', on_event, {UnityEventType.NEW_AGENT})
+    await manager.put_message('0', {'agent_name': '0', 'message': 'NEW_AGENT:5'})
+    await manager.put_message('0', {'agent_name': '0', 'message': 'ARRIVED'})
+    assert received == ['5']
+    assert manager.queue_dict['0'].qsize() == 1
+
+    manager.remove_listener('0')
+    await manager.put_message('0', {'agent_name': '0', 'message': 'NEW_AGENT:6'})
+    assert received == ['5']
+    assert manager.queue_dict['0'].qsize() == 2
+
+
+@pytest.mark.asyncio
+async def test_discard_keeps_other_messages():
+    manager = UnityQueueManager(['0'])
+    for text in ['ARRIVED', 'NEW_AGENT:1', 'garbage', 'ARRIVED 1,0,2']:
+        await manager.put_message('0', {'agent_name': '0', 'message': text})
+    assert manager.discard('0', {UnityEventType.ARRIVED}) == 2
+    queue = manager.queue_dict['0']
+    assert [queue.get_nowait()['message'] for _ in range(queue.qsize())
+            ] == ['NEW_AGENT:1', 'garbage']